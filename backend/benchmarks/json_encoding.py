@@ -0,0 +1,100 @@
+"""
+CPU cost of encoding product listings, per 1000 products.
+
+Compares the old read path (a Pydantic model per document, FastAPI's
+response_model validation, jsonable_encoder, json.dumps) with
+fast_json.dumps on the documents as MongoDB returns them. No database
+or server is needed:
+
+    python benchmarks/json_encoding.py --products 1000 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+# server.py reads its settings at import time; nothing here touches the database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+os.environ.setdefault("ORDER_QUEUE_PATH", os.path.join(tempfile.mkdtemp(), "order_queue.db"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+import fast_json  # noqa: E402
+from server import Product  # noqa: E402
+
+DESCRIPTION = (
+    "Натуральный мёд с пасеки в предгорьях Заилийского Алатау. "
+    "Собран в июле, не нагревался и не фильтровался под давлением. "
+) * 4
+
+
+def make_products(count: int) -> List[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Мёд Цветочный №{i}",
+            "description": DESCRIPTION,
+            "category_id": "cat-honey",
+            "image": "/api/images/" + "0" * 64,
+            "base_price": 2200.0,
+            "weight_prices": [
+                {"weight": "550гр", "price": 2200.0},
+                {"weight": "1кг", "price": 3800.0},
+                {"weight": "3кг", "price": 10500.0},
+            ],
+            "created_at": "2026-07-01T10:00:00+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def pydantic_path(products: List[dict]) -> bytes:
+    """What get_products used to do: build models, then FastAPI validates and encodes them."""
+    models = [Product(**p) for p in products]
+    validated = TypeAdapter(List[Product]).validate_python(models)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode()
+
+
+def fast_path(products: List[dict]) -> bytes:
+    return fast_json.dumps(products)
+
+
+def measure(encode, products: List[dict], repeat: int) -> float:
+    """Best CPU seconds of `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        encode(products)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    assert json.loads(pydantic_path(products)) == json.loads(fast_path(products))
+
+    scale = 1000 / args.products * 1000  # ms per 1000 products
+    slow = measure(pydantic_path, products, args.repeat) * scale
+    fast = measure(fast_path, products, args.repeat) * scale
+    encoder = "orjson" if fast_json.orjson is not None else "json"
+    print(f"pydantic + jsonable_encoder: {slow:8.2f} ms CPU / 1000 products")
+    print(f"fast_json ({encoder}):{' ' * (14 - len(encoder))}{fast:8.2f} ms CPU / 1000 products")
+    print(f"saved: {slow - fast:.2f} ms ({slow / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Storefront load test for backend/server.py on each storage backend
+(MongoDB, SQLite, MariaDB).
+
+Boots the server with uvicorn against a throwaway database (on a local
+mongod / MariaDB, or a SQLite file in a scratch directory), replays a weighted storefront mix at a fixed
+concurrency and reports p50/p95/p99 latency per operation, throughput and
+database operations per request. Results are saved under
+benchmarks/results/ for comparison between commits.
+
+    python benchmarks/load_test.py mongo --concurrency 16 --requests 2000
+    python benchmarks/load_test.py sqlite --workers 4
+    python benchmarks/load_test.py mariadb --db-user root --db-password secret
+    python benchmarks/load_test.py mongo --url http://localhost:8001
+    python benchmarks/load_test.py mongo --compare benchmarks/results/load-mongo-....json
+
+Database operation counts come from server-wide counters (serverStatus
+opcounters, MariaDB's Questions), so use a database server nothing else
+is talking to. The order workers' polling is included on purpose. SQLite
+has no such counters; its runs report latency and throughput only.
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+import results
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+AUTH = ("armanuha", "secretboost1")
+PROMOCODE = "BENCH10"
+BENCH_PHONE = "+7 (700) 000 00 00"
+
+# Share of each operation in the replayed traffic
+MIX = {
+    "bootstrap": 30,
+    "products": 30,
+    "promocode": 10,
+    "checkout": 15,
+    "admin_orders": 15,
+}
+
+
+# Operations
+def op_bootstrap(session, ctx, rng):
+    return session.get(f"{ctx['api']}/bootstrap", params={"view": "card"})
+
+
+def op_products(session, ctx, rng):
+    params = {"view": "card"}
+    if rng.random() < 0.5:
+        params["category_id"] = rng.choice(ctx["categories"])
+    return session.get(f"{ctx['api']}/products", params=params)
+
+
+def cart(ctx, rng):
+    items = []
+    for product in rng.sample(ctx["products"], k=min(3, len(ctx["products"]))):
+        weights = product.get("weight_prices") or []
+        items.append({
+            "product_id": product["id"],
+            "name": product["name"],
+            "weight": rng.choice(weights)["weight"] if weights else None,
+            "price": 0,
+            "quantity": rng.randint(1, 3),
+        })
+    return items
+
+
+def op_promocode(session, ctx, rng):
+    # Like the cart, each virtual user renews its own reservation
+    response = session.post(f"{ctx['api']}/promocodes/validate", json={
+        "code": PROMOCODE, "items": cart(ctx, rng), "reservation_id": getattr(session, "promo_reservation", None),
+    })
+    if response.ok:
+        session.promo_reservation = response.json()["reservation_id"]
+    return response
+
+
+def op_checkout(session, ctx, rng):
+    order = {
+        "customer_name": "BENCH_Покупатель",
+        "customer_phone": BENCH_PHONE,
+        "items": cart(ctx, rng),
+        "promocode": None,
+    }
+    return session.post(f"{ctx['api']}/orders", json=order, headers={"Idempotency-Key": str(uuid.uuid4())})
+
+
+def op_admin_orders(session, ctx, rng):
+    return session.get(f"{ctx['api']}/orders", params={"limit": 50}, auth=AUTH)
+
+
+OPERATIONS = {
+    "bootstrap": op_bootstrap,
+    "products": op_products,
+    "promocode": op_promocode,
+    "checkout": op_checkout,
+    "admin_orders": op_admin_orders,
+}
+
+
+# Database counters
+class MongoCounters:
+    def __init__(self, url: str, db_name: str):
+        from pymongo import MongoClient
+        self.client = MongoClient(url)
+        self.db_name = db_name
+
+    def read(self) -> int:
+        counters = self.client.admin.command("serverStatus")["opcounters"]
+        # The serverStatus call itself is counted as a command
+        return sum(counters.values()) - 1
+
+    def drop(self):
+        self.client.drop_database(self.db_name)
+
+
+class MariaDBCounters:
+    def __init__(self, host: str, port: int, user: str, password: str, db_name: str):
+        import pymysql
+        self.conn = pymysql.connect(host=host, port=port, user=user, password=password, autocommit=True)
+        self.db_name = db_name
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db_name}` CHARACTER SET utf8mb4")
+
+    def read(self) -> int:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+            # Questions includes this SHOW STATUS
+            return int(cursor.fetchone()[1]) - 1
+
+    def drop(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.db_name}`")
+
+
+# Server process
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def boot_server(args, scratch: Path) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "STORAGE": args.backend,
+        "IMAGES_DIR": str(scratch / "images"),
+        "ORDER_QUEUE_PATH": str(scratch / "order_queue.db"),
+    })
+    if args.backend == "mongo":
+        env.update({"MONGO_URL": args.mongo_url, "DB_NAME": args.db_name})
+    elif args.backend == "sqlite":
+        env["SQLITE_PATH"] = str(scratch / "shop.db")
+    else:
+        env.update({
+            "DB_HOST": args.db_host,
+            "DB_PORT": str(args.db_port),
+            "DB_USER": args.db_user,
+            "DB_PASSWORD": args.db_password,
+            "DB_NAME": args.db_name,
+        })
+    command = [
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+def wait_ready(api: str, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{api}/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise SystemExit("Server did not become ready")
+
+
+def prepare(api: str) -> dict:
+    """Catalog and promocode the operations draw from."""
+    data = requests.get(f"{api}/bootstrap").json()
+    if not data["products"]:
+        raise SystemExit("The catalog is empty; seed it first")
+    response = requests.post(f"{api}/promocodes", auth=AUTH, json={
+        "code": PROMOCODE, "discount_type": "percent", "discount_value": 10, "max_uses": 1000,
+    })
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return {
+        "api": api,
+        "products": data["products"],
+        "categories": [c["id"] for c in data["categories"]],
+    }
+
+
+# Load generation
+def run(ctx: dict, count: int, concurrency: int, seed: int) -> dict:
+    """Replay `count` operations; returns latencies and error counts per operation."""
+    rng = random.Random(seed)
+    names = rng.choices(list(MIX), weights=list(MIX.values()), k=count)
+    seeds = [rng.getrandbits(32) for _ in range(count)]
+    local = threading.local()
+    latencies = {name: [] for name in MIX}
+    errors = {name: 0 for name in MIX}
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        name = names[i]
+        start = time.perf_counter()
+        try:
+            ok = OPERATIONS[name](session, ctx, random.Random(seeds[i])).status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[name].append(elapsed)
+            if not ok:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    return {"latencies": latencies, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storefront load test")
+    parser.add_argument("backend", choices=["mongo", "sqlite", "mariadb"])
+    parser.add_argument("--url", help="Test an already running server instead of booting one")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--db-name", default="honey_bench")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-host", default="localhost")
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-password", default="")
+    parser.add_argument("--no-db-counters", action="store_true", help="Skip operation counting")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the benchmark database")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args()
+    baseline = results.load(args.compare) if args.compare else None
+
+    counters = None
+    if not args.no_db_counters:
+        if args.backend == "mongo":
+            counters = MongoCounters(args.mongo_url, args.db_name)
+        elif args.backend == "mariadb":
+            counters = MariaDBCounters(args.db_host, args.db_port, args.db_user, args.db_password, args.db_name)
+
+    process = None
+    scratch = tempfile.TemporaryDirectory()
+    if args.url:
+        api = args.url.rstrip("/") + "/api"
+    else:
+        args.port = args.port or free_port()
+        process = boot_server(args, Path(scratch.name))
+        api = f"http://127.0.0.1:{args.port}/api"
+
+    try:
+        wait_ready(api, process)
+        ctx = prepare(api)
+        run(ctx, args.warmup, args.concurrency, args.seed + 1)
+        before = counters.read() if counters else None
+        measured = run(ctx, args.requests, args.concurrency, args.seed)
+        after = counters.read() if counters else None
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if counters is not None and process is not None and not args.keep_data:
+            counters.drop()
+        scratch.cleanup()
+
+    all_latencies = [s for samples in measured["latencies"].values() for s in samples]
+    result = {
+        "backend": args.backend,
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency, "workers": args.workers,
+            "seed": args.seed, "mix": MIX, "url": args.url,
+        },
+        "throughput_rps": round(args.requests / measured["elapsed"], 2),
+        "errors": sum(measured["errors"].values()),
+        "db_ops_per_request": round((after - before) / args.requests, 3) if counters else None,
+        "operations": {
+            "all": {**results.latency_summary(all_latencies), "errors": sum(measured["errors"].values())},
+            **{
+                name: {**results.latency_summary(samples), "errors": measured["errors"][name]}
+                for name, samples in measured["latencies"].items()
+            },
+        },
+    }
+
+    print(f"{args.backend}: {result['throughput_rps']} req/s, {result['errors']} errors, "
+          f"{result['db_ops_per_request']} DB ops/request")
+    print(f"  {'operation':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in result["operations"].items():
+        if summary["count"]:
+            print(f"  {name:<14} {summary['count']:>6} {summary['p50_ms']:>9} {summary['p95_ms']:>9} "
+                  f"{summary['p99_ms']:>9} {summary['errors']:>7}")
+    path = results.save(f"load-{args.backend}", result)
+    print(f"Saved {path}")
+
+    if baseline:
+        results.compare(baseline, result, {
+            "req/s": "throughput_rps", "DB ops/request": "db_ops_per_request", "p95 ms": "p95_ms",
+        })
+
+
+if __name__ == "__main__":
+    main()
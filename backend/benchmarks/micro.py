@@ -0,0 +1,119 @@
+"""
+Micro-benchmarks of the per-request helpers, on a synthetic catalog.
+
+Times cart pricing, catalog search, snapshot compression and JSON
+encoding without a server or database, and saves the results under
+benchmarks/results/ like the load test:
+
+    python benchmarks/micro.py --products 1000
+    python benchmarks/micro.py --compare benchmarks/results/micro-....json
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import compression  # noqa: E402
+import fast_json  # noqa: E402
+import pricing  # noqa: E402
+import results  # noqa: E402
+import search  # noqa: E402
+
+WORDS = ["мёд", "цветочный", "гречишный", "прополис", "перга", "воск", "свеча", "настойка", "крем", "пыльца"]
+WEIGHTS = [("250гр", 1200.0), ("550гр", 2200.0), ("1кг", 3500.0), ("3кг", 9800.0)]
+
+
+def make_products(count: int, rng: random.Random) -> list:
+    products = []
+    for i in range(count):
+        name = " ".join(rng.sample(WORDS, 2)).capitalize() + f" №{i}"
+        products.append({
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "description": " ".join(rng.choices(WORDS, k=40)),
+            "category_id": f"cat-{i % 6}",
+            "image": "",
+            "base_price": 1200.0,
+            "weight_prices": [{"weight": w, "price": p} for w, p in rng.sample(WEIGHTS, 3)],
+            "created_at": "2026-07-01T10:00:00+00:00",
+        })
+    return products
+
+
+def timed(fn, repeat: int) -> dict:
+    """Best and mean wall time of `repeat` calls, in microseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "best_us": round(min(samples) * 1e6, 2),
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 2),
+        "repeat": repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of request helpers")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args()
+    baseline = results.load(args.compare) if args.compare else None
+
+    rng = random.Random(args.seed)
+    products = make_products(args.products, rng)
+    table = pricing.PriceTable.build(products)
+    index = search.SearchIndex(products)
+    cart = [
+        {"product_id": p["id"], "name": p["name"], "weight": p["weight_prices"][0]["weight"], "quantity": 2}
+        for p in rng.sample(products, 5)
+    ]
+    promo = {"discount_type": "percent", "discount_value": 10, "is_active": True}
+    snapshot = fast_json.dumps(products)
+
+    cases = {
+        "pricing.quote (5 items)": lambda: pricing.quote(table, cart, promo),
+        "pricing.PriceTable.build": lambda: pricing.PriceTable.build(products),
+        "search (two words)": lambda: index.search("цветочный мед"),
+        "search (prefix)": lambda: index.search("проп"),
+        "search (price range)": lambda: index.search("", min_price=2000, max_price=4000),
+        "fast_json.dumps (catalog)": lambda: fast_json.dumps(products),
+        "gzip dynamic (catalog)": lambda: compression.compress(snapshot, "gzip", compression.DYNAMIC_LEVEL["gzip"]),
+    }
+    if compression.brotli is not None:
+        cases["brotli dynamic (catalog)"] = lambda: compression.compress(
+            snapshot, "br", compression.DYNAMIC_LEVEL["br"])
+
+    operations = {}
+    for name, fn in cases.items():
+        # Compressing the whole catalog is slow; fewer rounds keep the run short
+        repeat = args.repeat if "catalog" not in name else max(5, args.repeat // 20)
+        operations[name] = timed(fn, repeat)
+        print(f"  {name:<30} best {operations[name]['best_us']:>12} µs   mean {operations[name]['mean_us']:>12} µs")
+
+    sizes = {"identity": len(snapshot)}
+    for encoding in compression.available_encodings():
+        sizes[encoding] = len(compression.compress(snapshot, encoding, compression.STATIC_LEVEL[encoding]))
+    print("  catalog snapshot bytes: " + ", ".join(f"{k} {v}" for k, v in sizes.items()))
+
+    result = {
+        "config": {"products": args.products, "repeat": args.repeat, "seed": args.seed},
+        "snapshot_bytes": sizes,
+        "operations": operations,
+    }
+    path = results.save("micro", result)
+    print(f"Saved {path}")
+
+    if baseline:
+        results.compare(baseline, result, {"best µs": "best_us"})
+
+
+if __name__ == "__main__":
+    main()
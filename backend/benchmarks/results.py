@@ -0,0 +1,90 @@
+"""
+Saving and comparing benchmark results.
+
+Every run is written to benchmarks/results/<name>-<commit>-<time>.json so
+runs from different commits can be diffed with --compare.
+"""
+import json
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import List, Optional
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+REPO_DIR = Path(__file__).resolve().parents[2]
+
+
+def commit_id() -> str:
+    """Short HEAD hash, with "+dirty" when the working tree has changes."""
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return sha + ("+dirty" if dirty else "")
+
+
+def latency_summary(samples: List[float]) -> dict:
+    """Percentiles in milliseconds of latencies given in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {
+        "count": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def save(name: str, result: dict, directory: Optional[Path] = None) -> Path:
+    directory = directory or RESULTS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    commit = commit_id()
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = directory / f"{name}-{commit.replace('+', '_')}-{stamp}.json"
+    payload = {"name": name, "commit": commit, "timestamp": stamp, **result}
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return path
+
+
+def load(path) -> dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old: dict, new: dict, metrics: dict):
+    """Print `metrics` ({label: (section, key)}) of two runs side by side."""
+    print(f"\nCompared with {old.get('commit')} ({old.get('timestamp')}):")
+    sections = sorted(set(old.get("operations", {})) | set(new.get("operations", {})))
+    for section in [None] + sections:
+        for label, key in metrics.items():
+            if section is None:
+                before, after = old.get(key), new.get(key)
+                title = label
+            else:
+                before = old.get("operations", {}).get(section, {}).get(key)
+                after = new.get("operations", {}).get(section, {}).get(key)
+                title = f"{section} {label}"
+            if before is None and after is None:
+                continue
+            print(f"  {title:<32} {before!s:>12} -> {after!s:>12}  {change(before, after)}")
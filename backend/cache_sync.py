@@ -0,0 +1,125 @@
+"""
+Cache invalidation across uvicorn workers and hosts.
+
+Every process caches the catalog snapshot, price table, search index and
+promocode definitions, and drops them itself after an admin write it
+handled. CacheSync carries that invalidation to every other process
+sharing the database.
+
+Writers publish() the names of what they changed, which bumps a per-name
+version in the database (cache_versions). Other processes learn of it in
+one of two ways:
+
+- on MongoDB replica sets, a change stream on the cached collections pushes
+  every write as it happens, including edits made outside the API;
+- elsewhere (standalone mongod, SQLite, MariaDB) each process polls the
+  versions every `interval` seconds, so a change reaches all of them
+  within about that long.
+
+A process that loses its change stream drops all of its caches (events may
+have been missed) and polls from then on.
+
+The versions also make the catalog's HTTP validators: version() is the same
+in every process that has caught up, so an ETag or Last-Modified issued by
+one worker is recognized by all of them.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSync:
+    """`on_change(names)` is called with the set of names other processes changed."""
+
+    def __init__(self, store, names: Iterable[str], on_change: Callable[[set], None], interval: float = 1.0):
+        self.store = store
+        self.names = tuple(names)
+        self.on_change = on_change
+        self.interval = interval
+        self.mode = "starting"
+        self.versions = {}  # name -> (version, updated_at) this process has caught up with
+        self.last_sync: Optional[float] = None  # wall time of the last successful check or event
+        self.counters = {"published": 0, "received": 0, "errors": 0}
+
+    async def publish(self, *names: str):
+        """Announce a write the caller has already applied to its own caches."""
+        self.counters["published"] += 1
+        try:
+            versions = await self.store.bump_versions(names)
+        except Exception:
+            # The write itself succeeded; other processes catch up on their next change
+            self.counters["errors"] += 1
+            logger.exception("Could not publish cache invalidation for %s", ", ".join(names))
+            return
+        for name, (version, updated_at) in versions.items():
+            # Skip our own bump when polling, unless another process wrote in between
+            if self.version(name)[0] == version - 1:
+                self.versions[name] = (version, updated_at)
+
+    def version(self, name: str) -> Tuple[int, Optional[datetime]]:
+        """(version, updated_at) of `name`; (0, None) until it first changes."""
+        return self.versions.get(name, (0, None))
+
+    def _receive(self, names: set):
+        self.last_sync = time.time()
+        if names:
+            self.counters["received"] += 1
+            self.on_change(names)
+
+    async def _poll(self):
+        versions = await self.store.cache_versions()
+        changed = {name for name in self.names if versions.get(name) != self.versions.get(name)}
+        self.versions.update(versions)
+        self._receive(changed)
+
+    async def run(self):
+        """Background task: watch or poll until cancelled."""
+        while True:
+            try:
+                self.versions = await self.store.cache_versions()
+                watch = await self.store.can_watch()
+                break
+            except Exception:
+                self.counters["errors"] += 1
+                logger.exception("Cache sync could not start, retrying")
+                await asyncio.sleep(self.interval)
+        self.last_sync = time.time()
+
+        if watch:
+            self.mode = "change_stream"
+            try:
+                async for names in self.store.watch_changes(self.names):
+                    # The stream counted the write already, so the versions move with the caches
+                    self.versions = await self.store.cache_versions()
+                    self._receive(names & set(self.names))
+                logger.warning("Change stream closed; polling cache versions instead")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.counters["errors"] += 1
+                logger.exception("Change stream failed; polling cache versions instead")
+            self._receive(set(self.names))
+
+        self.mode = "poll"
+        while True:
+            try:
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.counters["errors"] += 1
+                logger.exception("Cache version poll failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "versions": {name: version for name, (version, _) in self.versions.items()},
+            "seconds_since_sync": round(time.time() - self.last_sync, 3) if self.last_sync else None,
+            **self.counters,
+        }
@@ -0,0 +1,156 @@
+"""
+HTTP response compression (Brotli, falling back to gzip).
+
+server.py compresses the catalog snapshots once per version at the highest
+levels; CompressionMiddleware handles every other response on the fly at
+cheaper levels and leaves alone bodies that are already encoded, too small
+or not text (images are stored compressed).
+"""
+import gzip
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli not installed: gzip only
+    brotli = None
+
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Snapshots are compressed once per version, so they get the slowest levels
+STATIC_LEVEL = {"br": 11, "gzip": 9}
+DYNAMIC_LEVEL = {"br": 4, "gzip": 6}
+
+
+def available_encodings():
+    """Encodings this process can produce, best first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    """Incremental compressor; every chunk is flushed so streamed rows reach the client promptly."""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def is_compressible(headers: list) -> bool:
+    content_type = b""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value
+    return content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: list) -> list:
+    for i, (name, value) in enumerate(headers):
+        if name == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[i] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses the route did not encode itself."""
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value
+        encoding = negotiate(accept.decode("latin-1"))
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if not is_compressible(headers):
+                    await send(message)
+                    return
+                start = {**message, "headers": add_vary(headers)}
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = start["headers"]
+                if encoding is None or (not more_body and len(body) < self.minimum_size):
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                # Streaming bodies have no known length once compressed
+                headers = [(k, v) for k, v in headers if k != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    body = compress(body, encoding, DYNAMIC_LEVEL[encoding])
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    start = None
+                    return
+                compressor = StreamCompressor(encoding, DYNAMIC_LEVEL[encoding])
+                await send({**start, "headers": headers})
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,30 @@
+"""
+JSON encoding for read routes.
+
+Documents read back from MongoDB were validated on the way in, so read
+routes encode them as they are instead of rebuilding Pydantic models and
+running FastAPI's jsonable_encoder over the result. orjson is used when it
+is installed, the standard library otherwise.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # orjson not installed: stdlib json, same output
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
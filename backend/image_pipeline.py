@@ -0,0 +1,97 @@
+"""
+Product image derivatives (responsive widths, WebP/AVIF/JPEG).
+
+Runs inside the ProcessPoolExecutor owned by server.py, so this module must
+stay importable without touching the database or the FastAPI app.
+"""
+import os
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed: originals are served as-is
+    Image = None
+
+WIDTHS = (160, 320, 640, 1280)
+FORMATS = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+QUALITY = {"avif": 50, "webp": 75, "jpeg": 80}
+
+
+def available_formats():
+    """Output formats the installed Pillow can encode, best first."""
+    if Image is None:
+        return ()
+    Image.init()
+    return tuple(fmt for fmt in FORMATS if fmt.upper() in Image.SAVE)
+
+
+def pick_width(requested: int) -> int:
+    for width in WIDTHS:
+        if width >= requested:
+            return width
+    return WIDTHS[-1]
+
+
+def derivative_path(source: Path, width: int, fmt: str) -> Path:
+    return source.with_name(f"{source.name}.w{width}.{fmt}")
+
+
+def failed_path(source: Path, width: int, fmt: str) -> Path:
+    """Marker left instead of a variant that could not be rendered."""
+    return source.with_name(f"{source.name}.w{width}.{fmt}.failed")
+
+
+def clear_failed(source: Path):
+    """Forget failed variants, so the next request renders them again."""
+    for marker in source.parent.glob(f"{source.name}.w*.failed"):
+        marker.unlink(missing_ok=True)
+
+
+def render_derivatives(source: str) -> int:
+    """Write every width/format variant of `source` that is not on disk yet.
+
+    Variants that fail get a failed_path() marker and are skipped from then
+    on; the first error is raised after the remaining variants are written.
+    """
+    src = Path(source)
+    formats = available_formats()
+    written = 0
+    error = None
+    try:
+        with Image.open(src) as original:
+            img = ImageOps.exif_transpose(original)
+            for width in WIDTHS:
+                # Never upscale; small sources are only re-encoded
+                if img.width > width:
+                    height = round(img.height * width / img.width)
+                    resized = img.resize((width, height), Image.LANCZOS)
+                else:
+                    resized = img
+                for fmt in formats:
+                    target = derivative_path(src, width, fmt)
+                    if target.exists() or failed_path(src, width, fmt).exists():
+                        continue
+                    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+                    try:
+                        if fmt == "jpeg" or resized.mode not in ("RGB", "RGBA"):
+                            frame = resized.convert("RGB" if fmt == "jpeg" else "RGBA")
+                        else:
+                            frame = resized
+                        frame.save(tmp, fmt.upper(), quality=QUALITY[fmt])
+                        os.replace(tmp, target)
+                    except Exception as e:
+                        tmp.unlink(missing_ok=True)
+                        failed_path(src, width, fmt).touch()
+                        error = error or e
+                        continue
+                    written += 1
+    except Exception:
+        # The source itself could not be decoded or resized
+        for width in WIDTHS:
+            for fmt in formats:
+                if not derivative_path(src, width, fmt).exists():
+                    failed_path(src, width, fmt).touch()
+        raise
+    if error is not None:
+        raise error
+    return written
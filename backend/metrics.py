@@ -0,0 +1,203 @@
+"""
+Request and database metrics in the Prometheus text format.
+
+MetricsMiddleware records per-route latency, status codes, response sizes
+and in-flight requests. Storage backends report every database command to
+record_db_operation() (MongoDB through a pymongo command listener, the SQL
+backends around each statement), which also charges it to the HTTP request
+that issued it through a context variable, so each route shows how much of
+its time is spent in the database.
+
+Values are per process; with several uvicorn workers each one is scraped
+on its own.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, registry, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}
+        self._lock = registry.lock
+        registry.metrics.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels=(), value=0):
+        with self._lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = self.header()
+        for labels, counts in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+requests_total = Counter(
+    REGISTRY, "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+request_duration = Histogram(
+    REGISTRY, "http_request_duration_seconds", "Time from request to last response byte.", ("method", "route"))
+response_size = Histogram(
+    REGISTRY, "http_response_size_bytes", "Response body bytes as sent.", ("method", "route"), SIZE_BUCKETS)
+in_flight = Gauge(REGISTRY, "http_requests_in_flight", "Requests being handled right now.")
+request_db_operations = Histogram(
+    REGISTRY, "http_request_db_operations", "Database operations issued per request.",
+    ("method", "route"), COUNT_BUCKETS)
+request_db_seconds = Histogram(
+    REGISTRY, "http_request_db_seconds", "Time per request spent waiting on the database.", ("method", "route"))
+db_operations = Counter(
+    REGISTRY, "db_operations_total", "Database commands by command and collection.", ("command", "collection"))
+db_failures = Counter(
+    REGISTRY, "db_operation_failures_total", "Database commands that failed.", ("command", "collection"))
+db_duration = Histogram(
+    REGISTRY, "db_operation_duration_seconds", "Database command latency.", ("command",))
+
+
+class RequestStats:
+    __slots__ = ("db_operations", "db_seconds", "commands")
+
+    def __init__(self):
+        self.db_operations = 0
+        self.db_seconds = 0.0
+        self.commands = {}  # command -> [count, seconds], for the slow request log
+
+
+current_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def record_db_operation(command: str, collection: str, seconds: float, failed: bool = False):
+    labels = (command, collection)
+    db_operations.inc(labels)
+    if failed:
+        db_failures.inc(labels)
+    db_duration.observe((command,), seconds)
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_operations += 1
+        stats.db_seconds += seconds
+        totals = stats.commands.setdefault(f"{command} {collection}".strip(), [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+
+class MetricsMiddleware:
+    """ASGI middleware; `route_name(scope)` maps a request to its route template."""
+
+    def __init__(self, app, route_name):
+        self.app = app
+        self.route_name = route_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        size = 0
+
+        async def send_counted(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            current_request.reset(token)
+            labels = (scope["method"], self.route_name(scope))
+            requests_total.inc(labels + (str(status),))
+            request_duration.observe(labels, elapsed)
+            response_size.observe(labels, size)
+            request_db_operations.observe(labels, stats.db_operations)
+            request_db_seconds.observe(labels, stats.db_seconds)
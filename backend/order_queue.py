@@ -0,0 +1,201 @@
+"""
+Durable local write-ahead queue for incoming orders.
+
+server.py appends every accepted checkout here before acknowledging it and
+background workers drain the queue into MongoDB. SQLite with a WAL journal
+and synchronous=FULL makes each append crash-safe without a broker, and the
+file can be shared by several uvicorn workers on the same host.
+
+Each claim carries a token, and update/complete/release only touch rows
+still held under it, so a worker whose batch was reclaimed after
+`claim_timeout` cannot overwrite or finish it. An order that keeps failing
+is retried on its own and, after `max_attempts`, parked in state 'dead'
+until retry_dead() puts it back.
+
+All methods are blocking; call them through run_in_threadpool.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL UNIQUE,
+    idempotency_key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    claimed_at REAL,
+    claim_token TEXT,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_order_queue_state ON order_queue (state, seq);
+"""
+
+
+class OrderQueue:
+    def __init__(self, path, claim_timeout: float = 600.0, max_attempts: int = 10):
+        self.path = str(path)
+        # A claim older than this belongs to a worker that died mid-batch
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # Queue files written before claim tokens
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(order_queue)")}
+        if "claim_token" not in columns:
+            conn.execute("ALTER TABLE order_queue ADD COLUMN claim_token TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def enqueue(self, order: dict, idempotency_key: Optional[str] = None) -> Tuple[dict, bool]:
+        """Append an order; for a repeated key return the first order instead.
+
+        Returns (order, created).
+        """
+        conn = self._transaction()
+        try:
+            if idempotency_key:
+                row = conn.execute(
+                    "SELECT payload FROM order_queue WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return json.loads(row[0]), False
+            conn.execute(
+                "INSERT INTO order_queue (order_id, idempotency_key, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (order["id"], idempotency_key, json.dumps(order, ensure_ascii=False), time.time()),
+            )
+            conn.execute("COMMIT")
+            return order, True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, limit: int) -> Tuple[str, List[Tuple[int, dict]]]:
+        """Hand out up to `limit` pending orders, oldest first, with the claim's token.
+
+        An order that failed before is handed out alone, so it cannot hold
+        up the orders behind it for more than its own attempts.
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._transaction()
+        try:
+            # Workers that died holding an order count against its attempts too
+            stale = conn.execute(
+                """SELECT seq, order_id FROM order_queue
+                   WHERE state = 'processing' AND claimed_at < ? AND attempts >= ?""",
+                (now - self.claim_timeout, self.max_attempts),
+            ).fetchall()
+            self._bury(conn, stale)
+            rows = conn.execute(
+                """SELECT seq, payload, attempts FROM order_queue
+                   WHERE state = 'pending' OR (state = 'processing' AND claimed_at < ?)
+                   ORDER BY seq LIMIT ?""",
+                (now - self.claim_timeout, limit),
+            ).fetchall()
+            if rows and rows[0][2] > 0:
+                rows = rows[:1]
+            conn.executemany(
+                """UPDATE order_queue SET state = 'processing', claimed_at = ?, claim_token = ?,
+                   attempts = attempts + 1 WHERE seq = ?""",
+                [(now, token, seq) for seq, _, _ in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return token, [(seq, json.loads(payload)) for seq, payload, _ in rows]
+
+    def update(self, token: str, seq: int, order: dict):
+        """Persist progress made on a claimed order (e.g. promocode redemption)."""
+        self._conn().execute(
+            "UPDATE order_queue SET payload = ? WHERE seq = ? AND claim_token = ?",
+            (json.dumps(order, ensure_ascii=False), seq, token),
+        )
+
+    def complete(self, token: str, seqs: List[int]):
+        now = time.time()
+        conn = self._transaction()
+        conn.executemany(
+            "UPDATE order_queue SET state = 'done', done_at = ? WHERE seq = ? AND claim_token = ?",
+            [(now, seq, token) for seq in seqs],
+        )
+        conn.execute("COMMIT")
+
+    def release(self, token: str, seqs: List[int]):
+        """Give failed orders back; those out of attempts are parked as dead."""
+        conn = self._transaction()
+        try:
+            held = conn.execute(
+                f"""SELECT seq, order_id, attempts FROM order_queue
+                    WHERE claim_token = ? AND state = 'processing' AND seq IN ({', '.join('?' * len(seqs))})""",
+                (token, *seqs),
+            ).fetchall()
+            self._bury(conn, [(seq, order_id) for seq, order_id, attempts in held if attempts >= self.max_attempts])
+            conn.executemany(
+                "UPDATE order_queue SET state = 'pending', claim_token = NULL WHERE seq = ?",
+                [(seq,) for seq, _, attempts in held if attempts < self.max_attempts],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _bury(self, conn: sqlite3.Connection, rows: List[Tuple[int, str]]):
+        conn.executemany(
+            "UPDATE order_queue SET state = 'dead', claim_token = NULL WHERE seq = ?", [(seq,) for seq, _ in rows]
+        )
+        for seq, order_id in rows:
+            logger.error("Order %s (queue seq %d) failed %d times; parked as dead", order_id, seq, self.max_attempts)
+
+    def retry_dead(self) -> int:
+        """Queue dead orders again with fresh attempts, e.g. once the database is back."""
+        cursor = self._conn().execute(
+            "UPDATE order_queue SET state = 'pending', attempts = 0 WHERE state = 'dead'"
+        )
+        return cursor.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """Drop delivered orders; their idempotency keys expire with them."""
+        cursor = self._conn().execute(
+            "DELETE FROM order_queue WHERE state = 'done' AND done_at < ?", (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM order_queue GROUP BY state").fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(enqueued_at) FROM order_queue WHERE state IN ('pending', 'processing')"
+        ).fetchone()[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "processing": counts.get("processing", 0),
+            "done": counts.get("done", 0),
+            "dead": counts.get("dead", 0),
+            "depth": counts.get("pending", 0) + counts.get("processing", 0),
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
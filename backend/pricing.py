@@ -0,0 +1,94 @@
+"""
+Authoritative cart pricing.
+
+PriceTable is an immutable snapshot of catalog prices keyed by product and
+weight. server.py swaps in a new table after every product write, so quoting
+a cart is one dictionary lookup per line and never touches the database.
+"""
+from types import MappingProxyType
+from typing import Iterable, List, Optional
+
+
+class PricingError(ValueError):
+    """A cart line that does not match the catalog."""
+
+
+def money(value: float) -> float:
+    return round(value, 2)
+
+
+def freeze(product: dict) -> MappingProxyType:
+    return MappingProxyType({
+        "id": product["id"],
+        "name": product["name"],
+        "base_price": float(product["base_price"]),
+        "weights": MappingProxyType({
+            wp["weight"]: float(wp["price"]) for wp in product.get("weight_prices") or []
+        }),
+    })
+
+
+class PriceTable:
+    __slots__ = ("_products", "_by_name")
+
+    def __init__(self, products: Optional[dict] = None):
+        self._products = MappingProxyType(dict(products or {}))
+        # Carts saved before items carried product_id are matched by name
+        self._by_name = MappingProxyType({p["name"]: p["id"] for p in self._products.values()})
+
+    @classmethod
+    def build(cls, products: Iterable[dict]) -> "PriceTable":
+        return cls({p["id"]: freeze(p) for p in products})
+
+    def with_product(self, product: dict) -> "PriceTable":
+        return PriceTable({**self._products, product["id"]: freeze(product)})
+
+    def without_product(self, product_id: str) -> "PriceTable":
+        return PriceTable({k: v for k, v in self._products.items() if k != product_id})
+
+    def __len__(self):
+        return len(self._products)
+
+    def lookup(self, product_id: Optional[str], name: str, weight: Optional[str]):
+        """Return (product, unit price) for one cart line."""
+        product = self._products.get(product_id or self._by_name.get(name))
+        if product is None:
+            raise PricingError(f"Товар не найден: {name}")
+        if not weight:
+            return product, product["base_price"]
+        price = product["weights"].get(weight)
+        if price is None:
+            raise PricingError(f"Нет фасовки {weight} для товара {product['name']}")
+        return product, price
+
+
+def promo_discount(promo: Optional[dict], subtotal: float) -> float:
+    if not promo or not promo.get("is_active", True):
+        return 0
+    if promo["discount_type"] == "percent":
+        return money(subtotal * promo["discount_value"] / 100)
+    return money(min(promo["discount_value"], subtotal))
+
+
+def quote_lines(lines: List[dict], promo: Optional[dict] = None) -> dict:
+    """Totals of lines already priced by quote(), e.g. to drop a discount later."""
+    subtotal = money(sum(line["price"] * line["quantity"] for line in lines))
+    discount = promo_discount(promo, subtotal)
+    return {"subtotal": subtotal, "discount": discount, "total": money(subtotal - discount)}
+
+
+def quote(table: PriceTable, items: List[dict], promo: Optional[dict] = None) -> dict:
+    """Price a cart from the table; client-sent prices and totals are ignored."""
+    lines = []
+    for item in items:
+        if item["quantity"] < 1:
+            raise PricingError(f"Некорректное количество для товара {item['name']}")
+        product, price = table.lookup(item.get("product_id"), item["name"], item.get("weight"))
+        lines.append({
+            "product_id": product["id"],
+            "name": product["name"],
+            "weight": item.get("weight") or None,
+            "price": price,
+            "quantity": item["quantity"],
+        })
+    return {"items": lines, **quote_lines(lines, promo)}
@@ -0,0 +1,228 @@
+"""
+Sampling profiler for production use.
+
+A Sampler thread snapshots every thread's Python stack at a fixed
+interval and counts them in the collapsed format flamegraph.pl and
+speedscope read ("thread;outer (file.py);inner (file.py) 42"). Idle
+frames (the event loop's select, threadpool workers waiting for a job)
+are dropped so the output shows where time is actually spent.
+
+ProfilerMiddleware samples the process while a request flagged with
+`X-Profile: 1` and admin credentials runs; the response carries an
+X-Profile-Id to fetch from /api/admin/profiles/{id}. Other requests keep
+running meanwhile and show up in the samples too. Profiles are files in a
+ProfileStore directory, so any uvicorn worker on the host can serve the id
+another one returned. The middleware also logs any request slower than the
+threshold with its database calls.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import metrics
+
+logger = logging.getLogger("profiler")
+
+DEFAULT_INTERVAL = 0.005
+MAX_PROFILES = 20
+PROFILE_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+# (file, function) of a frame that means the thread is waiting, not working
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def collapse(frame) -> list:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+class Sampler:
+    """Samples all threads but its own until stop(); one session per process at a time."""
+
+    _busy = threading.Lock()
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        if not Sampler._busy.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        Sampler._busy.release()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or is_idle(frame):
+                    continue
+                stack = [names.get(ident, str(ident))] + collapse(frame)
+                self.stacks[";".join(stack)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """The latest MAX_PROFILES profiles, one JSON file each, shared by the workers on a host.
+
+    Files hold {"id", "route", "seconds", "samples", "created_at", "collapsed"}.
+    All methods block; call them off the event loop.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _path(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.json"
+
+    def _files(self) -> List[Path]:
+        """Newest first."""
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue  # pruned by another worker
+        return [path for _, path in sorted(files, reverse=True)]
+
+    def save(self, profile: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(profile["id"])
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(profile, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        for old in self._files()[MAX_PROFILES:]:
+            old.unlink(missing_ok=True)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            return json.loads(self._path(profile_id).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[dict]:
+        """Newest first, without the stacks."""
+        profiles = []
+        for path in self._files():
+            try:
+                profile = json.loads(path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                continue
+            profiles.append({k: v for k, v in profile.items() if k != "collapsed"})
+        return profiles
+
+
+def finish_profile(store: ProfileStore, profile_id: str, route: str, seconds: float, sampler: Sampler):
+    """Stop the sampler and save what it collected; blocks, so run it in a thread."""
+    sampler.stop()
+    store.save({
+        "id": profile_id,
+        "route": route,
+        "seconds": round(seconds, 4),
+        "samples": sampler.samples,
+        "created_at": time.time(),
+        "collapsed": sampler.collapsed(),
+    })
+
+
+def db_breakdown(stats) -> str:
+    if stats is None or not stats.commands:
+        return "no database calls"
+    parts = sorted(stats.commands.items(), key=lambda item: -item[1][1])
+    return ", ".join(f"{command} x{count} {seconds * 1000:.1f}ms" for command, (count, seconds) in parts)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware; must sit inside MetricsMiddleware to see the request's DB stats.
+
+    `is_admin(authorization_header)` gates X-Profile; `route_name(scope)`
+    names the route in logs and profiles saved to `profiles`.
+    """
+
+    def __init__(self, app, is_admin, route_name, profiles: ProfileStore, slow_seconds: float = 1.0):
+        self.app = app
+        self.is_admin = is_admin
+        self.route_name = route_name
+        self.profiles = profiles
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        sampler = None
+        profile_id = uuid.uuid4().hex[:12]
+        if headers.get(b"x-profile") == b"1" and self.is_admin(headers.get(b"authorization", b"").decode("latin-1")):
+            sampler = Sampler()
+            if not sampler.start():
+                sampler = None
+
+        async def send_tagged(message):
+            if message["type"] == "http.response.start" and b"x-profile" in headers:
+                # The profile is stored once the response is complete
+                tag = profile_id.encode() if sampler else b"unavailable"
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", tag)]}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_tagged)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = None
+            if sampler is not None:
+                route = self.route_name(scope)
+                # Joining the sampler thread and writing the file would block the event loop
+                try:
+                    await asyncio.to_thread(
+                        finish_profile, self.profiles, profile_id, f"{scope['method']} {route}", elapsed, sampler
+                    )
+                except OSError:
+                    logger.exception("Could not save profile %s to %s", profile_id, self.profiles.directory)
+                logger.info("Profiled %s %s in %.3fs: /api/admin/profiles/%s",
+                            scope["method"], scope["path"], elapsed, profile_id)
+            if elapsed >= self.slow_seconds:
+                logger.warning("Slow request %s %s (%s) took %.3fs; db: %s",
+                               scope["method"], scope["path"], route or self.route_name(scope),
+                               elapsed, db_breakdown(metrics.current_request.get()))
@@ -0,0 +1,150 @@
+"""
+In-process product search.
+
+An inverted index over product names and descriptions plus category and
+price indexes. server.py keeps one SearchIndex per process and applies
+product writes to it, so a query never reaches MongoDB.
+
+Normalization is tuned for Russian and Kazakh: case folding, ё → е and a
+light suffix-stripping stemmer ("прополиса" and "прополис" meet).
+"""
+import bisect
+import re
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MIN_STEM = 3
+
+# Longest first, so "ами" is tried before "и"
+SUFFIXES = sorted({
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ая", "яя", "ое", "ее",
+    "ые", "ие", "ый", "ий", "ой", "ей", "ов", "ев", "ам", "ям", "ах", "ях", "ом", "ем",
+    "ую", "юю", "ия", "ья", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True)
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е")
+
+
+def stem(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def terms(text: Optional[str]) -> List[str]:
+    return [stem(token) for token in TOKEN_RE.findall(normalize(text or ""))]
+
+
+def price_points(product: dict) -> List[float]:
+    prices = [wp["price"] for wp in product.get("weight_prices") or []]
+    return prices or [product.get("base_price", 0)]
+
+
+class SearchIndex:
+    def __init__(self, products: Iterable[dict] = ()):
+        self.docs = {}
+        self.postings = defaultdict(dict)   # term -> {product_id: score}
+        self.vocabulary = []                # sorted terms, for prefix matches
+        self.categories = defaultdict(set)  # category_id -> product ids
+        self.prices = []                    # sorted (price, product_id)
+        for product in products:
+            self.upsert(product)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def upsert(self, product: dict):
+        product_id = product["id"]
+        self.remove(product_id)
+        self.docs[product_id] = product
+        scores = defaultdict(int)
+        for term in terms(product.get("name")):
+            scores[term] += NAME_WEIGHT
+        for term in terms(product.get("description")):
+            scores[term] += DESCRIPTION_WEIGHT
+        for term, score in scores.items():
+            if term not in self.postings:
+                bisect.insort(self.vocabulary, term)
+            self.postings[term][product_id] = score
+        self.categories[product.get("category_id")].add(product_id)
+        for price in set(price_points(product)):
+            bisect.insort(self.prices, (price, product_id))
+
+    def remove(self, product_id: str):
+        product = self.docs.pop(product_id, None)
+        if product is None:
+            return
+        for term in set(terms(product.get("name"))) | set(terms(product.get("description"))):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[term]
+                self.vocabulary.pop(bisect.bisect_left(self.vocabulary, term))
+        self.categories[product.get("category_id")].discard(product_id)
+        for price in set(price_points(product)):
+            i = bisect.bisect_left(self.prices, (price, product_id))
+            if i < len(self.prices) and self.prices[i] == (price, product_id):
+                self.prices.pop(i)
+
+    def match_term(self, term: str, prefix: bool) -> dict:
+        if not prefix:
+            return self.postings.get(term, {})
+        # The word being typed matches every indexed term it starts
+        matches = {}
+        i = bisect.bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+            for product_id, score in self.postings[self.vocabulary[i]].items():
+                matches[product_id] = max(matches.get(product_id, 0), score)
+            i += 1
+        return matches
+
+    def in_price_range(self, min_price: Optional[float], max_price: Optional[float]) -> set:
+        lo = 0 if min_price is None else bisect.bisect_left(self.prices, (min_price, ""))
+        hi = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, (max_price, "\uffff"))
+        return {product_id for _, product_id in self.prices[lo:hi]}
+
+    def search(self, q: str = "", category: Optional[str] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               limit: int = 50) -> dict:
+        """Products matching every query word, best first, with category facets."""
+        words = TOKEN_RE.findall(normalize(q or ""))
+        scores = None
+        for i, word in enumerate(words):
+            # The last word may still be half typed
+            last = i == len(words) - 1 and q == q.rstrip()
+            found = self.match_term(word, prefix=True) if last else {}
+            exact = self.match_term(stem(word), prefix=False)
+            found = {**found, **{k: max(v, found.get(k, 0)) for k, v in exact.items()}}
+            if scores is None:
+                scores = dict(found)
+            else:
+                scores = {k: scores[k] + found[k] for k in scores.keys() & found.keys()}
+            if not scores:
+                break
+        if scores is None:
+            scores = dict.fromkeys(self.docs, 0)
+
+        if min_price is not None or max_price is not None:
+            allowed = self.in_price_range(min_price, max_price)
+            scores = {k: v for k, v in scores.items() if k in allowed}
+
+        facets = defaultdict(int)
+        for product_id in scores:
+            facets[self.docs[product_id].get("category_id")] += 1
+        if category:
+            scores = {k: v for k, v in scores.items() if k in self.categories.get(category, ())}
+
+        ranked = sorted(scores, key=lambda k: (-scores[k], self.docs[k].get("name", "")))
+        return {
+            "total": len(ranked),
+            "products": [self.docs[k] for k in ranked[:limit]],
+            "facets": {"categories": dict(facets)},
+        }
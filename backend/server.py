@@ -1,24 +1,49 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Header, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.routing import Match
 import os
 import logging
 import secrets
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
+import asyncio
 import uuid
-from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import base64
+import binascii
+import csv
+import hashlib
+import io
+import itertools
+import json
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import compression
+import fast_json
+import image_pipeline
+import metrics
+import pricing
+import profiler
+import search
+import storage
+from cache_sync import CacheSync
+from order_queue import OrderQueue
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# STORAGE picks MongoDB (default), an embedded SQLite file or MariaDB
+store = storage.from_env(os.environ, ROOT_DIR)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -27,6 +52,30 @@ security = HTTPBasic()
 ADMIN_USERNAME = "armanuha"
 ADMIN_PASSWORD = "secretboost1"
 
+IMAGES_DIR = Path(os.environ.get('IMAGES_DIR', ROOT_DIR / 'images'))
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+PROMO_RESERVATION_TTL = int(os.environ.get('PROMO_RESERVATION_TTL', 600))
+PROMO_CACHE_TTL = int(os.environ.get('PROMO_CACHE_TTL', 60))
+ORDER_QUEUE_PATH = Path(os.environ.get('ORDER_QUEUE_PATH', ROOT_DIR / 'order_queue.db'))
+ORDER_WORKERS = int(os.environ.get('ORDER_WORKERS', 2))
+# ORDER_QUEUE=off writes each order within its checkout request instead. That is the default
+# on MariaDB and SQLite, the shared-hosting backends: those hosts stop the process, and the
+# queue workers with it, between requests
+ORDER_QUEUE = os.environ.get('ORDER_QUEUE', 'off' if store.name in ('mariadb', 'sqlite') else 'on') != 'off'
+ORDER_BATCH_SIZE = 100
+ORDER_MAX_ATTEMPTS = int(os.environ.get('ORDER_MAX_ATTEMPTS', 10))  # then the order is parked as dead
+# Requests slower than this are logged with their database calls
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_MS', 1000)) / 1000
+MAX_PROFILE_SECONDS = 60
+# Per-request profiles, shared by the uvicorn workers of this host
+PROFILES_DIR = Path(os.environ.get('PROFILES_DIR', ROOT_DIR / 'profiles'))
+ORDER_KEY_RETENTION = 24 * 3600  # how long an Idempotency-Key is remembered
+# Upper bound (seconds) on how long other workers serve a cache after an admin write
+CACHE_SYNC_INTERVAL = float(os.environ.get('CACHE_SYNC_INTERVAL', 1))
+# Stats days/weeks/months are cut in the shop's local time (Kazakhstan, UTC+5)
+STATS_TZ = timezone(timedelta(hours=int(os.environ.get('STATS_UTC_OFFSET', 5))))
+
 # Models
 class WeightPrice(BaseModel):
     weight: str
@@ -55,6 +104,15 @@ class Product(ProductBase):
     id: str
     created_at: str
 
+class ProductCard(BaseModel):
+    """What a storefront card renders; the description is fetched when the product is opened."""
+    id: str
+    name: str
+    category_id: str
+    image: str = ""
+    base_price: float
+    weight_prices: List[WeightPrice] = []
+
 class CategoryBase(BaseModel):
     name: str
     slug: str
@@ -90,6 +148,7 @@ class Promocode(PromocodeBase):
 
 # Order models
 class OrderItem(BaseModel):
+    product_id: Optional[str] = None
     name: str
     weight: Optional[str] = None
     price: float
@@ -99,10 +158,12 @@ class OrderCreate(BaseModel):
     customer_name: str
     customer_phone: str
     items: List[OrderItem]
-    subtotal: float
+    # Totals are recomputed from the price table; client values are ignored
+    subtotal: float = 0
     discount: float = 0
-    total: float
+    total: float = 0
     promocode: Optional[str] = None
+    promocode_reservation: Optional[str] = None  # reservation_id from /promocodes/validate
 
 class Order(BaseModel):
     id: str
@@ -113,8 +174,33 @@ class Order(BaseModel):
     discount: float
     total: float
     promocode: Optional[str]
+    promocode_status: Optional[str] = None  # redeemed | rejected | unknown, set when the order is written
     created_at: str
 
+# Cart quote models
+class CartItem(BaseModel):
+    product_id: Optional[str] = None
+    name: str
+    weight: Optional[str] = None
+    quantity: int
+
+class CartQuoteRequest(BaseModel):
+    items: List[CartItem]
+    promocode: Optional[str] = None
+
+class PromocodeValidateRequest(BaseModel):
+    code: str
+    items: List[CartItem] = []  # priced server-side when given
+    subtotal: float = 0  # used only without items
+    reservation_id: Optional[str] = None  # from an earlier validation of this cart; renewed
+
+class CartQuote(BaseModel):
+    items: List[OrderItem]
+    subtotal: float
+    discount: float
+    total: float
+    promocode: Optional[str] = None
+
 # About Us model
 class Feature(BaseModel):
     text: str
@@ -131,6 +217,8 @@ class AboutUs(BaseModel):
     description: str
     features: List[Feature]
 
+ORDER_FIELDS = set(Order.model_fields)
+
 # Helper functions
 def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
     correct_username = secrets.compare_digest(credentials.username, ADMIN_USERNAME)
@@ -139,6 +227,540 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Incorrect credentials")
     return credentials.username
 
+def encode_cursor(created_at: str, item_id: str) -> str:
+    raw = json.dumps([created_at, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, item_id
+
+def parse_fields(fields: Optional[str], allowed: set) -> Optional[List[str]]:
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+# Promocode cache
+class TTLCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+# Definitions only; usage counts are always checked by the atomic reserve/redeem ops.
+# Unknown codes are cached too (as MISSING) so invalid-code spam stays off the DB.
+promo_cache = TTLCache(maxsize=512, ttl=PROMO_CACHE_TTL)
+MISSING = object()
+
+def normalize_code(code: Optional[str]) -> str:
+    return (code or "").strip().upper()
+
+async def find_promocode(code: str) -> Optional[dict]:
+    promo = promo_cache.get(code)
+    if promo is None:
+        promo = await store.find_promocode(code) or MISSING
+        promo_cache.set(code, promo)
+    return None if promo is MISSING else promo
+
+async def normalize_promocodes():
+    """Upper-case codes stored before normalization, leaving clashes for the admin."""
+    for code in await store.normalize_promocodes(normalize_code):
+        logger.warning("Promocode %s clashes with an existing code after normalization", code)
+
+# Per-process product indexes: an immutable price table and the search index.
+# Product writes are applied to both; bulk changes drop them for a lazy reload.
+price_table: Optional[pricing.PriceTable] = None
+search_index: Optional[search.SearchIndex] = None
+product_generation = 0  # bumped by writes so a slow load cannot install stale data
+PRICE_FIELDS = ("id", "name", "base_price", "weight_prices")
+
+async def get_price_table() -> pricing.PriceTable:
+    global price_table
+    table = price_table
+    if table is None:
+        generation = product_generation
+        table = pricing.PriceTable.build(await store.list_products(fields=PRICE_FIELDS))
+        if generation == product_generation:
+            price_table = table
+    return table
+
+async def get_search_index() -> search.SearchIndex:
+    global search_index
+    index = search_index
+    if index is None:
+        generation = product_generation
+        index = search.SearchIndex(await store.list_products(fields=PRODUCT_FIELDS))
+        if generation == product_generation:
+            search_index = index
+    return index
+
+def products_changed(product: Optional[dict] = None, removed: Optional[str] = None):
+    """Apply one product write to the indexes; without arguments drop them for a full reload."""
+    global price_table, search_index, product_generation
+    product_generation += 1
+    if product is not None:
+        if price_table is not None:
+            price_table = price_table.with_product(product)
+        if search_index is not None:
+            search_index.upsert(product)
+    elif removed is not None:
+        if price_table is not None:
+            price_table = price_table.without_product(removed)
+        if search_index is not None:
+            search_index.remove(removed)
+    else:
+        price_table = search_index = None
+
+async def price_cart(items: List[dict], promo: Optional[dict] = None) -> dict:
+    try:
+        return pricing.quote(await get_price_table(), items, promo)
+    except pricing.PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Stats rollups: one counter document per period, kept in step with the orders
+STATS_GRANULARITIES = ("day", "week", "month")
+STATS_COUNTERS = ("orders", "revenue", "discount", "items")
+
+def stats_buckets(created_at: str) -> List[str]:
+    local = datetime.fromisoformat(created_at).astimezone(STATS_TZ)
+    year, week, _ = local.isocalendar()
+    return ["all", f"day:{local:%Y-%m-%d}", f"week:{year}-W{week:02d}", f"month:{local:%Y-%m}"]
+
+def rollup_orders(orders: List[dict], sign: int = 1):
+    """Fold orders into per-bucket counters and top product/promocode lines."""
+    totals, top = {}, {}
+    for order in orders:
+        items = order.get("items") or []
+        # Rejected codes gave no discount slot, so they do not count as uses
+        promocode = order.get("promocode") if order.get("promocode_status") in (None, "redeemed") else None
+        for bucket in stats_buckets(order["created_at"]):
+            counters = totals.setdefault(bucket, dict.fromkeys(STATS_COUNTERS, 0))
+            counters["orders"] += sign
+            counters["revenue"] += sign * order.get("total", 0)
+            counters["discount"] += sign * order.get("discount", 0)
+            for item in items:
+                counters["items"] += sign * item["quantity"]
+                key = ("product", item.get("product_id") or item["name"], item.get("weight") or "")
+                line = top.setdefault((bucket, *key), {"count": 0, "revenue": 0, "name": item["name"], "weight": key[2]})
+                line["count"] += sign * item["quantity"]
+                line["revenue"] += sign * item["price"] * item["quantity"]
+            if promocode:
+                line = top.setdefault((bucket, "promocode", promocode, ""), {"count": 0, "revenue": 0, "name": promocode, "weight": ""})
+                line["count"] += sign
+                line["revenue"] += sign * order.get("discount", 0)
+    return totals, top
+
+async def apply_order_stats(orders: List[dict], sign: int = 1):
+    if not orders:
+        return
+    totals, top = rollup_orders(orders, sign)
+    await store.add_stats(totals, top, upsert=sign > 0)
+
+async def backfill_stats() -> int:
+    """Rebuild every rollup from the orders."""
+    await store.clear("stats")
+    count = 0
+    batch = []
+    async for order in store.iter_orders({}):
+        batch.append(order)
+        if len(batch) == 1000:
+            await apply_order_stats(batch)
+            count += len(batch)
+            batch = []
+    await apply_order_stats(batch)
+    return count + len(batch)
+
+async def ensure_stats():
+    """Backfill once per database, the first time a server with rollups starts."""
+    if not await store.claim_marker("stats", "done"):
+        return
+    count = await backfill_stats()
+    logger.info("Backfilled stats rollups from %d orders", count)
+
+def stats_row(doc: dict) -> dict:
+    orders = doc.get("orders", 0)
+    return {
+        "period": doc.get("period", "all"),
+        "orders": orders,
+        "revenue": round(doc.get("revenue", 0), 2),
+        "discount": round(doc.get("discount", 0), 2),
+        "items": doc.get("items", 0),
+        "average_basket": round(doc.get("revenue", 0) / orders, 2) if orders else 0,
+    }
+
+# Order queue: checkouts are acknowledged once they are durable on local disk
+order_queue = OrderQueue(ORDER_QUEUE_PATH, max_attempts=ORDER_MAX_ATTEMPTS) if ORDER_QUEUE else None
+order_queue_event = asyncio.Event()
+order_workers: List[asyncio.Task] = []
+order_metrics = {"processed": 0, "failed_batches": 0, "promocodes_rejected": 0, "last_batch_size": 0}
+
+async def apply_promocode(token: str, seq: int, order: dict):
+    """Redeem an order's promocode once and remember the outcome in the queue."""
+    if not order.get("promocode") or order.get("promocode_status"):
+        return
+    reservation_id = order.pop("promocode_reservation", None)
+    # Keyed by order id, so a reclaimed copy of the batch does not count the use twice
+    if await store.redeem_promocode(order["promocode"], reservation_id, order["id"]):
+        order["promocode_status"] = "redeemed"
+    else:
+        if await find_promocode(order["promocode"]):
+            order["promocode_status"] = "rejected"
+            order_metrics["promocodes_rejected"] += 1
+        else:
+            order["promocode_status"] = "unknown"
+        # Intake priced the discount in; an order without a redeemed use pays the full subtotal
+        order.update(pricing.quote_lines(order["items"]))
+    await run_in_threadpool(order_queue.update, token, seq, order)
+
+async def write_order_batch(token: str, batch):
+    for seq, order in batch:
+        await apply_promocode(token, seq, order)
+    orders = [{k: v for k, v in order.items() if k != "promocode_reservation"} for _, order in batch]
+    # Orders written by an earlier attempt of this batch are skipped
+    written = await store.insert_orders(orders)
+    try:
+        await apply_order_stats(written)
+    except Exception:
+        # The orders are safe; only the rollups lag until `python server.py backfill-stats`
+        logger.exception("Stats rollup update failed for %d orders", len(written))
+
+async def order_worker():
+    backoff = 1
+    while True:
+        order_queue_event.clear()
+        token, batch = await run_in_threadpool(order_queue.claim, ORDER_BATCH_SIZE)
+        if not batch:
+            # Poll as well: other uvicorn workers share the queue file
+            try:
+                await asyncio.wait_for(order_queue_event.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        seqs = [seq for seq, _ in batch]
+        try:
+            await write_order_batch(token, batch)
+        except Exception:
+            logger.exception("Order batch of %d failed, retrying in %ds", len(batch), backoff)
+            order_metrics["failed_batches"] += 1
+            await run_in_threadpool(order_queue.release, token, seqs)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        backoff = 1
+        await run_in_threadpool(order_queue.complete, token, seqs)
+        order_metrics["processed"] += len(batch)
+        order_metrics["last_batch_size"] = len(batch)
+
+async def place_order(order: dict, idempotency_key: Optional[str]) -> dict:
+    """Redeem and write an order within the checkout request (ORDER_QUEUE=off)."""
+    reservation_id = order.pop("promocode_reservation", None)
+    try:
+        stored, created = await store.place_order(order, idempotency_key, reservation_id)
+    except storage.PromocodeExhausted:
+        order_metrics["promocodes_rejected"] += 1
+        raise HTTPException(status_code=400, detail="Промокод исчерпан")
+    except storage.IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Заказ с этим Idempotency-Key не найден")
+    if created:
+        order_metrics["processed"] += 1
+        try:
+            await apply_order_stats([stored])
+        except Exception:
+            logger.exception("Stats rollup update failed for order %s", stored["id"])
+    return stored
+
+async def purge_order_queue():
+    while True:
+        await run_in_threadpool(order_queue.purge, ORDER_KEY_RETENTION)
+        await asyncio.sleep(600)
+
+# Catalog snapshot cache
+CATALOG_COLLECTIONS = ("products", "categories", "about")
+CATALOG_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+CATALOG_ENTRIES = 256
+CATALOG_COMPRESSED_ENTRIES = 64
+CARD_FIELDS = tuple(ProductCard.model_fields)
+
+class CatalogSnapshot:
+    """Pre-serialized catalog responses, rebuilt lazily after admin writes.
+
+    Entries are keyed by tuples whose first element is the collection they
+    were read from; every write bumps that collection's version. These
+    versions are this process's own; HTTP validators come from the shared
+    ones (catalog_validators).
+    """
+
+    def __init__(self):
+        self.versions = {name: 0 for name in CATALOG_COLLECTIONS}
+        self._entries = OrderedDict()  # key -> body, least recently used first
+        self._compressed = OrderedDict()  # (key, ETag, encoding) -> body, least recently used first
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, *collections):
+        for name in collections or CATALOG_COLLECTIONS:
+            self.versions[name] += 1
+        self._entries = OrderedDict(
+            (key, body) for key, body in self._entries.items()
+            if collections and key[0] not in collections
+        )
+        # Compressed bodies are keyed by ETag, which moves only once the write is published
+        self._compressed.clear()
+
+    async def get(self, key, loader):
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+            return body
+        async with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                return body
+            version = self.versions[key[0]]
+            body = await loader()
+            # Don't keep a body that an admin write raced with
+            if version == self.versions[key[0]]:
+                self._entries[key] = body
+                while len(self._entries) > CATALOG_ENTRIES:
+                    self._entries.popitem(last=False)
+            return body
+
+    async def compressed(self, key, etag: str, body: bytes, encoding: str) -> bytes:
+        """`body` compressed at the highest level, once per ETag and encoding."""
+        cache_key = (key, etag, encoding)
+        data = self._compressed.get(cache_key)
+        if data is not None:
+            self._compressed.move_to_end(cache_key)
+            return data
+        level = compression.STATIC_LEVEL[encoding]
+        data = await run_in_threadpool(compression.compress, body, encoding, level)
+        # Bodies of older versions are never asked for again and age out
+        self._compressed[cache_key] = data
+        while len(self._compressed) > CATALOG_COMPRESSED_ENTRIES:
+            self._compressed.popitem(last=False)
+        return data
+
+catalog = CatalogSnapshot()
+
+# Cross-process invalidation: admin writes publish what they changed
+CACHED_COLLECTIONS = CATALOG_COLLECTIONS + ("promocodes",)
+
+def caches_changed(names: set):
+    """Another process (or a direct database edit) changed `names`; drop what we cached."""
+    if "products" in names:
+        products_changed()
+    if "promocodes" in names:
+        promo_cache.clear()
+    collections = [name for name in CATALOG_COLLECTIONS if name in names]
+    if collections:
+        catalog.invalidate(*collections)
+
+cache_sync = CacheSync(store, CACHED_COLLECTIONS, caches_changed, CACHE_SYNC_INTERVAL)
+
+def catalog_validators(*collections) -> dict:
+    """ETag and Last-Modified from the shared cache versions, so any worker can answer 304."""
+    versions = [cache_sync.version(name) for name in collections]
+    tag = ".".join(f"{name[0]}{version}" for name, (version, _) in zip(collections, versions))
+    validators = {"ETag": f'"{tag}"', "Cache-Control": CATALOG_CACHE_CONTROL}
+    # A collection that never changed since versions were kept has no known date
+    modified = [updated_at for _, updated_at in versions if updated_at]
+    if len(modified) == len(versions):
+        modified = max(modified).astimezone(timezone.utc).replace(microsecond=0)
+        validators["Last-Modified"] = format_datetime(modified, usegmt=True)
+    return validators
+
+# Read projections: only model fields leave the database, so records can be encoded as-is
+PRODUCT_FIELDS = tuple(Product.model_fields)
+ENCODED_ETAG_RE = re.compile(r'-(br|gzip)"$')
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class FastJSONResponse(Response):
+    """JSON straight from database dicts.
+
+    Returning it skips FastAPI's response_model validation and
+    jsonable_encoder; response_model still documents the schema.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return fast_json.dumps(content)
+
+async def catalog_json_response(request: Request, key, body: bytes, validators: dict) -> Response:
+    """A snapshot body, served precompressed when the client accepts it."""
+    headers = {**validators, "Vary": "Accept-Encoding"}
+    encoding = compression.negotiate(request.headers.get("accept-encoding", ""))
+    if encoding and len(body) >= compression.MIN_SIZE:
+        body = await catalog.compressed(key, validators["ETag"], body, encoding)
+        # Each encoding is its own representation, so it gets its own ETag
+        headers["ETag"] = validators["ETag"][:-1] + f'-{encoding}"'
+        headers["Content-Encoding"] = encoding
+    return json_response(body, headers)
+
+def is_not_modified(request: Request, validators: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [ENCODED_ETAG_RE.sub('"', t.strip().removeprefix("W/")) for t in if_none_match.split(",")]
+        return "*" in tags or validators["ETag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in validators:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(validators["Last-Modified"])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def catalog_response(request: Request, *collections):
+    """304 for a matching conditional request, otherwise None plus the validators."""
+    validators = catalog_validators(*collections)
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators), validators
+    return None, validators
+
+async def load_categories_json() -> bytes:
+    return fast_json.dumps(await store.list_categories())
+
+async def load_category_ids() -> frozenset:
+    return frozenset(await store.category_ids())
+
+async def load_products_json(category_id: Optional[str] = None, view: str = "full") -> bytes:
+    fields = CARD_FIELDS if view == "card" else PRODUCT_FIELDS
+    return fast_json.dumps(await store.list_products(category_id, fields))
+
+# Image blob store
+IMAGE_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return None
+
+def image_blob_path(digest: str) -> Path:
+    return IMAGES_DIR / digest[:2] / digest
+
+def image_url(digest: str) -> str:
+    return f"/api/images/{digest}"
+
+def write_image_blob(source) -> str:
+    """Copy a binary file object into the store, returning its SHA-256 digest."""
+    IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = IMAGES_DIR / f".upload-{uuid.uuid4().hex}"
+    sha = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with open(tmp_path, "wb") as tmp:
+            while chunk := source.read(64 * 1024):
+                size += len(chunk)
+                if size > MAX_IMAGE_SIZE:
+                    raise HTTPException(status_code=413, detail="Image too large")
+                if len(head) < 16:
+                    head += chunk[:16]
+                sha.update(chunk)
+                tmp.write(chunk)
+        if sniff_image_type(head) is None:
+            raise HTTPException(status_code=415, detail="Unsupported image type")
+        digest = sha.hexdigest()
+        path = image_blob_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        os.replace(tmp_path, path)
+        # Uploading an image again retries variants that failed to render
+        image_pipeline.clear_failed(path)
+        return digest
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def store_inline_image(image: str) -> str:
+    """Move a base64 data URL into the blob store; other values pass through."""
+    if not image or not image.startswith("data:"):
+        return image
+    try:
+        data = base64.b64decode(image.split(",", 1)[1], validate=True)
+    except (IndexError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid image data URL")
+    return image_url(write_image_blob(io.BytesIO(data)))
+
+# Image derivatives (resized WebP/AVIF/JPEG), rendered off the event loop
+image_pool = None
+image_jobs = {}
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global image_pool
+    if image_pool is None:
+        image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return image_pool
+
+def log_image_job(digest: str, job):
+    image_jobs.pop(digest, None)
+    if not job.cancelled() and job.exception() is not None:
+        logger.error("Image derivatives failed for %s: %s", digest, job.exception())
+
+def schedule_image_derivatives(digest: str):
+    """Start rendering derivatives for an image unless a job is already running."""
+    job = image_jobs.get(digest)
+    if job is None and image_pipeline.available_formats():
+        loop = asyncio.get_running_loop()
+        job = loop.run_in_executor(get_image_pool(), image_pipeline.render_derivatives, str(image_blob_path(digest)))
+        job.add_done_callback(lambda j: log_image_job(digest, j))
+        image_jobs[digest] = job
+    return job
+
+def negotiate_image_format(accept: str) -> str:
+    for fmt in image_pipeline.available_formats():
+        if image_pipeline.FORMATS[fmt] in accept:
+            return fmt
+    return "jpeg"
+
+async def migrate_inline_images() -> int:
+    migrated = 0
+    for product in await store.inline_image_products():
+        url = await run_in_threadpool(store_inline_image, product["image"])
+        await store.update_product(product["id"], {"image": url})
+        migrated += 1
+    if migrated:
+        catalog.invalidate("products")
+        await cache_sync.publish("products")
+    return migrated
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -150,137 +772,355 @@ async def admin_login(data: AdminLogin):
         return {"success": True, "message": "Logged in"}
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
+@api_router.get("/admin/indexes")
+async def get_index_stats(admin: str = Depends(verify_admin)):
+    return await store.index_report()
+
+@api_router.get("/admin/cache-sync")
+async def get_cache_sync_stats(admin: str = Depends(verify_admin)):
+    return cache_sync.stats()
+
+@api_router.get("/admin/db-pool")
+async def get_db_pool_stats(admin: str = Depends(verify_admin)):
+    return {"storage": store.name, **await store.pool_stats()}
+
 # Categories
+@api_router.get("/admin/order-queue")
+async def get_order_queue_stats(admin: str = Depends(verify_admin)):
+    if order_queue is None:
+        return {"mode": "direct", "depth": 0, "lag_seconds": 0.0, **order_metrics, "workers": 0}
+    stats = await run_in_threadpool(order_queue.stats)
+    return {"mode": "queue", **stats, **order_metrics, "workers": ORDER_WORKERS}
+
+@api_router.post("/admin/order-queue/retry")
+async def retry_dead_orders(admin: str = Depends(verify_admin)):
+    """Queue orders that ran out of attempts again."""
+    if order_queue is None:
+        return {"requeued": 0}
+    return {"requeued": await run_in_threadpool(order_queue.retry_dead)}
+
+# Profiling
+@api_router.post("/admin/profile")
+async def profile_window(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    admin: str = Depends(verify_admin),
+):
+    """Sample every request in this process for a time window; returns collapsed stacks."""
+    sampler = profiler.Sampler(interval_ms / 1000)
+    if not sampler.start():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await run_in_threadpool(sampler.stop)
+    return Response(content=sampler.collapsed(), media_type="text/plain; charset=utf-8")
+
+profile_store = profiler.ProfileStore(PROFILES_DIR)
+
+@api_router.get("/admin/profiles")
+async def list_profiles(admin: str = Depends(verify_admin)):
+    return await run_in_threadpool(profile_store.list)
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, admin: str = Depends(verify_admin)):
+    profile = await run_in_threadpool(profile_store.get, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=profile["collapsed"], media_type="text/plain; charset=utf-8")
+
+@api_router.get("/metrics")
+async def get_metrics(admin: str = Depends(verify_admin)):
+    """Prometheus scrape endpoint (per process)."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db.categories.find({}, {"_id": 0}).sort("order", 1).to_list(100)
-    return categories
+async def get_categories(request: Request):
+    not_modified, validators = catalog_response(request, "categories")
+    if not_modified:
+        return not_modified
+    body = await catalog.get(("categories",), load_categories_json)
+    return await catalog_json_response(request, ("categories",), body, validators)
 
 @api_router.post("/categories", response_model=Category)
 async def create_category(category: CategoryCreate, admin: str = Depends(verify_admin)):
     cat_dict = category.model_dump()
     cat_dict["id"] = str(uuid.uuid4())
-    # Set order to be last
-    max_order = await db.categories.find_one(sort=[("order", -1)])
-    cat_dict["order"] = (max_order.get("order", 0) + 1) if max_order else 0
-    await db.categories.insert_one(cat_dict)
+    # Placed after the last category
+    cat_dict = await store.add_category(cat_dict)
+    catalog.invalidate("categories")
+    await cache_sync.publish("categories")
     return Category(**cat_dict)
 
 @api_router.post("/categories/reorder")
 async def reorder_categories(category_ids: List[str], admin: str = Depends(verify_admin)):
-    for index, cat_id in enumerate(category_ids):
-        await db.categories.update_one({"id": cat_id}, {"$set": {"order": index}})
-    return {"success": True}
+    await store.reorder_categories(category_ids)
+    catalog.invalidate("categories")
+    await cache_sync.publish("categories")
+    return {"success": True, "version": cache_sync.version("categories")[0]}
 
 @api_router.put("/categories/{category_id}", response_model=Category)
 async def update_category(category_id: str, category: CategoryCreate, admin: str = Depends(verify_admin)):
-    result = await db.categories.update_one(
-        {"id": category_id},
-        {"$set": category.model_dump()}
-    )
-    if result.matched_count == 0:
+    updated = await store.update_category(category_id, category.model_dump())
+    catalog.invalidate("categories")
+    if updated is None:
         raise HTTPException(status_code=404, detail="Category not found")
-    updated = await db.categories.find_one({"id": category_id}, {"_id": 0})
+    await cache_sync.publish("categories")
     return Category(**updated)
 
 @api_router.delete("/categories/{category_id}")
 async def delete_category(category_id: str, admin: str = Depends(verify_admin)):
-    result = await db.categories.delete_one({"id": category_id})
-    if result.deleted_count == 0:
+    deleted = await store.delete_category(category_id)
+    catalog.invalidate("categories")
+    if not deleted:
         raise HTTPException(status_code=404, detail="Category not found")
+    await cache_sync.publish("categories")
     return {"success": True}
 
 # Promocodes
-@api_router.get("/promocodes", response_model=List[Promocode])
+@api_router.get("/promocodes", response_model=List[Promocode], response_class=FastJSONResponse)
 async def get_promocodes(admin: str = Depends(verify_admin)):
-    promocodes = await db.promocodes.find({}, {"_id": 0}).to_list(100)
-    return [Promocode(**p) for p in promocodes]
+    return FastJSONResponse(await store.list_promocodes())
 
 @api_router.post("/promocodes", response_model=Promocode)
 async def create_promocode(promo: PromocodeCreate, admin: str = Depends(verify_admin)):
     promo_dict = promo.model_dump()
     promo_dict["id"] = str(uuid.uuid4())
+    promo_dict["code"] = normalize_code(promo.code)
     promo_dict["current_uses"] = 0
     promo_dict["is_active"] = True
-    await db.promocodes.insert_one(promo_dict)
+    if not promo_dict["code"]:
+        raise HTTPException(status_code=400, detail="Промокод не может быть пустым")
+    try:
+        await store.insert_promocode(promo_dict)
+    except storage.DuplicateError:
+        raise HTTPException(status_code=409, detail="Такой промокод уже существует")
+    finally:
+        promo_cache.clear()
+    await cache_sync.publish("promocodes")
     return Promocode(**promo_dict)
 
 @api_router.delete("/promocodes/{promo_id}")
 async def delete_promocode(promo_id: str, admin: str = Depends(verify_admin)):
-    result = await db.promocodes.delete_one({"id": promo_id})
-    if result.deleted_count == 0:
+    deleted = await store.delete_promocode(promo_id)
+    promo_cache.clear()
+    if not deleted:
         raise HTTPException(status_code=404, detail="Promocode not found")
+    await cache_sync.publish("promocodes")
     return {"success": True}
 
 @api_router.post("/promocodes/validate")
-async def validate_promocode(data: dict):
-    code = data.get("code", "").strip().upper()
-    subtotal = data.get("subtotal", 0)
-    
-    promo = await db.promocodes.find_one({"code": code.upper()}, {"_id": 0})
-    if not promo:
-        # Try lowercase
-        promo = await db.promocodes.find_one({"code": code.lower()}, {"_id": 0})
-    if not promo:
-        # Try original case
-        promo = await db.promocodes.find_one({"code": data.get("code", "").strip()}, {"_id": 0})
+async def validate_promocode(data: PromocodeValidateRequest):
+    code = normalize_code(data.code)
+    if data.items:
+        subtotal = (await price_cart([item.model_dump() for item in data.items]))["subtotal"]
+    else:
+        subtotal = data.subtotal
     
+    promo = await find_promocode(code)
     if not promo:
         raise HTTPException(status_code=404, detail="Промокод не найден")
     
     if not promo.get("is_active", True):
         raise HTTPException(status_code=400, detail="Промокод неактивен")
     
-    if promo.get("current_uses", 0) >= promo.get("max_uses", 0):
+    promo, reservation = await store.reserve_promocode(promo["code"], PROMO_RESERVATION_TTL, data.reservation_id)
+    if not promo:
         raise HTTPException(status_code=400, detail="Промокод исчерпан")
     
-    discount = 0
-    if promo["discount_type"] == "percent":
-        discount = subtotal * promo["discount_value"] / 100
-    else:
-        discount = min(promo["discount_value"], subtotal)
+    discount = pricing.promo_discount(promo, subtotal)
     
     return {
         "valid": True,
         "code": promo["code"],
         "discount_type": promo["discount_type"],
         "discount_value": promo["discount_value"],
-        "discount": round(discount, 2)
+        "discount": discount,
+        "reservation_id": reservation["id"],
+        "reservation_expires_at": reservation["expires_at"].isoformat()
     }
 
+@api_router.post("/cart/quote", response_model=CartQuote)
+async def quote_cart(cart: CartQuoteRequest):
+    code = normalize_code(cart.promocode) if cart.promocode else None
+    promo = await find_promocode(code) if code else None
+    quoted = await price_cart([item.model_dump() for item in cart.items], promo)
+    return {**quoted, "promocode": promo["code"] if promo else None}
+
 # Orders
-@api_router.get("/orders", response_model=List[Order])
-async def get_orders(admin: str = Depends(verify_admin)):
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [Order(**o) for o in orders]
+@api_router.get("/orders", response_model=List[Order], response_class=FastJSONResponse)
+async def get_orders(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    promocode: Optional[str] = None,
+    phone: Optional[str] = None,
+    admin: str = Depends(verify_admin),
+):
+    """Newest orders first, one page at a time.
+
+    The next page is requested with the opaque cursor from the X-Next-Cursor
+    response header, which is absent on the last page.
+    """
+    filters = order_filter(date_from, date_to, promocode, phone)
+    after = decode_cursor(cursor) if cursor else None
+    names = parse_fields(fields, ORDER_FIELDS)
+    orders = await store.list_orders(filters, after, names, limit + 1)
+
+    headers = {}
+    if len(orders) > limit:
+        orders = orders[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1]["created_at"], orders[-1]["id"])
+    return FastJSONResponse(orders, headers=headers)
+
+def order_filter(date_from: Optional[str], date_to: Optional[str],
+                 promocode: Optional[str] = None, phone: Optional[str] = None) -> dict:
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "promocode": normalize_code(promocode) if promocode else None,
+        "phone": phone,
+    }
+
+# One row per line item; order columns repeat on every line
+EXPORT_COLUMNS = [
+    "order_id", "created_at", "customer_name", "customer_phone", "promocode", "promocode_status",
+    "subtotal", "discount", "total", "product_id", "item_name", "weight", "price", "quantity", "line_total",
+]
+EXPORT_CHUNK_ROWS = 500
+
+def export_rows(order: dict):
+    base = [
+        order["id"], order["created_at"], order.get("customer_name"), order.get("customer_phone"),
+        order.get("promocode"), order.get("promocode_status"),
+        order.get("subtotal"), order.get("discount"), order.get("total"),
+    ]
+    # Orders without items still get one row so totals add up
+    for item in order.get("items") or [{}]:
+        quantity = item.get("quantity")
+        price = item.get("price")
+        line_total = round(price * quantity, 2) if price is not None and quantity is not None else None
+        yield base + [item.get("product_id"), item.get("name"), item.get("weight"), price, quantity, line_total]
+
+# Spreadsheets evaluate cells that start like a formula, and names and phones are customer input
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def encode_export_rows(rows: List[list], fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([csv_cell(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+async def stream_orders_export(filters: dict, fmt: str):
+    if fmt == "csv":
+        # BOM so Excel opens the Cyrillic columns as UTF-8
+        yield "\ufeff".encode() + encode_export_rows([EXPORT_COLUMNS], fmt)
+    rows = []
+    async for order in store.iter_orders(filters):
+        rows.extend(export_rows(order))
+        if len(rows) >= EXPORT_CHUNK_ROWS:
+            yield encode_export_rows(rows, fmt)
+            rows = []
+    if rows:
+        yield encode_export_rows(rows, fmt)
+
+@api_router.get("/orders/export")
+async def export_orders(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    admin: str = Depends(verify_admin),
+):
+    """Stream every matching order, oldest first, without loading them all into memory."""
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    filename = f"orders-{datetime.now(STATS_TZ):%Y%m%d-%H%M}.{fmt}"
+    return StreamingResponse(
+        stream_orders_export(order_filter(date_from, date_to), fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @api_router.post("/orders", response_model=Order)
-async def create_order(order: OrderCreate):
+async def create_order(order: OrderCreate, idempotency_key: Optional[str] = Header(None, max_length=200)):
+    """Accept an order into the local queue, or with ORDER_QUEUE=off write it right away."""
     order_dict = order.model_dump()
     order_dict["id"] = str(uuid.uuid4())
     order_dict["created_at"] = datetime.now(timezone.utc).isoformat()
-    
-    # Update promocode usage if used
     if order.promocode:
-        await db.promocodes.update_one(
-            {"code": order.promocode},
-            {"$inc": {"current_uses": 1}}
-        )
+        order_dict["promocode"] = normalize_code(order.promocode)
+    promo = await find_promocode(order_dict["promocode"]) if order.promocode else None
+    order_dict.update(await price_cart(order_dict["items"], promo))
+    if order_queue is None:
+        return Order(**await place_order(order_dict, idempotency_key))
     
-    await db.orders.insert_one(order_dict)
-    return Order(**order_dict)
+    # A retried checkout with the same key gets the original order back
+    stored, created = await run_in_threadpool(order_queue.enqueue, order_dict, idempotency_key)
+    if created:
+        order_queue_event.set()
+    return Order(**stored)
 
 @api_router.delete("/orders/{order_id}")
 async def delete_order(order_id: str, admin: str = Depends(verify_admin)):
-    result = await db.orders.delete_one({"id": order_id})
-    if result.deleted_count == 0:
+    order = await store.delete_order(order_id)
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    await apply_order_stats([order], -1)
     return {"success": True}
 
+# Stats
+@api_router.get("/stats")
+async def get_stats(
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    limit: int = Query(30, ge=1, le=366),
+    period: Optional[str] = Query(None, description="Period for the top lists, e.g. 2026-10; all time by default"),
+    top: int = Query(10, ge=1, le=100),
+    admin: str = Depends(verify_admin),
+):
+    """Revenue, orders and top lists read from the rollups; cost does not grow with order volume."""
+    bucket = "all"
+    if period:
+        granularity_of = {10: "day", 8: "week", 7: "month"}.get(len(period))
+        if granularity_of is None:
+            raise HTTPException(status_code=400, detail="period must look like 2026-10-17, 2026-W42 or 2026-10")
+        bucket = f"{granularity_of}:{period}"
+    
+    totals = await store.stats_totals(bucket)
+    series = await store.stats_series(granularity, limit)
+    top_products = await store.stats_top(bucket, "product", top)
+    promocodes = await store.stats_top(bucket, "promocode", top)
+    for line in top_products + promocodes:
+        line["revenue"] = round(line["revenue"], 2)
+    
+    return {
+        "totals": {**stats_row(totals), "period": period or "all"},
+        "series": [stats_row(doc) for doc in series],
+        "top_products": top_products,
+        "promocodes": [
+            {"code": line["name"], "uses": line["count"], "discount": line["revenue"]} for line in promocodes
+        ],
+    }
+
 # About Us
 @api_router.get("/about")
-async def get_about():
-    about = await db.about.find_one({"id": "about-us"}, {"_id": 0})
+async def get_about(request: Request):
+    not_modified, validators = catalog_response(request, "about")
+    if not_modified:
+        return not_modified
+    body = await catalog.get(("about",), load_about_json)
+    return await catalog_json_response(request, ("about",), body, validators)
+
+async def load_about_json() -> bytes:
+    about = await store.get_about()
     if not about:
         # Default content
         default_about = {
@@ -294,45 +1134,136 @@ async def get_about():
                 {"text": "Доставка по всему Казахстану", "icon": "FaTruck"}
             ]
         }
-        await db.about.insert_one(default_about)
-        return default_about
-    return about
+        await store.save_about(default_about)
+        about = default_about
+    return fast_json.dumps(about)
 
 @api_router.put("/about")
 async def update_about(data: AboutUsUpdate, admin: str = Depends(verify_admin)):
-    update_data = data.model_dump()
-    update_data["id"] = "about-us"
-    await db.about.update_one(
-        {"id": "about-us"},
-        {"$set": update_data},
-        upsert=True
-    )
+    await store.save_about(data.model_dump())
+    catalog.invalidate("about")
+    await cache_sync.publish("about")
     return {"success": True, "message": "About Us updated"}
 
+# Storefront bootstrap: everything the first page render needs in one response
+@api_router.get("/bootstrap")
+async def get_bootstrap(request: Request, view: str = Query("full", pattern="^(full|card)$")):
+    not_modified, validators = catalog_response(request, *CATALOG_COLLECTIONS)
+    if not_modified:
+        return not_modified
+    categories = await catalog.get(("categories",), load_categories_json)
+    products = await catalog.get(("products", None, view), lambda: load_products_json(view=view))
+    about = await catalog.get(("about",), load_about_json)
+    body = b'{"categories":' + categories + b',"products":' + products + b',"about":' + about + b'}'
+    return await catalog_json_response(request, ("bootstrap", view), body, validators)
+
+# Images
+@api_router.post("/images")
+async def upload_image(file: UploadFile = File(...), admin: str = Depends(verify_admin)):
+    digest = await run_in_threadpool(write_image_blob, file.file)
+    schedule_image_derivatives(digest)
+    return {"hash": digest, "url": image_url(digest)}
+
+@api_router.post("/images/migrate")
+async def migrate_images(admin: str = Depends(verify_admin)):
+    migrated = await migrate_inline_images()
+    return {"message": "Inline images migrated", "migrated": migrated}
+
+@api_router.get("/images/{digest}")
+async def get_image(
+    digest: str,
+    request: Request,
+    w: Optional[int] = Query(None, gt=0),
+    fmt: Optional[str] = Query(None, alias="format"),
+):
+    path = image_blob_path(digest)
+    if not IMAGE_HASH_RE.match(digest) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    with open(path, "rb") as f:
+        media_type = sniff_image_type(f.read(16))
+    etag = f'"{digest}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL}
+
+    formats = image_pipeline.available_formats()
+    if fmt is not None and fmt not in image_pipeline.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported image format")
+    # GIFs may be animated; they are always served untouched
+    if (w is not None or fmt is not None) and formats and media_type != "image/gif":
+        width = image_pipeline.pick_width(w or image_pipeline.WIDTHS[-1])
+        if fmt is None:
+            fmt = negotiate_image_format(request.headers.get("accept", ""))
+            headers["Vary"] = "Accept"
+        if fmt in formats:
+            variant = image_pipeline.derivative_path(path, width, fmt)
+            # A variant that failed once is served as the original, without rendering again
+            if not variant.is_file() and not image_pipeline.failed_path(path, width, fmt).exists():
+                try:
+                    await asyncio.shield(schedule_image_derivatives(digest))
+                except Exception:
+                    pass  # already logged by the job callback; fall back to the original
+            if variant.is_file():
+                path = variant
+                media_type = image_pipeline.FORMATS[fmt]
+                etag = f'"{digest}-w{width}.{fmt}"'
+
+    headers["ETag"] = etag
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 # Products
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category_id: Optional[str] = None):
-    query = {}
-    if category_id:
-        query["category_id"] = category_id
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
-    return [Product(**p) for p in products]
-
-@api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+async def get_products(
+    request: Request,
+    category_id: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|card)$"),
+):
+    """`view=card` drops descriptions and timestamps for list pages."""
+    not_modified, validators = catalog_response(request, "products")
+    if not_modified:
+        return not_modified
+    if category_id and category_id not in await catalog.get(("categories", "ids"), load_category_ids):
+        # Not cached: made-up ids must not grow the snapshot or each cost a database read
+        return json_response(b"[]", validators)
+    key = ("products", category_id, view)
+    body = await catalog.get(key, lambda: load_products_json(category_id, view))
+    return await catalog_json_response(request, key, body, validators)
+
+@api_router.get("/products/search")
+async def search_products(
+    q: str = Query("", max_length=200),
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Full-text search over names and descriptions with category facets and a price range."""
+    index = await get_search_index()
+    result = index.search(q, category, min_price, max_price, limit)
+    return FastJSONResponse(result)
+
+@api_router.get("/products/{product_id}", response_model=Product, response_class=FastJSONResponse)
+async def get_product(product_id: str, request: Request):
+    not_modified, validators = catalog_response(request, "products")
+    if not_modified:
+        return not_modified
+    product = await store.get_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+    return FastJSONResponse(product, headers=validators)
 
 @api_router.post("/products", response_model=Product)
 async def create_product(product: ProductCreate, admin: str = Depends(verify_admin)):
     prod_dict = product.model_dump()
     prod_dict["id"] = str(uuid.uuid4())
     prod_dict["created_at"] = datetime.now(timezone.utc).isoformat()
+    prod_dict["image"] = await run_in_threadpool(store_inline_image, prod_dict["image"])
     weight_prices = prod_dict.get("weight_prices", [])
     prod_dict["weight_prices"] = [wp if isinstance(wp, dict) else wp.model_dump() for wp in weight_prices]
-    await db.products.insert_one(prod_dict)
+    await store.insert_products([prod_dict])
+    catalog.invalidate("products")
+    products_changed(prod_dict)
+    await cache_sync.publish("products")
     return Product(**prod_dict)
 
 @api_router.put("/products/{product_id}", response_model=Product)
@@ -342,35 +1273,203 @@ async def update_product(product_id: str, product: ProductUpdate, admin: str = D
         update_data["weight_prices"] = [wp if isinstance(wp, dict) else wp.model_dump() for wp in update_data["weight_prices"]]
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
-    result = await db.products.update_one({"id": product_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    if "image" in update_data:
+        update_data["image"] = await run_in_threadpool(store_inline_image, update_data["image"])
+    updated = await store.update_product(product_id, update_data)
+    catalog.invalidate("products")
+    if updated is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    updated = await db.products.find_one({"id": product_id}, {"_id": 0})
+    products_changed(updated)
+    await cache_sync.publish("products")
     return Product(**updated)
 
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str, admin: str = Depends(verify_admin)):
-    result = await db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    deleted = await store.delete_product(product_id)
+    catalog.invalidate("products")
+    products_changed(removed=product_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Product not found")
+    await cache_sync.publish("products")
     return {"success": True}
 
+# Bulk product import (spreadsheet exports as CSV or NDJSON)
+IMPORT_CHUNK_ROWS = 500
+IMPORT_FIELDS = ("name", "description", "category_id", "image", "base_price", "weight_prices")
+
+def parse_weight_prices(value) -> list:
+    """Accept a JSON list or the spreadsheet form `250гр=1201;1кг=3500`."""
+    if isinstance(value, list):
+        return value
+    value = value.strip()
+    if value.startswith("["):
+        return json.loads(value)
+    prices = []
+    for part in filter(None, (p.strip() for p in value.split(";"))):
+        weight, sep, price = part.partition("=")
+        if not sep:
+            raise ValueError(f"weight_prices: expected weight=price, got {part!r}")
+        prices.append({"weight": weight.strip(), "price": price.strip()})
+    return prices
+
+def read_import_rows(fileobj, fmt: str):
+    """Yield (row number, record) lazily; unparsable records are yielded as the exception."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, {k.strip(): v for k, v in row.items() if k and v not in (None, "")}
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, ValueError(f"invalid JSON: {e.msg}")
+
+def import_error(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors())
+    if isinstance(exc, HTTPException):
+        return exc.detail
+    return str(exc)
+
+def parse_import_row(record, categories: set):
+    """Validate one record; returns (product id or None, fields to write)."""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+    data = {k: record[k] for k in IMPORT_FIELDS if record.get(k) not in (None, "")}
+    if "weight_prices" in data:
+        data["weight_prices"] = parse_weight_prices(data["weight_prices"])
+    data = ProductUpdate(**data).model_dump(exclude_none=True)
+    if "category_id" in data and data["category_id"] not in categories:
+        raise ValueError(f"unknown category_id {data['category_id']!r}")
+    return record.get("id") or None, data
+
+async def import_products_chunk(rows, categories: set, known: dict, dry_run: bool) -> List[dict]:
+    results, parsed = [], []
+    for number, record in rows:
+        try:
+            parsed.append((number, *parse_import_row(record, categories)))
+        except (ValueError, ValidationError) as e:
+            results.append({"row": number, "status": "error", "detail": import_error(e)})
+    
+    # Rows without an id update the product with the same name, if there is one
+    ids = [product_id for _, product_id, _ in parsed if product_id]
+    names = [data["name"] for _, product_id, data in parsed if not product_id and "name" in data]
+    for doc in await store.find_products(ids, names):
+        known.setdefault(("id", doc["id"]), doc["id"])
+        known.setdefault(("name", doc["name"]), doc["id"])
+    
+    ops, applied = [], []
+    for number, product_id, data in parsed:
+        key = ("id", product_id) if product_id else ("name", data.get("name"))
+        target = known.get(key)
+        try:
+            if "image" in data and not dry_run:
+                data["image"] = await run_in_threadpool(store_inline_image, data["image"])
+            if target:
+                ops.append(("update", target, data))
+                status = "updated"
+            elif product_id:
+                raise ValueError(f"product {product_id} not found")
+            else:
+                doc = ProductCreate(**data).model_dump()
+                doc["id"] = target = str(uuid.uuid4())
+                doc["created_at"] = datetime.now(timezone.utc).isoformat()
+                ops.append(("insert", doc))
+                known[key] = known[("id", target)] = target
+                status = "created"
+        except (ValueError, ValidationError, HTTPException) as e:
+            results.append({"row": number, "status": "error", "detail": import_error(e)})
+            continue
+        applied.append({"row": number, "id": target, "status": status})
+    
+    if ops and not dry_run:
+        try:
+            await store.write_products(ops)
+        except storage.BulkWriteFailed as e:
+            # Ordered: everything from the first failure on was not written
+            for i, result in enumerate(applied[e.index:]):
+                result["status"] = "error"
+                result["detail"] = e.message if i == 0 else "not applied after an earlier failure"
+    return results + applied
+
+@api_router.post("/products/bulk")
+async def bulk_import_products(
+    file: UploadFile = File(...),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    dry_run: bool = False,
+    admin: str = Depends(verify_admin),
+):
+    """Create or update many products in one request.
+
+    Rows carry the product fields (weight_prices as JSON or `250гр=1201;1кг=3500`)
+    and optionally an id; rows without an id update the product with the same
+    name or create a new one. Every row gets its own result.
+    """
+    if fmt is None:
+        fmt = "ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv"
+    categories = await store.category_ids()
+    rows = read_import_rows(file.file, fmt)
+    known, results = {}, []
+    while True:
+        chunk = await run_in_threadpool(lambda: list(itertools.islice(rows, IMPORT_CHUNK_ROWS)))
+        if not chunk:
+            break
+        results.extend(await import_products_chunk(chunk, categories, known, dry_run))
+    
+    if not dry_run and any(r["status"] != "error" for r in results):
+        catalog.invalidate("products")
+        products_changed()
+        await cache_sync.publish("products")
+    results.sort(key=lambda r: r["row"])
+    return {
+        "created": sum(r["status"] == "created" for r in results),
+        "updated": sum(r["status"] == "updated" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "dry_run": dry_run,
+        "rows": results,
+    }
+
 # Seed data
-@api_router.post("/seed")
-async def seed_data():
-    existing_categories = await db.categories.count_documents({})
-    if existing_categories > 0:
+async def seed_catalog() -> dict:
+    """Insert the demo catalog once per database.
+
+    A unique "seed" marker makes this safe to run from every worker at
+    startup: only the worker that claims it does the seeding.
+    """
+    if not await store.claim_marker("seed", "running"):
         return {"message": "Data already seeded"}
-    
+    try:
+        if await store.has_categories():
+            result = {"message": "Data already seeded"}
+        else:
+            result = await insert_seed_catalog()
+    except Exception:
+        await store.drop_marker("seed")
+        raise
+    await store.set_marker("seed", "done")
+    return result
+
+@api_router.post("/seed")
+async def seed_data(admin: str = Depends(verify_admin)):
+    return await seed_catalog()
+
+async def insert_seed_catalog() -> dict:
     categories = [
-        {"id": "cat-honey", "name": "Мёд", "slug": "honey"},
-        {"id": "cat-bee", "name": "Пчелопродукты", "slug": "bee-products"},
-        {"id": "cat-tincture", "name": "Настойки", "slug": "tinctures"},
-        {"id": "cat-cream", "name": "Крема", "slug": "creams"},
-        {"id": "cat-candle", "name": "Свечи", "slug": "candles"},
-        {"id": "cat-accessory", "name": "Аксессуары", "slug": "accessories"},
+        {"id": "cat-honey", "name": "Мёд", "slug": "honey", "order": 0},
+        {"id": "cat-bee", "name": "Пчелопродукты", "slug": "bee-products", "order": 1},
+        {"id": "cat-tincture", "name": "Настойки", "slug": "tinctures", "order": 2},
+        {"id": "cat-cream", "name": "Крема", "slug": "creams", "order": 3},
+        {"id": "cat-candle", "name": "Свечи", "slug": "candles", "order": 4},
+        {"id": "cat-accessory", "name": "Аксессуары", "slug": "accessories", "order": 5},
     ]
-    await db.categories.insert_many(categories)
+    await store.insert_categories(categories)
     
     honey_weights = [
         {"weight": "250гр", "price": 1201},
@@ -416,85 +1515,183 @@ async def seed_data():
         {"id": str(uuid.uuid4()), "name": "Подарочный набор", "description": "Красивая подарочная упаковка для мёда и пчелопродуктов.", "category_id": "cat-accessory", "image": "https://images.unsplash.com/photo-1722718465036-64e3eacef09b?w=800", "base_price": 1000, "weight_prices": [], "created_at": datetime.now(timezone.utc).isoformat()},
     ]
     
-    await db.products.insert_many(products)
+    await store.insert_products(products)
+    catalog.invalidate("categories", "products")
+    products_changed()
+    await cache_sync.publish("categories", "products")
     return {"message": "Data seeded successfully", "categories": len(categories), "products": len(products)}
 
 # Fix duplicate categories
 @api_router.post("/fix-categories")
 async def fix_categories():
-    # Delete all categories
-    await db.categories.delete_many({})
-    
-    # Insert unique categories
+    # Replace all categories with the unique set, keeping the ids products use
     categories = [
-        {"id": "cat-honey", "name": "Мёд", "slug": "honey"},
-        {"id": "cat-bee", "name": "Пчелопродукты", "slug": "bee-products"},
-        {"id": "cat-tincture", "name": "Настойки", "slug": "tinctures"},
-        {"id": "cat-cream", "name": "Крема", "slug": "creams"},
-        {"id": "cat-candle", "name": "Свечи", "slug": "candles"},
-        {"id": "cat-accessory", "name": "Аксессуары", "slug": "accessories"},
+        {"id": "cat-honey", "name": "Мёд", "slug": "honey", "order": 0},
+        {"id": "cat-bee", "name": "Пчелопродукты", "slug": "bee-products", "order": 1},
+        {"id": "cat-tincture", "name": "Настойки", "slug": "tinctures", "order": 2},
+        {"id": "cat-cream", "name": "Крема", "slug": "creams", "order": 3},
+        {"id": "cat-candle", "name": "Свечи", "slug": "candles", "order": 4},
+        {"id": "cat-accessory", "name": "Аксессуары", "slug": "accessories", "order": 5},
     ]
-    await db.categories.insert_many(categories)
+    await store.replace_categories(categories)
+    catalog.invalidate("categories")
+    await cache_sync.publish("categories")
     
     return {"message": "Categories fixed", "count": len(categories)}
 
 # Selective data deletion
 @api_router.delete("/data/orders")
 async def delete_all_orders(admin: str = Depends(verify_admin)):
-    result = await db.orders.delete_many({})
-    return {"message": "All orders deleted", "deleted_count": result.deleted_count}
+    deleted = await store.clear("orders")
+    await store.clear("stats")
+    return {"message": "All orders deleted", "deleted_count": deleted}
 
 @api_router.delete("/data/products")
 async def delete_all_products(admin: str = Depends(verify_admin)):
-    result = await db.products.delete_many({})
-    return {"message": "All products deleted", "deleted_count": result.deleted_count}
+    deleted = await store.clear("products")
+    catalog.invalidate("products")
+    products_changed()
+    await cache_sync.publish("products")
+    return {"message": "All products deleted", "deleted_count": deleted}
 
 @api_router.delete("/data/categories")
 async def delete_all_categories(admin: str = Depends(verify_admin)):
-    result = await db.categories.delete_many({})
-    return {"message": "All categories deleted", "deleted_count": result.deleted_count}
+    deleted = await store.clear("categories")
+    catalog.invalidate("categories")
+    await cache_sync.publish("categories")
+    return {"message": "All categories deleted", "deleted_count": deleted}
 
 @api_router.delete("/data/promocodes")
 async def delete_all_promocodes(admin: str = Depends(verify_admin)):
-    result = await db.promocodes.delete_many({})
-    return {"message": "All promocodes deleted", "deleted_count": result.deleted_count}
+    deleted = await store.clear("promocodes")
+    promo_cache.clear()
+    await cache_sync.publish("promocodes")
+    return {"message": "All promocodes deleted", "deleted_count": deleted}
 
 @api_router.delete("/data/about")
 async def delete_about(admin: str = Depends(verify_admin)):
-    result = await db.about.delete_many({})
-    return {"message": "About data deleted", "deleted_count": result.deleted_count}
+    deleted = await store.clear("about")
+    catalog.invalidate("about")
+    await cache_sync.publish("about")
+    return {"message": "About data deleted", "deleted_count": deleted}
 
 @api_router.delete("/data/all")
 async def delete_all_data(admin: str = Depends(verify_admin)):
-    orders = await db.orders.delete_many({})
-    products = await db.products.delete_many({})
-    categories = await db.categories.delete_many({})
-    promocodes = await db.promocodes.delete_many({})
-    about = await db.about.delete_many({})
+    orders = await store.clear("orders")
+    await store.clear("stats")
+    products = await store.clear("products")
+    categories = await store.clear("categories")
+    promocodes = await store.clear("promocodes")
+    promo_cache.clear()
+    about = await store.clear("about")
+    catalog.invalidate()
+    products_changed()
+    await cache_sync.publish(*CACHED_COLLECTIONS)
     return {
         "message": "All data deleted",
         "deleted": {
-            "orders": orders.deleted_count,
-            "products": products.deleted_count,
-            "categories": categories.deleted_count,
-            "promocodes": promocodes.deleted_count,
-            "about": about.deleted_count
+            "orders": orders,
+            "products": products,
+            "categories": categories,
+            "promocodes": promocodes,
+            "about": about
         }
     }
 
 app.include_router(api_router)
 
+@app.exception_handler(storage.Unavailable)
+async def storage_unavailable(request: Request, exc: storage.Unavailable):
+    # Every connection stayed busy for DB_POOL_TIMEOUT; the client may retry
+    return Response(
+        content=fast_json.dumps({"detail": str(exc)}),
+        status_code=503,
+        media_type="application/json",
+        headers={"Retry-After": "1"},
+    )
+
+app.add_middleware(compression.CompressionMiddleware, minimum_size=compression.MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+
+def route_template(scope) -> str:
+    """The matched route's path template, so /products/{product_id} is one series."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+def is_admin_authorization(authorization: str) -> bool:
+    """verify_admin for middleware, which runs outside FastAPI's dependencies."""
+    scheme, _, encoded = authorization.partition(" ")
+    if scheme.lower() != "basic":
+        return False
+    try:
+        username, _, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return False
+    return (secrets.compare_digest(username.encode(), ADMIN_USERNAME.encode())
+            and secrets.compare_digest(password.encode(), ADMIN_PASSWORD.encode()))
+
+app.add_middleware(
+    profiler.ProfilerMiddleware,
+    is_admin=is_admin_authorization,
+    route_name=route_template,
+    profiles=profile_store,
+    slow_seconds=SLOW_REQUEST_SECONDS,
 )
+# Outermost, so timings and sizes include compression and CORS
+app.add_middleware(metrics.MetricsMiddleware, route_name=route_template)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def run_migrations():
+    await store.setup()
+    await normalize_promocodes()
+    await seed_catalog()
+    await ensure_stats()
+    if order_queue is not None:
+        order_workers.extend(asyncio.create_task(order_worker()) for _ in range(ORDER_WORKERS))
+        order_workers.append(asyncio.create_task(purge_order_queue()))
+    order_workers.append(asyncio.create_task(cache_sync.run()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    # Claimed batches that are cut short are picked up again after the claim timeout
+    for task in order_workers:
+        task.cancel()
+    await store.close()
+    if image_pool is not None:
+        image_pool.shutdown(wait=False, cancel_futures=True)
+
+async def seed_command():
+    await store.setup()
+    return await seed_catalog()
+
+async def backfill_command():
+    await store.setup()
+    return await backfill_stats()
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "migrate-images":
+        count = asyncio.run(migrate_inline_images())
+        print(f"Migrated {count} inline product images to {IMAGES_DIR}")
+    elif command == "seed":
+        print(asyncio.run(seed_command())["message"])
+    elif command == "backfill-stats":
+        count = asyncio.run(backfill_command())
+        print(f"Rebuilt stats rollups from {count} orders")
+    else:
+        print("Usage: python server.py migrate-images|seed|backfill-stats")
+        sys.exit(1)
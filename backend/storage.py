@@ -0,0 +1,317 @@
+"""
+Storage backends behind the API routes.
+
+server.py reaches the database only through a Storage. MongoStorage
+(storage_mongo.py) runs on MongoDB through Motor. SQLiteStorage and
+MariaDBStorage (storage_sql.py) share one SQL implementation: SQLite is an
+embedded database file in WAL mode for single-box shops, and MariaDB keeps
+the schema of the shared-hosting deployment.
+
+Records cross the interface as plain dicts shaped like the API models
+(categories carry `order`, products carry `weight_prices`, orders carry
+`items`), so route code, caches and the JSON encoder see the same data on
+every backend. All methods are coroutines.
+"""
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+BACKENDS = ("mongo", "sqlite", "mariadb")
+# place_order(): waits before reading back the order that took our Idempotency-Key
+KEY_LOOKUP_DELAYS = (0, 0.05, 0.2)
+
+
+class DuplicateError(Exception):
+    """A write clashed with a unique key (promocode code, marker name)."""
+
+
+class BulkWriteFailed(Exception):
+    """An ordered bulk write stopped at `index`; everything before it was written."""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+class Unavailable(Exception):
+    """The database did not hand out a connection in time."""
+
+
+class PromocodeExhausted(Exception):
+    """place_order() found the order's promocode used up; nothing was written."""
+
+
+class IdempotencyConflict(Exception):
+    """place_order() lost its Idempotency-Key to an order it cannot read back (e.g. deleted since)."""
+
+
+class Storage(ABC):
+    name = ""
+
+    # Lifecycle
+    @abstractmethod
+    async def setup(self):
+        """Create missing tables/indexes; safe to run from every worker at startup."""
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @abstractmethod
+    async def index_report(self) -> dict:
+        """What setup() found or created, plus usage where the database reports it."""
+
+    @abstractmethod
+    async def pool_stats(self) -> dict:
+        ...
+
+    @abstractmethod
+    async def normalize_promocodes(self, normalize) -> List[str]:
+        """Rewrite stored codes with `normalize`; returns codes left alone because they would clash."""
+
+    # One-off markers (seeding, stats backfill)
+    @abstractmethod
+    async def claim_marker(self, name: str, value: str) -> bool:
+        """Create a marker; False if another worker already has it."""
+
+    @abstractmethod
+    async def set_marker(self, name: str, value: str):
+        ...
+
+    @abstractmethod
+    async def drop_marker(self, name: str):
+        ...
+
+    # Categories
+    @abstractmethod
+    async def list_categories(self) -> List[dict]:
+        """All categories in display order."""
+
+    @abstractmethod
+    async def category_ids(self) -> set:
+        ...
+
+    @abstractmethod
+    async def has_categories(self) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_category(self, category: dict) -> dict:
+        """Insert a category after the last one; returns it with its `order`."""
+
+    @abstractmethod
+    async def insert_categories(self, categories: List[dict]):
+        ...
+
+    @abstractmethod
+    async def replace_categories(self, categories: List[dict]):
+        """Make `categories` the whole list, keeping ids products point to."""
+
+    @abstractmethod
+    async def reorder_categories(self, category_ids: List[str]):
+        """Set `order` to each id's position, atomically where the database allows."""
+
+    @abstractmethod
+    async def update_category(self, category_id: str, fields: dict) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def delete_category(self, category_id: str) -> bool:
+        ...
+
+    # Products
+    @abstractmethod
+    async def list_products(self, category_id: Optional[str] = None,
+                            fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """Products, optionally of one category, with only `fields` when given."""
+
+    @abstractmethod
+    async def get_product(self, product_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find_products(self, ids: List[str], names: List[str]) -> List[dict]:
+        """`id` and `name` of products matching any of the ids or names."""
+
+    @abstractmethod
+    async def inline_image_products(self) -> List[dict]:
+        """`id` and `image` of products whose image is still a data: URL."""
+
+    @abstractmethod
+    async def insert_products(self, products: List[dict]):
+        ...
+
+    @abstractmethod
+    async def update_product(self, product_id: str, fields: dict) -> Optional[dict]:
+        """Apply `fields`; returns the updated product, or None if there is none."""
+
+    @abstractmethod
+    async def delete_product(self, product_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def write_products(self, operations: List[tuple]):
+        """Apply ("insert", product) and ("update", id, fields) in order.
+
+        Raises BulkWriteFailed at the first operation that fails.
+        """
+
+    # Promocodes
+    @abstractmethod
+    async def list_promocodes(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def find_promocode(self, code: str) -> Optional[dict]:
+        """The code's definition (id, code, discount_type, discount_value, is_active)."""
+
+    @abstractmethod
+    async def insert_promocode(self, promo: dict):
+        """Raises DuplicateError if the code exists."""
+
+    @abstractmethod
+    async def delete_promocode(self, promo_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def reserve_promocode(self, code: str, ttl: float,
+                                reservation_id: Optional[str] = None) -> Tuple[Optional[dict], Optional[dict]]:
+        """Hold one use of an active code for `ttl` seconds.
+
+        A live `reservation_id` of the same code is extended instead, so a cart
+        never holds more than one use. Returns (promocode, {"id", "expires_at"}),
+        or (None, None) when used up.
+        """
+
+    @abstractmethod
+    async def redeem_promocode(self, code: str, reservation_id: Optional[str] = None,
+                               order_id: Optional[str] = None) -> bool:
+        """Count one use, consuming the reservation if it is still live.
+
+        An expired reservation no longer holds capacity (its use may have gone
+        to another cart), so the use is then counted only if one is free. With
+        `order_id` the use is counted once per order: redeeming it again
+        returns True without counting.
+        """
+
+    # Orders
+    @abstractmethod
+    async def list_orders(self, filters: dict, after: Optional[Tuple[str, str]] = None,
+                          fields: Optional[List[str]] = None, limit: int = 100) -> List[dict]:
+        """Newest first. `filters` has date_from, date_to, promocode and phone;
+        `after` is the (created_at, id) of the last order of the previous page.
+        """
+
+    @abstractmethod
+    def iter_orders(self, filters: dict) -> AsyncIterator[dict]:
+        """Every matching order, oldest first, read in batches."""
+
+    @abstractmethod
+    async def insert_orders(self, orders: List[dict]) -> List[dict]:
+        """Insert orders, skipping ids already stored; returns the ones written."""
+
+    @abstractmethod
+    async def place_order(self, order: dict, idempotency_key: Optional[str] = None,
+                          reservation_id: Optional[str] = None) -> Tuple[dict, bool]:
+        """Redeem the order's promocode and insert the order, all or nothing.
+
+        Checkout without the intake queue. Sets promocode_status (redeemed or
+        unknown) and raises PromocodeExhausted when a known code has no use
+        left. Returns (order, created); a repeated idempotency_key returns the
+        order stored with it, or raises IdempotencyConflict if that order
+        cannot be found.
+        """
+
+    @abstractmethod
+    async def delete_order(self, order_id: str) -> Optional[dict]:
+        """Delete an order and return it."""
+
+    # Stats rollups
+    @abstractmethod
+    async def add_stats(self, totals: dict, top: dict, upsert: bool = True):
+        """Add counters per bucket ({bucket: counters}) and top lines
+        ({(bucket, kind, key, weight): line}); without upsert missing rows are skipped.
+        """
+
+    @abstractmethod
+    async def stats_totals(self, bucket: str) -> dict:
+        ...
+
+    @abstractmethod
+    async def stats_series(self, granularity: str, limit: int) -> List[dict]:
+        """Latest periods first."""
+
+    @abstractmethod
+    async def stats_top(self, bucket: str, kind: str, limit: int) -> List[dict]:
+        """Top lines ({name, weight, count, revenue}) with a positive count, largest first."""
+
+    # About page
+    @abstractmethod
+    async def get_about(self) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def save_about(self, about: dict):
+        ...
+
+    # Bulk deletion
+    @abstractmethod
+    async def clear(self, name: str) -> int:
+        """Delete everything in orders, products, categories, promocodes, about or stats."""
+
+    # Cache versions, shared by every process using the database
+    @abstractmethod
+    async def bump_versions(self, names: Iterable[str]) -> dict:
+        """Count one change to each name; returns {name: (new version, updated_at)}."""
+
+    @abstractmethod
+    async def cache_versions(self) -> dict:
+        """{name: (version, updated_at)} of every name changed so far; updated_at is an aware datetime."""
+
+    async def can_watch(self) -> bool:
+        """Whether watch_changes() works here; otherwise versions are polled."""
+        return False
+
+    async def watch_changes(self, names: Iterable[str]) -> AsyncIterator[set]:
+        """Names of collections as writes to them happen, from any client.
+
+        Also yields {"cache_versions"} when a version moves. Each write is
+        counted in cache_versions before its name is yielded, so edits made
+        outside the API move the versions too. Runs until the stream breaks,
+        which surfaces as an exception. Backends without change streams end
+        at once, and CacheSync polls instead.
+        """
+        return
+        yield  # makes this an async generator
+
+
+def from_env(environ, root) -> Storage:
+    """The backend chosen by STORAGE (mongo, sqlite or mariadb).
+
+    Drivers are imported here, so a deployment only needs the one it uses.
+    """
+    kind = environ.get("STORAGE", "mongo")
+    if kind == "mongo":
+        from storage_mongo import MongoStorage
+        return MongoStorage(environ["MONGO_URL"], environ["DB_NAME"])
+    if kind == "sqlite":
+        from storage_sql import SQLiteStorage
+        return SQLiteStorage(
+            environ.get("SQLITE_PATH") or str(root / "shop.db"),
+            threads=int(environ.get("DB_THREADS", 8)),
+        )
+    if kind == "mariadb":
+        from storage_sql import MariaDBStorage
+        return MariaDBStorage(
+            {
+                "host": environ.get("DB_HOST", "localhost"),
+                "port": int(environ.get("DB_PORT", 3306)),
+                "user": environ.get("DB_USER", "root"),
+                "password": environ.get("DB_PASSWORD", ""),
+                "database": environ.get("DB_NAME", "fermamedovik"),
+            },
+            pool_size=int(environ.get("DB_POOL_SIZE", 10)),
+            recycle=int(environ.get("DB_POOL_RECYCLE", 280)),
+            timeout=float(environ.get("DB_POOL_TIMEOUT", 10)),
+        )
+    raise ValueError(f"STORAGE must be one of {', '.join(BACKENDS)}, not {kind!r}")
@@ -0,0 +1,568 @@
+"""
+MongoDB storage through Motor.
+
+Documents are stored as the API shapes them, one collection per resource
+plus meta (markers) and stats/stats_top (order rollups). Promocode
+reservations live inside the promocode document, so capacity checks and
+redemption are single atomic updates.
+"""
+import asyncio
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+# (keys, unique[, create_index options]) per collection; every lookup and sort below is covered
+REQUIRED_INDEXES = {
+    "products": [
+        ([("id", 1)], True),
+        ([("category_id", 1)], False),
+    ],
+    "categories": [
+        ([("id", 1)], True),
+        ([("order", 1)], False),
+    ],
+    "promocodes": [
+        ([("id", 1)], True),
+        ([("code", 1)], True),
+    ],
+    "orders": [
+        ([("id", 1)], True),
+        ([("created_at", -1), ("id", -1)], False),
+        ([("promocode", 1), ("created_at", -1), ("id", -1)], False),
+        ([("customer_phone", 1), ("created_at", -1), ("id", -1)], False),
+        # Only orders placed without the intake queue carry a key
+        ([("idempotency_key", 1)], True, {"partialFilterExpression": {"idempotency_key": {"$type": "string"}}}),
+    ],
+    "about": [
+        ([("id", 1)], True),
+    ],
+    "meta": [
+        ([("id", 1)], True),
+    ],
+    "stats": [
+        ([("granularity", 1), ("period", -1)], False),
+    ],
+    "stats_top": [
+        ([("bucket", 1), ("kind", 1), ("count", -1)], False),
+    ],
+}
+CLEARABLE = ("orders", "products", "categories", "promocodes", "about")
+PROMO_DEFINITION = {"_id": 0, "id": 1, "code": 1, "discount_type": 1, "discount_value": 1, "is_active": 1}
+ACTIVE_PROMO = {"is_active": {"$ne": False}}
+ORDER_PROJECTION = {"_id": 0, "idempotency_key": 0}
+EXPORT_BATCH = 500
+# Promocode fields find_promocode() returns; uses and reservations change on every order
+PROMO_DEFINITION_FIELDS = ("code", "discount_type", "discount_value", "is_active")
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo listener; register with MongoClient(event_listeners=[...])."""
+
+    def __init__(self):
+        self._collections = {}  # (connection, request id) -> collection of a running command
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        metrics.record_db_operation(event.command_name, collection, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+def projection(fields) -> dict:
+    return {"_id": 0, **{name: 1 for name in fields}} if fields else {"_id": 0}
+
+
+def order_query(filters: dict) -> dict:
+    query = {}
+    if filters.get("date_from") or filters.get("date_to"):
+        query["created_at"] = {}
+        if filters.get("date_from"):
+            query["created_at"]["$gte"] = filters["date_from"]
+        if filters.get("date_to"):
+            query["created_at"]["$lt"] = filters["date_to"]
+    if filters.get("promocode"):
+        query["promocode"] = filters["promocode"]
+    if filters.get("phone"):
+        query["customer_phone"] = filters["phone"]
+    return query
+
+
+# Promocode reservations: {"id", "expires_at"} entries in the promocode document
+def live_reservations(now: datetime) -> dict:
+    return {"$filter": {
+        "input": {"$ifNull": ["$reservations", []]},
+        "as": "r",
+        "cond": {"$gt": ["$$r.expires_at", now]},
+    }}
+
+
+def has_capacity(now: datetime) -> dict:
+    return {"$lt": [{"$add": ["$current_uses", {"$size": live_reservations(now)}]}, "$max_uses"]}
+
+
+def change_filter(names) -> list:
+    """Change stream pipeline for writes to `names` that can affect a cache."""
+    definition_changed = [
+        {f"updateDescription.updatedFields.{field}": {"$exists": True}} for field in PROMO_DEFINITION_FIELDS
+    ]
+    return [{"$match": {
+        "ns.coll": {"$in": list(names)},
+        "$or": [{"ns.coll": {"$ne": "promocodes"}}, {"operationType": {"$ne": "update"}}, *definition_changed],
+    }}]
+
+
+class MongoStorage(storage.Storage):
+    name = "mongo"
+
+    def __init__(self, url: str, db_name: str):
+        self.client = AsyncIOMotorClient(url, event_listeners=[CommandMetrics()])
+        self.db = self.client[db_name]
+        self.indexes = {}
+        self._transactions = None  # only on replica sets / sharded clusters
+
+    # Lifecycle
+    async def setup(self):
+        """Create missing indexes and record what was found for index_report()."""
+        for name, specs in REQUIRED_INDEXES.items():
+            collection = self.db[name]
+            info = await collection.index_information()
+            existing = {
+                tuple((field, int(direction)) for field, direction in index["key"]): index
+                for index in info.values()
+            }
+            results = []
+            for keys, unique, *options in specs:
+                entry = {"key": dict(keys), "unique": unique}
+                found = existing.get(tuple(keys))
+                if found is not None:
+                    if bool(found.get("unique")) == unique:
+                        entry["status"] = "ok"
+                    else:
+                        entry["status"] = "conflict"
+                        logger.warning("Index %s on %s exists with unique=%s", keys, name, bool(found.get("unique")))
+                else:
+                    try:
+                        await collection.create_index(keys, unique=unique, **(options[0] if options else {}))
+                        entry["status"] = "created"
+                        logger.info("Created index %s on %s", keys, name)
+                    except OperationFailure as e:
+                        entry["status"] = "failed"
+                        entry["error"] = str(e)
+                        logger.error("Could not create index %s on %s: %s", keys, name, e)
+                results.append(entry)
+            self.indexes[name] = results
+
+    async def close(self):
+        self.client.close()
+
+    async def index_report(self) -> dict:
+        usage = {}
+        for name in REQUIRED_INDEXES:
+            stats = await self.db[name].aggregate([{"$indexStats": {}}]).to_list(None)
+            usage[name] = [
+                {
+                    "name": s["name"],
+                    "key": dict(s["key"]),
+                    "ops": s["accesses"]["ops"],
+                    "since": s["accesses"]["since"].isoformat(),
+                }
+                for s in stats
+            ]
+        return {"indexes": self.indexes, "usage": usage}
+
+    async def pool_stats(self) -> dict:
+        options = self.client.options.pool_options
+        return {"max_size": options.max_pool_size, "min_size": options.min_pool_size}
+
+    async def normalize_promocodes(self, normalize) -> List[str]:
+        clashes = []
+        async for promo in self.db.promocodes.find({"code": {"$regex": "[a-zа-яё]"}}, {"_id": 0, "id": 1, "code": 1}):
+            try:
+                await self.db.promocodes.update_one({"id": promo["id"]}, {"$set": {"code": normalize(promo["code"])}})
+            except DuplicateKeyError:
+                clashes.append(promo["code"])
+        return clashes
+
+    async def replica_set(self) -> bool:
+        """Whether the deployment has an oplog (replica set or sharded cluster)."""
+        if self._transactions is None:
+            hello = await self.client.admin.command("hello")
+            self._transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._transactions
+
+    async def run_in_transaction(self, operation):
+        """Run `operation(session)` inside a transaction when the deployment has them."""
+        if not await self.replica_set():
+            return await operation(None)
+        async with await self.client.start_session() as session:
+            async with session.start_transaction():
+                return await operation(session)
+
+    # Markers
+    async def claim_marker(self, name: str, value: str) -> bool:
+        try:
+            await self.db.meta.insert_one({
+                "id": name, "state": value, "updated_at": datetime.now(timezone.utc).isoformat(),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def set_marker(self, name: str, value: str):
+        await self.db.meta.update_one(
+            {"id": name},
+            {"$set": {"state": value, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        )
+
+    async def drop_marker(self, name: str):
+        await self.db.meta.delete_one({"id": name})
+
+    # Categories
+    async def list_categories(self) -> List[dict]:
+        return await self.db.categories.find({}, projection(("id", "name", "slug", "order"))).sort("order", 1).to_list(100)
+
+    async def category_ids(self) -> set:
+        return set(await self.db.categories.distinct("id"))
+
+    async def has_categories(self) -> bool:
+        return bool(await self.db.categories.count_documents({}, limit=1))
+
+    async def add_category(self, category: dict) -> dict:
+        last = await self.db.categories.find_one(sort=[("order", -1)])
+        category = {**category, "order": (last.get("order", 0) + 1) if last else 0}
+        await self.db.categories.insert_one(dict(category))
+        return category
+
+    async def insert_categories(self, categories: List[dict]):
+        await self.db.categories.insert_many([dict(c) for c in categories])
+
+    async def replace_categories(self, categories: List[dict]):
+        await self.db.categories.delete_many({})
+        await self.insert_categories(categories)
+
+    async def reorder_categories(self, category_ids: List[str]):
+        operations = [
+            UpdateOne({"id": cat_id}, {"$set": {"order": index}})
+            for index, cat_id in enumerate(category_ids)
+        ]
+        if operations:
+            await self.run_in_transaction(
+                lambda session: self.db.categories.bulk_write(operations, ordered=True, session=session)
+            )
+
+    async def update_category(self, category_id: str, fields: dict) -> Optional[dict]:
+        return await self.db.categories.find_one_and_update(
+            {"id": category_id}, {"$set": fields},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete_category(self, category_id: str) -> bool:
+        result = await self.db.categories.delete_one({"id": category_id})
+        return result.deleted_count == 1
+
+    # Products
+    async def list_products(self, category_id=None, fields=None) -> List[dict]:
+        query = {"category_id": category_id} if category_id else {}
+        return await self.db.products.find(query, projection(fields)).to_list(None)
+
+    async def get_product(self, product_id: str) -> Optional[dict]:
+        return await self.db.products.find_one({"id": product_id}, {"_id": 0})
+
+    async def find_products(self, ids: List[str], names: List[str]) -> List[dict]:
+        query = {"$or": [{"id": {"$in": ids}}, {"name": {"$in": names}}]}
+        return await self.db.products.find(query, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+
+    async def inline_image_products(self) -> List[dict]:
+        return await self.db.products.find({"image": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "image": 1}).to_list(None)
+
+    async def insert_products(self, products: List[dict]):
+        await self.db.products.insert_many([dict(p) for p in products])
+
+    async def update_product(self, product_id: str, fields: dict) -> Optional[dict]:
+        return await self.db.products.find_one_and_update(
+            {"id": product_id}, {"$set": fields},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete_product(self, product_id: str) -> bool:
+        result = await self.db.products.delete_one({"id": product_id})
+        return result.deleted_count == 1
+
+    async def write_products(self, operations: List[tuple]):
+        ops = [
+            InsertOne(dict(op[1])) if op[0] == "insert" else UpdateOne({"id": op[1]}, {"$set": op[2]})
+            for op in operations
+        ]
+        if not ops:
+            return
+        try:
+            await self.db.products.bulk_write(ops, ordered=True)
+        except BulkWriteError as e:
+            first = e.details["writeErrors"][0]
+            raise storage.BulkWriteFailed(first["index"], first["errmsg"])
+
+    # Promocodes
+    async def list_promocodes(self) -> List[dict]:
+        fields = ("id", "code", "discount_type", "discount_value", "max_uses", "current_uses", "is_active")
+        return await self.db.promocodes.find({}, projection(fields)).to_list(100)
+
+    async def find_promocode(self, code: str) -> Optional[dict]:
+        return await self.db.promocodes.find_one({"code": code}, PROMO_DEFINITION)
+
+    async def insert_promocode(self, promo: dict):
+        try:
+            await self.db.promocodes.insert_one(dict(promo))
+        except DuplicateKeyError:
+            raise storage.DuplicateError(promo["code"])
+
+    async def delete_promocode(self, promo_id: str) -> bool:
+        result = await self.db.promocodes.delete_one({"id": promo_id})
+        return result.deleted_count == 1
+
+    async def reserve_promocode(self, code: str, ttl: float, reservation_id=None):
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=ttl)
+        if reservation_id:
+            # The cart's own live reservation already holds a use
+            promo = await self.db.promocodes.find_one_and_update(
+                {"code": code, **ACTIVE_PROMO,
+                 "reservations": {"$elemMatch": {"id": reservation_id, "expires_at": {"$gt": now}}}},
+                {"$set": {"reservations.$.expires_at": expires_at}},
+                projection={"_id": 0, "reservations": 0},
+                return_document=ReturnDocument.AFTER,
+            )
+            if promo:
+                return promo, {"id": reservation_id, "expires_at": expires_at}
+        reservation = {"id": str(uuid.uuid4()), "expires_at": expires_at}
+        promo = await self.db.promocodes.find_one_and_update(
+            {"code": code, **ACTIVE_PROMO, "$expr": has_capacity(now)},
+            [{"$set": {"reservations": {"$concatArrays": [live_reservations(now), {"$literal": [reservation]}]}}}],
+            projection={"_id": 0, "reservations": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        return (promo, reservation) if promo else (None, None)
+
+    async def redeem_promocode(self, code: str, reservation_id=None, order_id=None) -> bool:
+        # Redemptions: {"_id": order id, "code", "redeemed_at"}, one per order that counted a use
+        if order_id and await self.db.promocode_redemptions.find_one({"_id": order_id}):
+            # A reclaimed copy of the same queued order counted its use already
+            return True
+        redeemed = await self._count_use(code, reservation_id)
+        if redeemed and order_id:
+            try:
+                await self.db.promocode_redemptions.insert_one(
+                    {"_id": order_id, "code": code, "redeemed_at": datetime.now(timezone.utc)}
+                )
+            except DuplicateKeyError:
+                # A concurrent copy got here first; give back the use we counted
+                await self.db.promocodes.update_one({"code": code}, {"$inc": {"current_uses": -1}})
+        return redeemed
+
+    async def _count_use(self, code: str, reservation_id) -> bool:
+        now = datetime.now(timezone.utc)
+        if reservation_id:
+            result = await self.db.promocodes.update_one(
+                {"code": code, **ACTIVE_PROMO,
+                 "reservations": {"$elemMatch": {"id": reservation_id, "expires_at": {"$gt": now}}}},
+                {"$inc": {"current_uses": 1}, "$pull": {"reservations": {"id": reservation_id}}},
+            )
+            if result.modified_count:
+                return True
+        result = await self.db.promocodes.update_one(
+            {"code": code, **ACTIVE_PROMO, "$expr": has_capacity(now)},
+            [{"$set": {
+                "current_uses": {"$add": ["$current_uses", 1]},
+                "reservations": live_reservations(now),
+            }}],
+        )
+        return result.modified_count == 1
+
+    # Orders
+    async def list_orders(self, filters, after=None, fields=None, limit=100) -> List[dict]:
+        query = order_query(filters)
+        if after:
+            created_at, order_id = after
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": order_id}},
+            ]
+        names = list(fields) + ["id", "created_at"] if fields else None
+        return await self.db.orders.find(query, projection(names) if names else ORDER_PROJECTION).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit).to_list(limit)
+
+    async def iter_orders(self, filters):
+        cursor = self.db.orders.find(order_query(filters), ORDER_PROJECTION)
+        async for order in cursor.sort([("created_at", 1), ("id", 1)]).batch_size(EXPORT_BATCH):
+            yield order
+
+    async def insert_orders(self, orders: List[dict]) -> List[dict]:
+        try:
+            await self.db.orders.insert_many([dict(o) for o in orders], ordered=False)
+        except BulkWriteError as e:
+            # Orders written by an earlier attempt of the batch hit the unique id index
+            details = e.details
+            if details.get("writeConcernErrors") or any(err["code"] != 11000 for err in details["writeErrors"]):
+                raise
+            duplicates = {err["index"] for err in details["writeErrors"]}
+            return [order for i, order in enumerate(orders) if i not in duplicates]
+        return orders
+
+    async def place_order(self, order: dict, idempotency_key=None, reservation_id=None):
+        if idempotency_key:
+            existing = await self.db.orders.find_one({"idempotency_key": idempotency_key}, ORDER_PROJECTION)
+            if existing:
+                return existing, False
+        order = dict(order)
+        code = order.get("promocode")
+        redeemed = False
+        if code:
+            if await self.redeem_promocode(code, reservation_id, order["id"]):
+                order["promocode_status"] = "redeemed"
+                redeemed = True
+            elif await self.find_promocode(code):
+                raise storage.PromocodeExhausted(code)
+            else:
+                order["promocode_status"] = "unknown"
+        document = {**order, "idempotency_key": idempotency_key} if idempotency_key else dict(order)
+        try:
+            await self.db.orders.insert_one(document)
+        except Exception as e:
+            # No order was written; give back the use counted above
+            if redeemed:
+                await self.db.promocodes.update_one({"code": code}, {"$inc": {"current_uses": -1}})
+                await self.db.promocode_redemptions.delete_one({"_id": order["id"]})
+            if not isinstance(e, DuplicateKeyError):
+                raise
+        else:
+            return order, True
+        # A concurrent retry with the same key won; answer with its order
+        for delay in storage.KEY_LOOKUP_DELAYS:
+            await asyncio.sleep(delay)
+            existing = await self.db.orders.find_one({"idempotency_key": idempotency_key}, ORDER_PROJECTION)
+            if existing:
+                return existing, False
+        raise storage.IdempotencyConflict(idempotency_key)
+
+    async def delete_order(self, order_id: str) -> Optional[dict]:
+        return await self.db.orders.find_one_and_delete({"id": order_id}, ORDER_PROJECTION)
+
+    # Stats rollups: one counter document per bucket, one per top line
+    async def add_stats(self, totals: dict, top: dict, upsert: bool = True):
+        stats_ops = []
+        for bucket, counters in totals.items():
+            granularity, _, period = bucket.partition(":")
+            stats_ops.append(UpdateOne(
+                {"_id": bucket},
+                {"$inc": counters, "$setOnInsert": {"granularity": granularity, "period": period or bucket}},
+                upsert=upsert,
+            ))
+        top_ops = [
+            UpdateOne(
+                {"_id": "|".join(key)},
+                {"$inc": {"count": line["count"], "revenue": line["revenue"]},
+                 "$set": {"bucket": key[0], "kind": key[1], "name": line["name"], "weight": line["weight"]}},
+                upsert=upsert,
+            )
+            for key, line in top.items()
+        ]
+        if stats_ops:
+            await self.db.stats.bulk_write(stats_ops, ordered=False)
+        if top_ops:
+            await self.db.stats_top.bulk_write(top_ops, ordered=False)
+
+    async def stats_totals(self, bucket: str) -> dict:
+        return await self.db.stats.find_one({"_id": bucket}) or {}
+
+    async def stats_series(self, granularity: str, limit: int) -> List[dict]:
+        return await self.db.stats.find({"granularity": granularity}).sort("period", -1).to_list(limit)
+
+    async def stats_top(self, bucket: str, kind: str, limit: int) -> List[dict]:
+        return await self.db.stats_top.find(
+            {"bucket": bucket, "kind": kind, "count": {"$gt": 0}}, {"_id": 0, "bucket": 0, "kind": 0}
+        ).sort("count", -1).to_list(limit)
+
+    # About page
+    async def get_about(self) -> Optional[dict]:
+        return await self.db.about.find_one({"id": "about-us"}, {"_id": 0})
+
+    async def save_about(self, about: dict):
+        await self.db.about.update_one({"id": "about-us"}, {"$set": {**about, "id": "about-us"}}, upsert=True)
+
+    async def clear(self, name: str) -> int:
+        if name == "stats":
+            result = await self.db.stats.delete_many({})
+            await self.db.stats_top.delete_many({})
+            return result.deleted_count
+        if name not in CLEARABLE:
+            raise ValueError(f"Unknown collection {name!r}")
+        if name == "promocodes":
+            await self.db.promocode_redemptions.delete_many({})
+        result = await self.db[name].delete_many({})
+        return result.deleted_count
+
+    # Cache versions: {"_id": name, "version", "updated_at"}
+    async def bump_versions(self, names) -> dict:
+        versions = {}
+        for name in names:
+            doc = await self.db.cache_versions.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            versions[name] = (doc["version"], datetime.fromisoformat(doc["updated_at"]))
+        return versions
+
+    async def cache_versions(self) -> dict:
+        return {
+            doc["_id"]: (doc["version"], datetime.fromisoformat(doc["updated_at"]))
+            async for doc in self.db.cache_versions.find({}, {"version": 1, "updated_at": 1})
+        }
+
+    async def can_watch(self) -> bool:
+        # Change streams read the oplog
+        return await self.replica_set()
+
+    async def watch_changes(self, names):
+        async with self.db.watch(change_filter([*names, "cache_versions"])) as stream:
+            async for change in stream:
+                name = change["ns"]["coll"]
+                if name != "cache_versions":
+                    await self._count_change(name, change["clusterTime"])
+                yield {name}
+
+    async def _count_change(self, name: str, cluster_time):
+        """Bump `name` once per write, however many processes watch it."""
+        try:
+            await self.db.cache_versions.update_one(
+                {"_id": name, "change": {"$not": {"$gte": cluster_time}}},
+                {"$inc": {"version": 1},
+                 "$set": {"updated_at": datetime.now(timezone.utc).isoformat(), "change": cluster_time}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass  # another watcher already counted this write
@@ -0,0 +1,1299 @@
+"""
+SQL storage: an embedded SQLite file or MariaDB.
+
+Both run the same queries on the same normalized schema (weight_prices and
+order_items child tables, promocode reservations and redemptions, stats rollups,
+meta markers), the one the MariaDB deployment has always used. The
+subclasses differ only in connections, DDL and a handful of statements:
+upserts, INSERT IGNORE, row locks and how timestamps are stored.
+
+SQLite runs in WAL mode, so readers never wait for the writer and a
+single-box shop needs no database server at all.
+
+The drivers block. Every storage call runs as one transaction on one
+thread of the storage's own executor, sized to the connection pool, so a
+call never waits for a connection another call is holding.
+"""
+import asyncio
+import contextvars
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List, Optional
+
+try:
+    import pymysql
+    from pymysql.constants import SERVER_STATUS
+except ImportError:  # PyMySQL not installed: SQLite only
+    pymysql = None
+
+import metrics
+import storage
+
+TABLES = (
+    "categories", "products", "weight_prices", "promocodes", "promocode_reservations", "promocode_redemptions",
+    "orders", "order_items", "about", "meta", "stats", "stats_top", "cache_versions",
+)
+PRODUCT_COLUMNS = ("id", "name", "description", "category_id", "image", "base_price", "created_at")
+ORDER_COLUMNS = (
+    "id", "customer_name", "customer_phone", "subtotal", "discount", "total",
+    "promocode", "promocode_status", "created_at",
+)
+# Written on insert but never returned: the key only matters to place_order()
+ORDER_INSERT_COLUMNS = ORDER_COLUMNS + ("idempotency_key",)
+PROMOCODE_COLUMNS = ("id", "code", "discount_type", "discount_value", "max_uses", "current_uses", "is_active")
+STATS_COUNTERS = ("orders", "revenue", "discount", "items")
+# Tables emptied by clear(name), children first; the count comes from the last one
+CLEAR_TABLES = {
+    "orders": ("order_items", "orders"),
+    "products": ("weight_prices", "products"),
+    "categories": ("categories",),
+    "promocodes": ("promocode_redemptions", "promocode_reservations", "promocodes"),
+    "about": ("about",),
+    "stats": ("stats_top", "stats"),
+}
+EXPORT_BATCH = 500
+VERB_RE = re.compile(r"\s*(\w+)")
+TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+`?(\w+)", re.IGNORECASE)
+LIVE_RESERVATIONS = """(SELECT COUNT(*) FROM promocode_reservations r
+    WHERE r.promocode_id = promocodes.id AND r.expires_at > %s)"""
+
+
+def placeholders(values) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+class KeyTaken(Exception):
+    """A concurrent checkout with the same Idempotency-Key committed first."""
+
+
+class Session:
+    """One connection for the length of a storage call; statements are timed into metrics."""
+
+    def __init__(self, store, conn):
+        self.store = store
+        self.conn = conn
+
+    def execute(self, sql: str, params=()):
+        return self._run("execute", sql, params)
+
+    def executemany(self, sql: str, rows):
+        rows = list(rows)
+        if rows:
+            self._run("executemany", sql, rows)
+
+    def _run(self, method: str, sql: str, params):
+        verb = VERB_RE.match(sql)
+        table = TABLE_RE.search(sql)
+        cursor = self.conn.cursor()
+        start = time.perf_counter()
+        failed = True
+        try:
+            getattr(cursor, method)(self.store.sql(sql), params)
+            failed = False
+            return cursor
+        finally:
+            metrics.record_db_operation(
+                verb.group(1).lower() if verb else "", table.group(1) if table else "",
+                time.perf_counter() - start, failed,
+            )
+
+    def all(self, sql: str, params=()) -> List[dict]:
+        return [self.store.row(r) for r in self.execute(sql, params).fetchall()]
+
+    def one(self, sql: str, params=()) -> Optional[dict]:
+        row = self.execute(sql, params).fetchone()
+        return None if row is None else self.store.row(row)
+
+
+class SQLStorage(storage.Storage):
+    insert_ignore = "INSERT IGNORE"
+    lock_rows = " FOR UPDATE"
+    integrity_errors = ()
+
+    def __init__(self, threads: int):
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"{self.name}-storage")
+
+    # Dialect hooks
+    @abstractmethod
+    def schema(self) -> List[str]:
+        ...
+
+    def migrate(self, s: Session):
+        """Changes to tables that CREATE TABLE IF NOT EXISTS leaves alone."""
+
+    @abstractmethod
+    def upsert(self, table: str, columns, keys, add=(), assign=()) -> str:
+        """INSERT that adds `add` columns to and overwrites `assign` columns of an existing row."""
+
+    @abstractmethod
+    def store_time(self, value: datetime):
+        ...
+
+    @abstractmethod
+    def indexes(self, s: Session, table: str) -> List[dict]:
+        ...
+
+    def sql(self, sql: str) -> str:
+        return sql
+
+    @abstractmethod
+    def _acquire(self):
+        ...
+
+    @abstractmethod
+    def _release(self, conn, healthy: bool):
+        ...
+
+    def _begin(self, conn, write: bool):
+        pass
+
+    def _commit(self, conn):
+        conn.commit()
+
+    def _rollback(self, conn, error: BaseException) -> bool:
+        """Roll back after `error`; False if the connection should not be reused."""
+        conn.rollback()
+        return True
+
+    # Plumbing
+    def row(self, row) -> dict:
+        row = dict(row)
+        for key, value in row.items():
+            if isinstance(value, Decimal):
+                row[key] = float(value)
+            elif isinstance(value, datetime):
+                row[key] = value.isoformat()
+        return row
+
+    def db_time(self, value):
+        """A timestamp (datetime or ISO string) as DATETIME columns store it."""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return self.store_time(value)
+
+    def read_time(self, value: Optional[str]) -> Optional[datetime]:
+        """A stored timestamp as an aware datetime; zoneless DATETIME values are local time."""
+        if value is None:
+            return None
+        value = datetime.fromisoformat(value)
+        return value if value.tzinfo else value.astimezone()
+
+    def filter_time(self, value: str):
+        # Anything that is not an ISO timestamp is compared as given
+        try:
+            return self.db_time(value)
+        except ValueError:
+            return value
+
+    def _transaction(self, fn, args, write: bool):
+        conn = self._acquire()
+        healthy = True
+        try:
+            self._begin(conn, write)
+            result = fn(Session(self, conn), *args)
+            self._commit(conn)
+            return result
+        except BaseException as e:
+            healthy = self._rollback(conn, e)
+            raise
+        finally:
+            self._release(conn, healthy)
+
+    async def _call(self, fn, *args, write: bool = False):
+        # The context travels along so statements are charged to the current request
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, context.run, self._transaction, fn, args, write)
+
+    async def _read(self, fn, *args):
+        return await self._call(fn, *args)
+
+    async def _write(self, fn, *args):
+        return await self._call(fn, *args, write=True)
+
+    # Lifecycle
+    async def setup(self):
+        await self._write(self._setup)
+
+    def _setup(self, s: Session):
+        for statement in self.schema():
+            s.execute(statement)
+        self.migrate(s)
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def index_report(self) -> dict:
+        indexes = await self._read(lambda s: {table: self.indexes(s, table) for table in TABLES})
+        # Neither database keeps per-index usage counters we could report
+        return {"indexes": indexes, "usage": {}}
+
+    async def normalize_promocodes(self, normalize) -> List[str]:
+        return await self._write(self._normalize_promocodes, normalize)
+
+    def _normalize_promocodes(self, s: Session, normalize) -> List[str]:
+        clashes = []
+        for promo in s.all("SELECT id, code FROM promocodes"):
+            code = normalize(promo["code"])
+            if code == promo["code"]:
+                continue
+            try:
+                s.execute("UPDATE promocodes SET code=%s WHERE id=%s", (code, promo["id"]))
+            except self.integrity_errors:
+                clashes.append(promo["code"])
+        return clashes
+
+    # Markers
+    async def claim_marker(self, name: str, value: str) -> bool:
+        return await self._write(self._claim_marker, name, value)
+
+    def _claim_marker(self, s: Session, name: str, value: str) -> bool:
+        cursor = s.execute(
+            f"{self.insert_ignore} INTO meta (id, value, updated_at) VALUES (%s, %s, %s)",
+            (name, value, self.db_time(datetime.now(timezone.utc))),
+        )
+        return cursor.rowcount == 1
+
+    async def set_marker(self, name: str, value: str):
+        await self._write(lambda s: s.execute(
+            "UPDATE meta SET value=%s, updated_at=%s WHERE id=%s",
+            (value, self.db_time(datetime.now(timezone.utc)), name),
+        ))
+
+    async def drop_marker(self, name: str):
+        await self._write(lambda s: s.execute("DELETE FROM meta WHERE id=%s", (name,)))
+
+    # Categories
+    async def list_categories(self) -> List[dict]:
+        return await self._read(lambda s: s.all(
+            "SELECT id, name, slug, sort_order AS `order` FROM categories ORDER BY sort_order, name"
+        ))
+
+    async def category_ids(self) -> set:
+        return await self._read(lambda s: {row["id"] for row in s.all("SELECT id FROM categories")})
+
+    async def has_categories(self) -> bool:
+        return await self._read(lambda s: s.one("SELECT 1 AS found FROM categories LIMIT 1") is not None)
+
+    async def add_category(self, category: dict) -> dict:
+        return await self._write(self._add_category, category)
+
+    def _add_category(self, s: Session, category: dict) -> dict:
+        # The new category goes to the end of the list
+        s.execute(
+            """INSERT INTO categories (id, name, slug, sort_order)
+               SELECT %s, %s, %s, COALESCE(MAX(sort_order) + 1, 0) FROM categories""",
+            (category["id"], category["name"], category["slug"]),
+        )
+        row = s.one("SELECT sort_order FROM categories WHERE id=%s", (category["id"],))
+        return {**category, "order": row["sort_order"]}
+
+    def _insert_categories(self, s: Session, categories: List[dict]):
+        s.executemany(
+            "INSERT INTO categories (id, name, slug, sort_order) VALUES (%s, %s, %s, %s)",
+            [(c["id"], c["name"], c["slug"], c.get("order", 0)) for c in categories],
+        )
+
+    async def insert_categories(self, categories: List[dict]):
+        await self._write(self._insert_categories, categories)
+
+    async def replace_categories(self, categories: List[dict]):
+        await self._write(self._replace_categories, categories)
+
+    def _replace_categories(self, s: Session, categories: List[dict]):
+        # Upsert rather than delete-and-insert: deleting would null products' category_id
+        s.executemany(
+            self.upsert("categories", ("id", "name", "slug", "sort_order"), ("id",),
+                        assign=("name", "slug", "sort_order")),
+            [(c["id"], c["name"], c["slug"], c.get("order", 0)) for c in categories],
+        )
+        ids = [c["id"] for c in categories]
+        if ids:
+            s.execute(f"DELETE FROM categories WHERE id NOT IN ({placeholders(ids)})", ids)
+        else:
+            s.execute("DELETE FROM categories")
+
+    async def reorder_categories(self, category_ids: List[str]):
+        if category_ids:
+            await self._write(self._reorder_categories, category_ids)
+
+    def _reorder_categories(self, s: Session, category_ids: List[str]):
+        # One UPDATE, so readers see either the old order or the new one
+        cases = " ".join(["WHEN %s THEN %s"] * len(category_ids))
+        params = [value for index, cat_id in enumerate(category_ids) for value in (cat_id, index)]
+        s.execute(
+            f"UPDATE categories SET sort_order = CASE id {cases} END WHERE id IN ({placeholders(category_ids)})",
+            params + list(category_ids),
+        )
+
+    async def update_category(self, category_id: str, fields: dict) -> Optional[dict]:
+        return await self._write(self._update_category, category_id, fields)
+
+    def _update_category(self, s: Session, category_id: str, fields: dict) -> Optional[dict]:
+        columns = {("sort_order" if k == "order" else k): v for k, v in fields.items() if k in ("name", "slug", "order")}
+        if columns:
+            s.execute(
+                f"UPDATE categories SET {', '.join(f'{c}=%s' for c in columns)} WHERE id=%s",
+                [*columns.values(), category_id],
+            )
+        return s.one("SELECT id, name, slug, sort_order AS `order` FROM categories WHERE id=%s", (category_id,))
+
+    async def delete_category(self, category_id: str) -> bool:
+        return await self._write(lambda s: s.execute("DELETE FROM categories WHERE id=%s", (category_id,)).rowcount == 1)
+
+    # Products
+    def _products(self, s: Session, where: str = "", params=(), fields=None) -> List[dict]:
+        columns = [c for c in PRODUCT_COLUMNS if fields is None or c in fields or c == "id"]
+        products = s.all(f"SELECT {', '.join(columns)} FROM products {where} ORDER BY created_at, id", params)
+        if fields is None or "weight_prices" in fields:
+            # Weights of every product in one query
+            weight_prices = self._weight_prices(s, [p["id"] for p in products])
+            for product in products:
+                product["weight_prices"] = weight_prices[product["id"]]
+        return products
+
+    def _weight_prices(self, s: Session, product_ids: List[str]) -> dict:
+        result = {product_id: [] for product_id in product_ids}
+        if product_ids:
+            rows = s.all(
+                f"""SELECT product_id, weight, price FROM weight_prices
+                    WHERE product_id IN ({placeholders(product_ids)}) ORDER BY product_id, sort_order, id""",
+                product_ids,
+            )
+            for row in rows:
+                result[row.pop("product_id")].append(row)
+        return result
+
+    def _insert_weight_prices(self, s: Session, products: List[dict]):
+        s.executemany(
+            "INSERT INTO weight_prices (product_id, weight, price, sort_order) VALUES (%s, %s, %s, %s)",
+            [
+                (p["id"], wp["weight"], wp["price"], i)
+                for p in products for i, wp in enumerate(p.get("weight_prices") or [])
+            ],
+        )
+
+    def _insert_products(self, s: Session, products: List[dict]):
+        s.executemany(
+            """INSERT INTO products (id, name, description, category_id, image, base_price, created_at)
+               VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+            [
+                (p["id"], p["name"], p.get("description", ""), p["category_id"], p.get("image", ""),
+                 p["base_price"], self.db_time(p["created_at"]))
+                for p in products
+            ],
+        )
+        self._insert_weight_prices(s, products)
+
+    def _update_product(self, s: Session, product_id: str, fields: dict) -> bool:
+        if s.one(f"SELECT id FROM products WHERE id=%s{self.lock_rows}", (product_id,)) is None:
+            return False
+        columns = {k: v for k, v in fields.items() if k in PRODUCT_COLUMNS and k not in ("id", "created_at")}
+        if columns:
+            s.execute(
+                f"UPDATE products SET {', '.join(f'{c}=%s' for c in columns)} WHERE id=%s",
+                [*columns.values(), product_id],
+            )
+        if "weight_prices" in fields:
+            s.execute("DELETE FROM weight_prices WHERE product_id=%s", (product_id,))
+            self._insert_weight_prices(s, [{"id": product_id, "weight_prices": fields["weight_prices"]}])
+        return True
+
+    async def list_products(self, category_id=None, fields=None) -> List[dict]:
+        if category_id:
+            return await self._read(self._products, "WHERE category_id=%s", (category_id,), fields)
+        return await self._read(self._products, "", (), fields)
+
+    async def get_product(self, product_id: str) -> Optional[dict]:
+        products = await self._read(self._products, "WHERE id=%s", (product_id,))
+        return products[0] if products else None
+
+    async def find_products(self, ids: List[str], names: List[str]) -> List[dict]:
+        conditions, params = [], []
+        if ids:
+            conditions.append(f"id IN ({placeholders(ids)})")
+            params.extend(ids)
+        if names:
+            conditions.append(f"name IN ({placeholders(names)})")
+            params.extend(names)
+        if not conditions:
+            return []
+        return await self._read(lambda s: s.all(f"SELECT id, name FROM products WHERE {' OR '.join(conditions)}", params))
+
+    async def inline_image_products(self) -> List[dict]:
+        return await self._read(lambda s: s.all("SELECT id, image FROM products WHERE image LIKE %s", ("data:%",)))
+
+    async def insert_products(self, products: List[dict]):
+        await self._write(self._insert_products, products)
+
+    async def update_product(self, product_id: str, fields: dict) -> Optional[dict]:
+        def update(s: Session):
+            if not self._update_product(s, product_id, fields):
+                return None
+            return self._products(s, "WHERE id=%s", (product_id,))[0]
+        return await self._write(update)
+
+    async def delete_product(self, product_id: str) -> bool:
+        def delete(s: Session) -> bool:
+            s.execute("DELETE FROM weight_prices WHERE product_id=%s", (product_id,))
+            return s.execute("DELETE FROM products WHERE id=%s", (product_id,)).rowcount == 1
+        return await self._write(delete)
+
+    async def write_products(self, operations: List[tuple]):
+        failure = await self._write(self._write_products, operations)
+        if failure:
+            raise storage.BulkWriteFailed(*failure)
+
+    def _write_products(self, s: Session, operations: List[tuple]):
+        # A failed statement is rolled back on its own; earlier ones are committed, as in MongoDB
+        for index, op in enumerate(operations):
+            try:
+                if op[0] == "insert":
+                    self._insert_products(s, [op[1]])
+                else:
+                    self._update_product(s, op[1], op[2])
+            except self.integrity_errors as e:
+                return index, str(e)
+        return None
+
+    # Promocodes
+    def _promocode(self, row: Optional[dict]) -> Optional[dict]:
+        if row is not None and "is_active" in row:
+            row["is_active"] = bool(row["is_active"])  # BOOLEAN is an integer column
+        return row
+
+    async def list_promocodes(self) -> List[dict]:
+        rows = await self._read(lambda s: s.all(f"SELECT {', '.join(PROMOCODE_COLUMNS)} FROM promocodes ORDER BY code"))
+        return [self._promocode(row) for row in rows]
+
+    async def find_promocode(self, code: str) -> Optional[dict]:
+        return self._promocode(await self._read(lambda s: s.one(
+            "SELECT id, code, discount_type, discount_value, is_active FROM promocodes WHERE code=%s", (code,)
+        )))
+
+    async def insert_promocode(self, promo: dict):
+        def insert(s: Session):
+            try:
+                s.execute(
+                    f"INSERT INTO promocodes ({', '.join(PROMOCODE_COLUMNS)}) VALUES ({placeholders(PROMOCODE_COLUMNS)})",
+                    [promo.get(c) for c in PROMOCODE_COLUMNS],
+                )
+            except self.integrity_errors:
+                raise storage.DuplicateError(promo["code"])
+        await self._write(insert)
+
+    async def delete_promocode(self, promo_id: str) -> bool:
+        def delete(s: Session) -> bool:
+            s.execute("DELETE FROM promocode_reservations WHERE promocode_id=%s", (promo_id,))
+            return s.execute("DELETE FROM promocodes WHERE id=%s", (promo_id,)).rowcount == 1
+        return await self._write(delete)
+
+    async def reserve_promocode(self, code: str, ttl: float, reservation_id=None):
+        return await self._write(self._reserve_promocode, code, ttl, reservation_id)
+
+    def _reserve_promocode(self, s: Session, code: str, ttl: float, reservation_id):
+        now = datetime.now(timezone.utc)
+        # Locking the promocode row orders concurrent reservations (SQLite: the write transaction does)
+        promo = self._promocode(s.one(
+            f"""SELECT {', '.join(PROMOCODE_COLUMNS)}, {LIVE_RESERVATIONS} AS reserved
+                FROM promocodes WHERE code=%s AND is_active=1{self.lock_rows}""",
+            (self.db_time(now), code),
+        ))
+        if promo is None:
+            return None, None
+        reserved = promo.pop("reserved")
+        reservation = {"id": reservation_id, "expires_at": now + timedelta(seconds=ttl)}
+        if reservation_id and s.execute(
+            "UPDATE promocode_reservations SET expires_at=%s WHERE id=%s AND promocode_id=%s AND expires_at > %s",
+            (self.db_time(reservation["expires_at"]), reservation_id, promo["id"], self.db_time(now)),
+        ).rowcount:
+            # The cart's own live reservation already holds a use
+            return promo, reservation
+        if promo["current_uses"] + reserved >= promo["max_uses"]:
+            return None, None
+        s.execute(
+            "DELETE FROM promocode_reservations WHERE promocode_id=%s AND expires_at <= %s",
+            (promo["id"], self.db_time(now)),
+        )
+        reservation["id"] = str(uuid.uuid4())
+        s.execute(
+            "INSERT INTO promocode_reservations (id, promocode_id, expires_at) VALUES (%s, %s, %s)",
+            (reservation["id"], promo["id"], self.db_time(reservation["expires_at"])),
+        )
+        return promo, reservation
+
+    async def redeem_promocode(self, code: str, reservation_id=None, order_id=None) -> bool:
+        return await self._write(self._redeem_promocode, code, reservation_id, order_id)
+
+    def _redeem_promocode(self, s: Session, code: str, reservation_id, order_id=None) -> bool:
+        if order_id and s.one("SELECT order_id FROM promocode_redemptions WHERE order_id=%s", (order_id,)):
+            # A reclaimed copy of the same queued order counted its use already
+            return True
+        redeemed = self._count_use(s, code, reservation_id)
+        if redeemed and order_id:
+            # A concurrent copy that got here first makes this insert fail, rolling back our use
+            s.execute(
+                "INSERT INTO promocode_redemptions (order_id, code, redeemed_at) VALUES (%s, %s, %s)",
+                (order_id, code, self.db_time(datetime.now(timezone.utc))),
+            )
+        return redeemed
+
+    def _count_use(self, s: Session, code: str, reservation_id) -> bool:
+        now = self.db_time(datetime.now(timezone.utc))
+        if reservation_id:
+            consumed = s.execute(
+                """DELETE FROM promocode_reservations WHERE id=%s AND expires_at > %s
+                   AND promocode_id IN (SELECT id FROM promocodes WHERE code=%s AND is_active=1)""",
+                (reservation_id, now, code),
+            ).rowcount
+            if consumed:
+                cursor = s.execute(
+                    "UPDATE promocodes SET current_uses = current_uses + 1 WHERE code=%s AND is_active=1", (code,)
+                )
+                return cursor.rowcount == 1
+        cursor = s.execute(
+            f"""UPDATE promocodes SET current_uses = current_uses + 1
+                WHERE code=%s AND is_active=1 AND current_uses + {LIVE_RESERVATIONS} < max_uses""",
+            (code, now),
+        )
+        return cursor.rowcount == 1
+
+    # Orders
+    def _orders(self, s: Session, filters: dict, after, fields, limit: int, ascending: bool = False) -> List[dict]:
+        columns = [c for c in ORDER_COLUMNS if fields is None or c in fields or c in ("id", "created_at")]
+        where, params = [], []
+        if filters.get("date_from"):
+            where.append("created_at >= %s")
+            params.append(self.filter_time(filters["date_from"]))
+        if filters.get("date_to"):
+            where.append("created_at < %s")
+            params.append(self.filter_time(filters["date_to"]))
+        if filters.get("promocode"):
+            where.append("promocode = %s")
+            params.append(filters["promocode"])
+        if filters.get("phone"):
+            where.append("customer_phone = %s")
+            params.append(filters["phone"])
+        if after:
+            created_at, order_id = self.filter_time(after[0]), after[1]
+            op = ">" if ascending else "<"
+            where.append(f"(created_at {op} %s OR (created_at = %s AND id {op} %s))")
+            params.extend([created_at, created_at, order_id])
+        direction = "" if ascending else " DESC"
+        sql = f"SELECT {', '.join(columns)} FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY created_at{direction}, id{direction} LIMIT %s"
+        orders = s.all(sql, params + [limit])
+        if fields is None or "items" in fields:
+            # Items of the whole page in one query
+            items = self._order_items(s, [o["id"] for o in orders])
+            for order in orders:
+                order["items"] = items[order["id"]]
+        return orders
+
+    def _order_items(self, s: Session, order_ids: List[str]) -> dict:
+        result = {order_id: [] for order_id in order_ids}
+        if order_ids:
+            rows = s.all(
+                f"""SELECT order_id, product_id, name, weight, price, quantity FROM order_items
+                    WHERE order_id IN ({placeholders(order_ids)}) ORDER BY order_id, id""",
+                order_ids,
+            )
+            for row in rows:
+                result[row.pop("order_id")].append(row)
+        return result
+
+    async def list_orders(self, filters, after=None, fields=None, limit=100) -> List[dict]:
+        return await self._read(self._orders, filters, after, fields, limit)
+
+    async def iter_orders(self, filters):
+        # Keyset pages, each its own short read, instead of one server-side cursor
+        # (pymysql SSDictCursor). An unbuffered result would pin a pooled connection
+        # for as long as the client takes to download the export, allow no other
+        # query on it (items could not be read per page), and be cut off by MariaDB's
+        # net_write_timeout when the client stalls. Memory is still one page at a
+        # time, and each page is a seek on the (created_at, id) index.
+        after = None
+        while True:
+            orders = await self._read(self._orders, filters, after, None, EXPORT_BATCH, True)
+            for order in orders:
+                yield order
+            if len(orders) < EXPORT_BATCH:
+                return
+            after = (orders[-1]["created_at"], orders[-1]["id"])
+
+    async def insert_orders(self, orders: List[dict]) -> List[dict]:
+        return await self._write(self._insert_orders, orders)
+
+    def _insert_orders(self, s: Session, orders: List[dict]) -> List[dict]:
+        written = []
+        for order in orders:
+            # Orders written by an earlier attempt of the batch are skipped
+            cursor = s.execute(
+                f"""{self.insert_ignore} INTO orders ({', '.join(ORDER_INSERT_COLUMNS)})
+                    VALUES ({placeholders(ORDER_INSERT_COLUMNS)})""",
+                [self.db_time(order["created_at"]) if c == "created_at" else order.get(c) for c in ORDER_INSERT_COLUMNS],
+            )
+            if cursor.rowcount == 1:
+                written.append(order)
+        s.executemany(
+            """INSERT INTO order_items (order_id, product_id, name, weight, price, quantity)
+               VALUES (%s, %s, %s, %s, %s, %s)""",
+            [
+                (o["id"], item.get("product_id"), item["name"], item.get("weight"), item["price"], item["quantity"])
+                for o in written for item in o.get("items") or []
+            ],
+        )
+        return written
+
+    async def place_order(self, order: dict, idempotency_key=None, reservation_id=None):
+        try:
+            return await self._write(self._place_order, order, idempotency_key, reservation_id)
+        except KeyTaken:
+            pass
+        # Our redemption was rolled back with the insert; answer with the winner's order
+        for delay in storage.KEY_LOOKUP_DELAYS:
+            await asyncio.sleep(delay)
+            existing = await self._read(self._order_by_key, idempotency_key)
+            if existing is not None:
+                return existing, False
+        raise storage.IdempotencyConflict(idempotency_key)
+
+    def _order_by_key(self, s: Session, idempotency_key: str) -> Optional[dict]:
+        order = s.one(f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE idempotency_key=%s", (idempotency_key,))
+        if order is not None:
+            order["items"] = self._order_items(s, [order["id"]])[order["id"]]
+        return order
+
+    def _place_order(self, s: Session, order: dict, idempotency_key, reservation_id):
+        if idempotency_key:
+            existing = self._order_by_key(s, idempotency_key)
+            if existing is not None:
+                return existing, False
+        order = {**order, "idempotency_key": idempotency_key}
+        if order.get("promocode"):
+            code = order["promocode"]
+            if self._redeem_promocode(s, code, reservation_id, order["id"]):
+                order["promocode_status"] = "redeemed"
+            elif s.one("SELECT id FROM promocodes WHERE code=%s", (code,)) is not None:
+                raise storage.PromocodeExhausted(code)
+            else:
+                order["promocode_status"] = "unknown"
+        if not self._insert_orders(s, [order]):
+            # Only the key can clash: order ids are fresh uuids
+            raise KeyTaken(idempotency_key)
+        del order["idempotency_key"]
+        return order, True
+
+    async def delete_order(self, order_id: str) -> Optional[dict]:
+        def delete(s: Session) -> Optional[dict]:
+            order = s.one(f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE id=%s{self.lock_rows}", (order_id,))
+            if order is None:
+                return None
+            order["items"] = self._order_items(s, [order_id])[order_id]
+            s.execute("DELETE FROM order_items WHERE order_id=%s", (order_id,))
+            s.execute("DELETE FROM orders WHERE id=%s", (order_id,))
+            return order
+        return await self._write(delete)
+
+    # Stats rollups
+    async def add_stats(self, totals: dict, top: dict, upsert: bool = True):
+        if totals or top:
+            await self._write(self._add_stats, totals, top, upsert)
+
+    def _add_stats(self, s: Session, totals: dict, top: dict, upsert: bool):
+        # Top lines are keyed like the rows written before rollups moved here:
+        # "<product id or name>|<weight>" for products, the code for promocodes
+        top_rows = [
+            (bucket, kind, key if kind == "promocode" else f"{key}|{weight}",
+             line["name"], line["weight"], line["count"], line["revenue"])
+            for (bucket, kind, key, weight), line in top.items()
+        ]
+        if upsert:
+            s.executemany(
+                self.upsert("stats", ("bucket", "granularity", "period") + STATS_COUNTERS, ("bucket",),
+                            add=STATS_COUNTERS),
+                [
+                    (bucket, bucket.partition(":")[0], bucket.partition(":")[2] or bucket,
+                     *(counters[c] for c in STATS_COUNTERS))
+                    for bucket, counters in totals.items()
+                ],
+            )
+            s.executemany(
+                self.upsert("stats_top", ("bucket", "kind", "item_key", "name", "weight", "count", "revenue"),
+                            ("bucket", "kind", "item_key"), add=("count", "revenue"), assign=("name", "weight")),
+                top_rows,
+            )
+            return
+        s.executemany(
+            f"UPDATE stats SET {', '.join(f'{c} = {c} + %s' for c in STATS_COUNTERS)} WHERE bucket=%s",
+            [(*(counters[c] for c in STATS_COUNTERS), bucket) for bucket, counters in totals.items()],
+        )
+        s.executemany(
+            "UPDATE stats_top SET count = count + %s, revenue = revenue + %s WHERE bucket=%s AND kind=%s AND item_key=%s",
+            [(count, revenue, bucket, kind, item_key) for bucket, kind, item_key, _, _, count, revenue in top_rows],
+        )
+
+    async def stats_totals(self, bucket: str) -> dict:
+        return await self._read(lambda s: s.one("SELECT * FROM stats WHERE bucket=%s", (bucket,))) or {}
+
+    async def stats_series(self, granularity: str, limit: int) -> List[dict]:
+        return await self._read(lambda s: s.all(
+            "SELECT * FROM stats WHERE granularity=%s ORDER BY period DESC LIMIT %s", (granularity, limit)
+        ))
+
+    async def stats_top(self, bucket: str, kind: str, limit: int) -> List[dict]:
+        return await self._read(lambda s: s.all(
+            """SELECT name, weight, count, revenue FROM stats_top
+               WHERE bucket=%s AND kind=%s AND count > 0 ORDER BY count DESC LIMIT %s""",
+            (bucket, kind, limit),
+        ))
+
+    # About page
+    async def get_about(self) -> Optional[dict]:
+        about = await self._read(lambda s: s.one(
+            "SELECT id, title, description, features FROM about WHERE id=%s", ("about-us",)
+        ))
+        if about is not None:
+            about["features"] = json.loads(about["features"])
+        return about
+
+    async def save_about(self, about: dict):
+        await self._write(lambda s: s.execute(
+            self.upsert("about", ("id", "title", "description", "features"), ("id",),
+                        assign=("title", "description", "features")),
+            ("about-us", about["title"], about["description"], json.dumps(about["features"], ensure_ascii=False)),
+        ))
+
+    async def clear(self, name: str) -> int:
+        if name not in CLEAR_TABLES:
+            raise ValueError(f"Unknown collection {name!r}")
+        return await self._write(lambda s: [s.execute(f"DELETE FROM {table}").rowcount for table in CLEAR_TABLES[name]][-1])
+
+    # Cache versions: polled by every process (see cache_sync.py), so reads stay one tiny query
+    async def bump_versions(self, names) -> dict:
+        return await self._write(self._bump_versions, list(names))
+
+    def _bump_versions(self, s: Session, names: List[str]) -> dict:
+        if not names:
+            return {}
+        s.executemany(
+            self.upsert("cache_versions", ("name", "version", "updated_at"), ("name",),
+                        add=("version",), assign=("updated_at",)),
+            [(name, 1, self.db_time(datetime.now(timezone.utc))) for name in names],
+        )
+        rows = s.all(f"SELECT name, version, updated_at FROM cache_versions WHERE name IN ({placeholders(names)})",
+                     names)
+        return {row["name"]: (row["version"], self.read_time(row["updated_at"])) for row in rows}
+
+    async def cache_versions(self) -> dict:
+        rows = await self._read(lambda s: s.all("SELECT name, version, updated_at FROM cache_versions"))
+        return {row["name"]: (row["version"], self.read_time(row["updated_at"])) for row in rows}
+
+
+# SQLite
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS categories (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        slug TEXT NOT NULL,
+        sort_order INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_categories_sort ON categories (sort_order)",
+    """CREATE TABLE IF NOT EXISTS products (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        category_id TEXT REFERENCES categories(id) ON DELETE SET NULL,
+        image TEXT,
+        base_price REAL NOT NULL,
+        created_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_created ON products (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)",
+    """CREATE TABLE IF NOT EXISTS weight_prices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        weight TEXT NOT NULL,
+        price REAL NOT NULL,
+        sort_order INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_weight_prices_product ON weight_prices (product_id, sort_order)",
+    """CREATE TABLE IF NOT EXISTS promocodes (
+        id TEXT PRIMARY KEY,
+        code TEXT NOT NULL UNIQUE,
+        discount_type TEXT NOT NULL,
+        discount_value REAL NOT NULL,
+        max_uses INTEGER NOT NULL,
+        current_uses INTEGER NOT NULL DEFAULT 0,
+        is_active INTEGER NOT NULL DEFAULT 1
+    )""",
+    """CREATE TABLE IF NOT EXISTS promocode_reservations (
+        id TEXT PRIMARY KEY,
+        promocode_id TEXT NOT NULL REFERENCES promocodes(id) ON DELETE CASCADE,
+        expires_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_reservations_promo ON promocode_reservations (promocode_id, expires_at)",
+    """CREATE TABLE IF NOT EXISTS promocode_redemptions (
+        order_id TEXT PRIMARY KEY,
+        code TEXT NOT NULL,
+        redeemed_at TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS orders (
+        id TEXT PRIMARY KEY,
+        customer_name TEXT NOT NULL,
+        customer_phone TEXT NOT NULL,
+        subtotal REAL NOT NULL,
+        discount REAL NOT NULL DEFAULT 0,
+        total REAL NOT NULL,
+        promocode TEXT,
+        promocode_status TEXT,
+        idempotency_key TEXT,
+        created_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency ON orders (idempotency_key)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_promocode ON orders (promocode, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_phone ON orders (customer_phone, created_at, id)",
+    """CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+        product_id TEXT,
+        name TEXT NOT NULL,
+        weight TEXT,
+        price REAL NOT NULL,
+        quantity INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id, id)",
+    """CREATE TABLE IF NOT EXISTS about (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        features TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        id TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS stats (
+        bucket TEXT PRIMARY KEY,
+        granularity TEXT NOT NULL,
+        period TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        discount REAL NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_stats_period ON stats (granularity, period)",
+    """CREATE TABLE IF NOT EXISTS stats_top (
+        bucket TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        item_key TEXT NOT NULL,
+        name TEXT NOT NULL,
+        weight TEXT NOT NULL DEFAULT '',
+        count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, kind, item_key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_stats_top_count ON stats_top (bucket, kind, count)",
+    """CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )""",
+]
+
+
+class SQLiteStorage(SQLStorage):
+    """The shop in one local file; one connection per executor thread."""
+
+    name = "sqlite"
+    insert_ignore = "INSERT OR IGNORE"
+    lock_rows = ""  # BEGIN IMMEDIATE already holds the database's write lock
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, path, threads: int = 8):
+        super().__init__(threads)
+        self.path = str(path)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def schema(self) -> List[str]:
+        return SQLITE_SCHEMA
+
+    def sql(self, sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    def upsert(self, table: str, columns, keys, add=(), assign=()) -> str:
+        updates = [f"{c} = {c} + excluded.{c}" for c in add] + [f"{c} = excluded.{c}" for c in assign]
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders(columns)}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}")
+
+    def store_time(self, value: datetime) -> str:
+        # Fixed-width UTC text, so comparing strings compares instants; naive values are UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+    def indexes(self, s: Session, table: str) -> List[dict]:
+        result = []
+        for index in s.all(f"PRAGMA index_list({table})"):
+            columns = [c["name"] for c in s.all(f"PRAGMA index_info({index['name']})")]
+            result.append({"name": index["name"], "columns": columns, "unique": bool(index["unique"])})
+        return result
+
+    def _acquire(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Orders leave the intake queue once written here, so commits must survive power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _release(self, conn, healthy: bool):
+        pass
+
+    def _begin(self, conn, write: bool):
+        # Writers take the lock up front instead of failing to upgrade a read lock later
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+
+    def _commit(self, conn):
+        conn.execute("COMMIT")
+
+    def _rollback(self, conn, error: BaseException) -> bool:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return True
+
+    async def pool_stats(self) -> dict:
+        return {"path": self.path, "threads": self.threads, "connections": len(self._connections)}
+
+    async def close(self):
+        await super().close()
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+# MariaDB
+MARIADB_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS categories (
+        id VARCHAR(36) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        slug VARCHAR(255) NOT NULL,
+        sort_order INT NOT NULL DEFAULT 0
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS products (
+        id VARCHAR(36) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        category_id VARCHAR(36),
+        image TEXT,
+        base_price DECIMAL(10,2) NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS weight_prices (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        product_id VARCHAR(36) NOT NULL,
+        weight VARCHAR(50) NOT NULL,
+        price DECIMAL(10,2) NOT NULL,
+        sort_order INT DEFAULT 0,
+        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS promocodes (
+        id VARCHAR(36) PRIMARY KEY,
+        code VARCHAR(100) NOT NULL UNIQUE,
+        discount_type ENUM('percent', 'fixed') NOT NULL,
+        discount_value DECIMAL(10,2) NOT NULL,
+        max_uses INT NOT NULL,
+        current_uses INT DEFAULT 0,
+        is_active BOOLEAN DEFAULT TRUE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS promocode_reservations (
+        id VARCHAR(36) PRIMARY KEY,
+        promocode_id VARCHAR(36) NOT NULL,
+        expires_at DATETIME NOT NULL,
+        KEY idx_reservations_promo (promocode_id, expires_at),
+        FOREIGN KEY (promocode_id) REFERENCES promocodes(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS promocode_redemptions (
+        order_id VARCHAR(36) PRIMARY KEY,
+        code VARCHAR(100) NOT NULL,
+        redeemed_at DATETIME NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS orders (
+        id VARCHAR(36) PRIMARY KEY,
+        customer_name VARCHAR(255) NOT NULL,
+        customer_phone VARCHAR(50) NOT NULL,
+        subtotal DECIMAL(10,2) NOT NULL,
+        discount DECIMAL(10,2) DEFAULT 0,
+        total DECIMAL(10,2) NOT NULL,
+        promocode VARCHAR(100),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS order_items (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id VARCHAR(36) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        weight VARCHAR(50),
+        price DECIMAL(10,2) NOT NULL,
+        quantity INT NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS about (
+        id VARCHAR(36) PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        description TEXT NOT NULL,
+        features TEXT NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        id VARCHAR(50) PRIMARY KEY,
+        value TEXT,
+        updated_at DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS stats (
+        bucket VARCHAR(20) PRIMARY KEY,
+        granularity VARCHAR(10) NOT NULL,
+        period VARCHAR(10) NOT NULL,
+        orders INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+        discount DECIMAL(14,2) NOT NULL DEFAULT 0,
+        items INT NOT NULL DEFAULT 0,
+        KEY idx_stats_period (granularity, period)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS stats_top (
+        bucket VARCHAR(20) NOT NULL,
+        kind VARCHAR(10) NOT NULL,
+        item_key VARCHAR(150) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        weight VARCHAR(50) NOT NULL DEFAULT '',
+        count INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, kind, item_key),
+        KEY idx_stats_top_count (bucket, kind, count)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS cache_versions (
+        name VARCHAR(50) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+]
+
+
+class ConnectionPool:
+    """Bounded thread-safe pool of PyMySQL connections."""
+
+    # A connection idle for longer than this is pinged before it is handed out
+    IDLE_CHECK = 30
+
+    def __init__(self, config: dict, max_size: int, recycle: int, timeout: float):
+        self.config = config
+        self.max_size = max_size
+        self.recycle = recycle
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._waiting = 0
+        self.counters = {
+            "created": 0, "recycled": 0, "broken": 0,
+            "waits": 0, "timeouts": 0, "wait_seconds": 0.0,
+        }
+
+    def _count(self, key: str, value=1):
+        with self._lock:
+            self.counters[key] += value
+
+    def _discard(self, conn, reason: str):
+        with self._lock:
+            self._size -= 1
+            self.counters[reason] += 1
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+
+    def _wait_idle(self):
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+            self.counters["waits"] += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self._count("timeouts")
+            raise storage.Unavailable("No free database connection")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.counters["wait_seconds"] += time.monotonic() - started
+
+    def acquire(self):
+        while True:
+            try:
+                conn, created_at, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_grow = self._size < self.max_size
+                    if can_grow:
+                        self._size += 1
+                if not can_grow:
+                    conn, created_at, released_at = self._wait_idle()
+                else:
+                    try:
+                        conn = pymysql.connect(**self.config)
+                    except Exception:
+                        with self._lock:
+                            self._size -= 1
+                        raise
+                    self._count("created")
+                    return conn, time.monotonic()
+
+            now = time.monotonic()
+            if now - created_at > self.recycle:
+                self._discard(conn, "recycled")
+                continue
+            if now - released_at > self.IDLE_CHECK:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.Error:
+                    self._discard(conn, "broken")
+                    continue
+            return conn, created_at
+
+    def release(self, conn, created_at: float, healthy: bool = True):
+        if healthy and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            # Never hand an open transaction (and its old snapshot) to the next call
+            try:
+                conn.rollback()
+            except pymysql.Error:
+                healthy = False
+        if not healthy:
+            self._discard(conn, "broken")
+            return
+        self._idle.put((conn, created_at, time.monotonic()))
+
+    def close(self):
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn, "recycled")
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._size - idle,
+                "idle": idle,
+                "waiting": self._waiting,
+                **self.counters,
+            }
+
+
+class MariaDBStorage(SQLStorage):
+    """The shared-hosting schema; connections come from a pool the size of the executor."""
+
+    name = "mariadb"
+
+    def __init__(self, config: dict, pool_size: int = 10, recycle: int = 280, timeout: float = 10):
+        if pymysql is None:
+            raise RuntimeError("STORAGE=mariadb needs PyMySQL (pip install pymysql)")
+        super().__init__(pool_size)
+        self.integrity_errors = (pymysql.IntegrityError,)
+        config = {**config, "charset": "utf8mb4", "cursorclass": pymysql.cursors.DictCursor, "autocommit": False}
+        self.pool = ConnectionPool(config, pool_size, recycle, timeout)
+        self._created = threading.local()
+
+    def schema(self) -> List[str]:
+        return MARIADB_SCHEMA
+
+    def migrate(self, s: Session):
+        # Columns and indexes added after the first deployments
+        self._ensure_column(s, "categories", "sort_order", "INT NOT NULL DEFAULT 0")
+        self._ensure_index(s, "categories", "idx_categories_sort", "sort_order")
+        self._ensure_index(s, "products", "idx_products_created", "created_at, id")
+        self._ensure_index(s, "products", "idx_products_name", "name")
+        self._ensure_index(s, "orders", "idx_orders_created", "created_at, id")
+        self._ensure_index(s, "orders", "idx_orders_promocode", "promocode, created_at, id")
+        self._ensure_index(s, "orders", "idx_orders_phone", "customer_phone, created_at, id")
+        self._ensure_column(s, "orders", "idempotency_key", "VARCHAR(200) NULL")
+        self._ensure_index(s, "orders", "idx_orders_idempotency", "idempotency_key", unique=True)
+        self._ensure_column(s, "orders", "promocode_status", "VARCHAR(20) NULL")
+        self._ensure_column(s, "order_items", "product_id", "VARCHAR(36) NULL")
+
+    def _ensure_column(self, s: Session, table: str, column: str, definition: str):
+        if s.one(f"SHOW COLUMNS FROM {table} LIKE %s", (column,)) is None:
+            s.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _ensure_index(self, s: Session, table: str, name: str, columns: str, unique: bool = False):
+        # MySQL 5.7 has no CREATE INDEX IF NOT EXISTS
+        if s.one(f"SHOW INDEX FROM {table} WHERE Key_name=%s", (name,)) is None:
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            s.execute(f"CREATE {kind} {name} ON {table} ({columns})")
+
+    def upsert(self, table: str, columns, keys, add=(), assign=()) -> str:
+        updates = [f"{c} = {c} + VALUES({c})" for c in add] + [f"{c} = VALUES({c})" for c in assign]
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders(columns)}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(updates)}")
+
+    def store_time(self, value: datetime) -> datetime:
+        # DATETIME has no zone; rows have always been written in the server's local time
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value
+
+    def indexes(self, s: Session, table: str) -> List[dict]:
+        result = {}
+        for row in s.all(f"SHOW INDEX FROM {table}"):
+            index = result.setdefault(row["Key_name"], {
+                "name": row["Key_name"], "columns": [], "unique": not row["Non_unique"],
+            })
+            index["columns"].append(row["Column_name"])
+        return list(result.values())
+
+    def _acquire(self):
+        conn, self._created.value = self.pool.acquire()
+        return conn
+
+    def _release(self, conn, healthy: bool):
+        self.pool.release(conn, self._created.value, healthy)
+
+    def _rollback(self, conn, error: BaseException) -> bool:
+        try:
+            conn.rollback()
+        except pymysql.Error:
+            return False
+        return not isinstance(error, pymysql.OperationalError)
+
+    async def pool_stats(self) -> dict:
+        return {**self.pool.stats(), "threads": self.threads}
+
+    async def close(self):
+        await super().close()
+        self.pool.close()
@@ -0,0 +1,56 @@
+"""
+Backend tests for Honey Farm e-commerce app - Cross-process cache invalidation
+Tests: /admin/cache-sync stats, admin writes publishing invalidations
+"""
+import pytest
+import requests
+import os
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+class TestCacheSync:
+    """Test the cache invalidation bus"""
+
+    def test_cache_sync_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/admin/cache-sync")
+        assert response.status_code == 401
+        print("✓ /admin/cache-sync requires admin auth")
+
+    def test_cache_sync_stats(self):
+        response = requests.get(f"{BASE_URL}/api/admin/cache-sync", auth=AUTH)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["mode"] in ("starting", "change_stream", "poll")
+        assert data["interval"] > 0
+        for key in ("published", "received", "errors"):
+            assert data[key] >= 0
+        print(f"✓ Cache sync running in {data['mode']} mode")
+
+    def test_admin_write_publishes(self):
+        """Every worker serves a new ETag within the sync interval after a write"""
+        original = requests.get(f"{BASE_URL}/api/about").json()
+        restore = {k: original[k] for k in ("title", "description", "features")}
+        before = requests.get(f"{BASE_URL}/api/about", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+
+        response = requests.put(f"{BASE_URL}/api/about", json=restore, auth=AUTH)
+        assert response.status_code == 200
+
+        # With several workers each request may reach another process; wait until
+        # several in a row carry the new ETag
+        deadline = time.time() + 10
+        fresh = 0
+        while fresh < 5:
+            if time.time() > deadline:
+                pytest.fail(f"About ETag still {before} on some workers after the write")
+            etag = requests.get(f"{BASE_URL}/api/about", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+            fresh = fresh + 1 if etag != before else 0
+            if not fresh:
+                time.sleep(0.2)
+        print(f"✓ Updating the about page moved its ETag from {before} to {etag}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,69 @@
+"""
+Backend tests for Honey Farm e-commerce app - Cart pricing
+Tests: POST /api/cart/quote, server-side order totals
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+@pytest.fixture
+def honey():
+    """A seeded product that has weight prices"""
+    response = requests.get(f"{BASE_URL}/api/products", params={"category_id": "cat-honey"})
+    assert response.status_code == 200
+    product = next(p for p in response.json() if p["weight_prices"])
+    return product
+
+
+class TestCartQuote:
+    """Test authoritative cart pricing"""
+
+    def test_quote_uses_catalog_prices(self, honey):
+        weight = honey["weight_prices"][0]
+        response = requests.post(f"{BASE_URL}/api/cart/quote", json={
+            "items": [{"product_id": honey["id"], "name": honey["name"], "weight": weight["weight"], "quantity": 3}]
+        })
+        assert response.status_code == 200
+        quote = response.json()
+        assert quote["items"][0]["price"] == weight["price"]
+        assert quote["subtotal"] == weight["price"] * 3
+        assert quote["discount"] == 0
+        assert quote["total"] == quote["subtotal"]
+        print(f"✓ Quote total {quote['total']} ₸")
+
+    def test_quote_rejects_unknown_weight(self, honey):
+        response = requests.post(f"{BASE_URL}/api/cart/quote", json={
+            "items": [{"product_id": honey["id"], "name": honey["name"], "weight": "999кг", "quantity": 1}]
+        })
+        assert response.status_code == 400
+
+    def test_order_ignores_client_prices(self, honey):
+        """A tampered price is replaced by the catalog price"""
+        weight = honey["weight_prices"][0]
+        response = requests.post(f"{BASE_URL}/api/orders", json={
+            "customer_name": "TEST_Цена",
+            "customer_phone": "+7 (700) 666 77 88",
+            "items": [{"product_id": honey["id"], "name": honey["name"], "weight": weight["weight"], "price": 1, "quantity": 2}],
+            "subtotal": 2,
+            "discount": 0,
+            "total": 2
+        })
+        assert response.status_code == 200
+        order = response.json()
+        assert order["items"][0]["price"] == weight["price"]
+        assert order["total"] == weight["price"] * 2
+        print("✓ Order totals recomputed on the server")
+
+    def test_cleanup_test_orders(self):
+        response = requests.get(f"{BASE_URL}/api/orders", params={"phone": "+7 (700) 666 77 88", "limit": 500}, auth=AUTH)
+        if response.status_code == 200:
+            for order in response.json():
+                requests.delete(f"{BASE_URL}/api/orders/{order['id']}", auth=AUTH)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
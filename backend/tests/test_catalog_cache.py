@@ -0,0 +1,139 @@
+"""
+Backend tests for Honey Farm e-commerce app - Catalog snapshot cache
+Tests: product/category listings reflect admin writes immediately
+"""
+import pytest
+import requests
+import os
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+class TestCatalogInvalidation:
+    """Cached catalog responses are dropped on every admin write"""
+
+    def test_product_listing_follows_create_and_delete(self):
+        """Created product appears in the listing and disappears after delete"""
+        # Warm the cache
+        response = requests.get(f"{BASE_URL}/api/products")
+        assert response.status_code == 200
+
+        product_data = {
+            "name": "TEST_Кэш Мёд",
+            "description": "",
+            "category_id": "cat-honey",
+            "image": "",
+            "base_price": 1000,
+            "weight_prices": []
+        }
+        response = requests.post(f"{BASE_URL}/api/products", json=product_data, auth=AUTH)
+        assert response.status_code == 200
+        product_id = response.json()["id"]
+
+        response = requests.get(f"{BASE_URL}/api/products")
+        assert product_id in [p["id"] for p in response.json()]
+
+        response = requests.get(f"{BASE_URL}/api/products", params={"category_id": "cat-honey"})
+        assert product_id in [p["id"] for p in response.json()]
+
+        response = requests.delete(f"{BASE_URL}/api/products/{product_id}", auth=AUTH)
+        assert response.status_code == 200
+
+        response = requests.get(f"{BASE_URL}/api/products")
+        assert product_id not in [p["id"] for p in response.json()]
+        print("✓ Product listing follows create/delete")
+
+    def test_category_listing_follows_update(self):
+        """Renamed category is visible on the next listing"""
+        response = requests.get(f"{BASE_URL}/api/categories")
+        assert response.status_code == 200
+        category = response.json()[0]
+
+        renamed = {"name": "TEST_" + category["name"], "slug": category["slug"], "order": category["order"]}
+        response = requests.put(f"{BASE_URL}/api/categories/{category['id']}", json=renamed, auth=AUTH)
+        assert response.status_code == 200
+
+        response = requests.get(f"{BASE_URL}/api/categories")
+        names = {c["id"]: c["name"] for c in response.json()}
+        assert names[category["id"]] == renamed["name"]
+
+        # Restore
+        original = {"name": category["name"], "slug": category["slug"], "order": category["order"]}
+        requests.put(f"{BASE_URL}/api/categories/{category['id']}", json=original, auth=AUTH)
+        print("✓ Category listing follows update")
+
+
+
+class TestCatalogWireFormat:
+    """Compressed snapshots and the slim card view"""
+
+    def test_gzip_snapshot(self):
+        response = requests.get(f"{BASE_URL}/api/products", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("Vary", "")
+        assert response.headers["ETag"].endswith('-gzip"')
+        # requests decodes the body transparently
+        assert isinstance(response.json(), list)
+
+        response = requests.get(
+            f"{BASE_URL}/api/products",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}
+        )
+        assert response.status_code == 304
+        print("✓ Catalog served gzip-compressed and revalidates")
+
+    def test_etag_follows_shared_version(self):
+        """Every worker derives the ETag from the version stored in the database"""
+        ids = [c["id"] for c in requests.get(f"{BASE_URL}/api/categories").json()]
+        response = requests.post(f"{BASE_URL}/api/categories/reorder", json=ids, auth=AUTH)
+        assert response.status_code == 200
+        version = response.json()["version"]
+        # Other workers pick the version up within the cache sync interval
+        for _ in range(20):
+            response = requests.get(f"{BASE_URL}/api/categories", headers={"Accept-Encoding": "identity"})
+            etag = response.headers["ETag"]
+            assert etag.startswith('"c') and etag.endswith('"')
+            if int(etag[2:-1]) >= version:
+                break
+            time.sleep(0.2)
+        else:
+            pytest.fail(f"ETag {etag} is behind version {version}")
+        assert "Last-Modified" in response.headers
+        print(f"✓ Categories ETag {etag} follows the shared version")
+
+    def test_identity_when_not_accepted(self):
+        response = requests.get(f"{BASE_URL}/api/products", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+
+    def test_card_view_is_slim(self):
+        full = requests.get(f"{BASE_URL}/api/products").json()
+        cards = requests.get(f"{BASE_URL}/api/products", params={"view": "card"}).json()
+        assert [c["id"] for c in cards] == [p["id"] for p in full]
+        for card in cards:
+            assert "description" not in card
+            assert "created_at" not in card
+            assert "weight_prices" in card and "base_price" in card
+
+        bootstrap = requests.get(f"{BASE_URL}/api/bootstrap", params={"view": "card"}).json()
+        assert all("description" not in p for p in bootstrap["products"])
+        print(f"✓ Card view: {len(cards)} products without descriptions")
+
+    def test_unknown_view_rejected(self):
+        response = requests.get(f"{BASE_URL}/api/products", params={"view": "tiny"})
+        assert response.status_code == 422
+
+    def test_unknown_category_is_empty(self):
+        """Made-up category ids get an empty list without a cache entry of their own"""
+        for i in range(3):
+            response = requests.get(f"{BASE_URL}/api/products", params={"category_id": f"TEST_no-such-{i}"})
+            assert response.status_code == 200
+            assert response.json() == []
+        print("✓ Unknown category ids return an empty list")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -117,6 +117,11 @@ class TestOrdersWithProducts:
     
     def test_create_order_with_promocode(self):
         """Test creating order with promocode"""
+        response = requests.post(f"{BASE_URL}/api/promocodes", json={
+            "code": "TESTPROMO", "discount_type": "percent", "discount_value": 10, "max_uses": 100
+        }, auth=AUTH)
+        assert response.status_code in (200, 409)
+        
         order_data = {
             "customer_name": "TEST_Промо Покупатель",
             "customer_phone": "+7 (700) 222 33 44",
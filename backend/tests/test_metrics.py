@@ -0,0 +1,59 @@
+"""
+Backend tests for Honey Farm e-commerce app - Prometheus metrics
+Tests: GET /api/metrics auth, per-route series and DB operation counters
+"""
+import pytest
+import requests
+import os
+import re
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+def scrape():
+    response = requests.get(f"{BASE_URL}/api/metrics", auth=AUTH)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    return response.text
+
+
+def sample(text, pattern):
+    """Value of the first series matching `pattern`, or 0"""
+    match = re.search(pattern + r" ([0-9.e+-]+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+class TestMetrics:
+    """Test the admin /metrics endpoint"""
+
+    def test_metrics_require_auth(self):
+        response = requests.get(f"{BASE_URL}/api/metrics")
+        assert response.status_code == 401
+
+    def test_route_series_use_templates(self):
+        products = requests.get(f"{BASE_URL}/api/products").json()
+        requests.get(f"{BASE_URL}/api/products/{products[0]['id']}")
+        text = scrape()
+        assert 'route="/api/products/{product_id}"' in text
+        assert products[0]["id"] not in text
+        assert "# TYPE http_request_duration_seconds histogram" in text
+        print("✓ Per-route histograms keyed by path template")
+
+    def test_counters_grow(self):
+        pattern = r'http_requests_total\{method="GET",route="/api/categories",status="200"\}'
+        before = sample(scrape(), pattern)
+        requests.get(f"{BASE_URL}/api/categories")
+        requests.get(f"{BASE_URL}/api/categories")
+        assert sample(scrape(), pattern) == before + 2
+
+    def test_db_operations_counted(self):
+        requests.get(f"{BASE_URL}/api/orders", params={"limit": 1}, auth=AUTH)
+        text = scrape()
+        assert sample(text, r'db_operations_total\{[^}]*\}') > 0
+        assert sample(text, r'http_request_db_operations_count\{method="GET",route="/api/orders"\}') >= 1
+        print("✓ Database operations charged to requests")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
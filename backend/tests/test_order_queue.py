@@ -0,0 +1,72 @@
+"""
+Backend tests for Honey Farm e-commerce app - Order intake queue
+Tests: Idempotency-Key replay, background write, queue metrics
+"""
+import pytest
+import requests
+import os
+import time
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+ORDER_DATA = {
+    "customer_name": "TEST_Очередь",
+    "customer_phone": "+7 (700) 444 55 66",
+    "items": [{"name": "Мёд Цветочный", "weight": "550гр", "price": 2200, "quantity": 2}],
+    "subtotal": 4400,
+    "discount": 0,
+    "total": 4400,
+    "promocode": None
+}
+
+
+class TestOrderQueue:
+    """Test POST /api/orders intake and GET /api/admin/order-queue"""
+
+    def test_idempotency_key_returns_same_order(self):
+        """Retrying a checkout with the same key does not create a second order"""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        first = requests.post(f"{BASE_URL}/api/orders", json=ORDER_DATA, headers=headers)
+        second = requests.post(f"{BASE_URL}/api/orders", json=ORDER_DATA, headers=headers)
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["id"] == second.json()["id"]
+        assert first.json()["created_at"] == second.json()["created_at"]
+        print("✓ Idempotency-Key replays the original order")
+
+    def test_queued_order_is_written(self):
+        """An acknowledged order shows up in the admin list shortly after"""
+        order_id = requests.post(f"{BASE_URL}/api/orders", json=ORDER_DATA).json()["id"]
+        for _ in range(50):
+            response = requests.get(f"{BASE_URL}/api/orders", params={"phone": ORDER_DATA["customer_phone"]}, auth=AUTH)
+            if order_id in {order["id"] for order in response.json()}:
+                break
+            time.sleep(0.2)
+        else:
+            pytest.fail("Order was not written by the queue worker")
+        print("✓ Queued order written to the database")
+
+    def test_queue_stats_require_auth(self):
+        response = requests.get(f"{BASE_URL}/api/admin/order-queue")
+        assert response.status_code == 401
+
+        response = requests.get(f"{BASE_URL}/api/admin/order-queue", auth=AUTH)
+        assert response.status_code == 200
+        stats = response.json()
+        for key in ("depth", "lag_seconds", "processed", "failed_batches"):
+            assert key in stats
+        # MariaDB and SQLite deployments write orders within the request by default
+        assert stats["mode"] in ("queue", "direct")
+        print(f"✓ Intake mode {stats['mode']}, queue depth {stats['depth']}, lag {stats['lag_seconds']}s")
+
+    def test_cleanup_test_orders(self):
+        response = requests.get(f"{BASE_URL}/api/orders", params={"phone": ORDER_DATA["customer_phone"], "limit": 500}, auth=AUTH)
+        if response.status_code == 200:
+            for order in response.json():
+                requests.delete(f"{BASE_URL}/api/orders/{order['id']}", auth=AUTH)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
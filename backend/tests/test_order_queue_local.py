@@ -0,0 +1,74 @@
+"""
+Backend tests for Honey Farm e-commerce app - Order intake queue file, in process
+Tests: claim tokens after a reclaim, retries handed out alone, dead orders
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from order_queue import OrderQueue  # noqa: E402
+
+
+def order(n: int) -> dict:
+    return {"id": f"order-{n}", "customer_name": "TEST", "total": 100}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = OrderQueue(tmp_path / "queue.db", claim_timeout=60, max_attempts=3)
+    for n in range(5):
+        queue.enqueue(order(n))
+    return queue
+
+
+class TestOrderQueueClaims:
+    """A reclaimed batch belongs to the new claim only"""
+
+    def test_stale_claim_cannot_finish(self, queue):
+        first, batch = queue.claim(10)
+        assert len(batch) == 5
+        queue.claim_timeout = -1  # the first worker is now presumed dead
+        second, reclaimed = queue.claim(10)
+        assert [seq for seq, _ in reclaimed] == [seq for seq, _ in batch[:1]]
+
+        queue.update(first, reclaimed[0][0], {**reclaimed[0][1], "promocode_status": "redeemed"})
+        queue.complete(first, [seq for seq, _ in batch])
+        stats = queue.stats()
+        assert stats["done"] == 4 and stats["processing"] == 1
+        print("✓ The first claim no longer finishes the reclaimed order")
+
+    def test_retry_is_claimed_alone(self, queue):
+        token, batch = queue.claim(10)
+        queue.release(token, [seq for seq, _ in batch])
+        token, retry = queue.claim(10)
+        assert [o["id"] for _, o in retry] == ["order-0"]
+        queue.complete(token, [seq for seq, _ in retry])
+        # The head succeeded on its own; the rest go out as a batch again
+        token, batch = queue.claim(10)
+        assert len(batch) == 1 and batch[0][1]["id"] == "order-1"
+        print("✓ Failed orders are retried one at a time")
+
+
+class TestDeadOrders:
+    """An order that keeps failing is parked and can be queued again"""
+
+    def test_dead_after_max_attempts(self, queue):
+        for _ in range(3):
+            token, batch = queue.claim(10)
+            assert batch[0][1]["id"] == "order-0"
+            queue.release(token, [seq for seq, _ in batch])
+        stats = queue.stats()
+        assert stats["dead"] == 1 and stats["pending"] == 4
+        token, batch = queue.claim(10)
+        assert [o["id"] for _, o in batch] == ["order-1"]
+
+        assert queue.retry_dead() == 1
+        assert queue.stats()["dead"] == 0
+        print("✓ Order parked as dead after 3 attempts and requeued")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,167 @@
+"""
+Backend tests for Honey Farm e-commerce app - Orders pagination
+Tests: keyset cursor, field projection, filters
+"""
+import pytest
+import requests
+import os
+import csv
+import io
+import json
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+def create_test_order(name, phone):
+    order_data = {
+        "customer_name": name,
+        "customer_phone": phone,
+        "items": [{"name": "Мёд Гречишный", "weight": "1кг", "price": 3500, "quantity": 1}],
+        "subtotal": 3500,
+        "discount": 0,
+        "total": 3500,
+        "promocode": None
+    }
+    response = requests.post(f"{BASE_URL}/api/orders", json=order_data)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def wait_for_orders(ids, timeout=10):
+    """Orders are written by a background worker; wait until they are listed"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BASE_URL}/api/orders", params={"limit": 50, "fields": "id"}, auth=AUTH)
+        if set(ids) <= {order["id"] for order in response.json()}:
+            return
+        time.sleep(0.2)
+    pytest.fail("Queued orders were not written in time")
+
+
+class TestOrdersPagination:
+    """Test GET /api/orders cursor pagination"""
+
+    def test_cursor_walks_pages_without_overlap(self):
+        """Pages of size 1 follow X-Next-Cursor and never repeat an order"""
+        ids = [create_test_order(f"TEST_Страница {i}", "+7 (700) 555 00 0%d" % i) for i in range(3)]
+        wait_for_orders(ids)
+
+        seen = []
+        cursor = None
+        for page_number in range(3):
+            params = {"limit": 1}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}/api/orders", params=params, auth=AUTH)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) == 1
+            seen.append(page[0]["id"])
+            cursor = response.headers.get("X-Next-Cursor")
+            if page_number < 2:
+                assert cursor, "Expected a next cursor while more orders exist"
+
+        assert len(set(seen)) == 3
+        # Newest first
+        assert seen == list(reversed(ids))
+        # On a fresh database the third page is the last; otherwise only older orders follow
+        if cursor:
+            response = requests.get(f"{BASE_URL}/api/orders", params={"limit": 1, "cursor": cursor}, auth=AUTH)
+            assert response.status_code == 200
+            assert not {o["id"] for o in response.json()} & set(ids)
+        print("✓ Cursor pagination returns distinct pages, newest first")
+
+    def test_fields_projection_skips_items(self):
+        """fields= limits the returned keys and always keeps id/created_at"""
+        response = requests.get(
+            f"{BASE_URL}/api/orders",
+            params={"limit": 5, "fields": "customer_name,total"},
+            auth=AUTH
+        )
+        assert response.status_code == 200
+        for order in response.json():
+            assert set(order) == {"id", "created_at", "customer_name", "total"}
+        print("✓ Field projection works")
+
+    def test_unknown_field_rejected(self):
+        response = requests.get(f"{BASE_URL}/api/orders", params={"fields": "password"}, auth=AUTH)
+        assert response.status_code == 400
+
+    def test_phone_filter(self):
+        """phone= returns only that customer's orders"""
+        phone = "+7 (700) 555 99 99"
+        order_id = create_test_order("TEST_Фильтр", phone)
+        response = requests.get(f"{BASE_URL}/api/orders", params={"phone": phone}, auth=AUTH)
+        assert response.status_code == 200
+        orders = response.json()
+        assert order_id in [o["id"] for o in orders]
+        assert all(o["customer_phone"] == phone for o in orders)
+        print("✓ Phone filter works")
+
+    def test_cleanup_test_orders(self):
+        """Remove test orders"""
+        response = requests.get(f"{BASE_URL}/api/orders", params={"limit": 500}, auth=AUTH)
+        if response.status_code == 200:
+            for order in response.json():
+                if order["customer_name"].startswith("TEST_"):
+                    requests.delete(f"{BASE_URL}/api/orders/{order['id']}", auth=AUTH)
+        print("✓ Test orders cleaned up")
+
+
+class TestOrdersExport:
+    """Test GET /api/orders/export streaming dump"""
+
+    def test_export_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/orders/export")
+        assert response.status_code == 401
+
+    def test_ndjson_has_one_row_per_item(self):
+        order_id = create_test_order("TEST_Выгрузка", "+7 (700) 555 11 22")
+        wait_for_orders([order_id])
+
+        response = requests.get(f"{BASE_URL}/api/orders/export", params={"format": "ndjson"}, auth=AUTH, stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        ours = [row for row in rows if row["order_id"] == order_id]
+        assert len(ours) == 1
+        assert ours[0]["item_name"] == "Мёд Гречишный"
+        assert ours[0]["line_total"] == ours[0]["price"] * ours[0]["quantity"]
+        print(f"✓ Exported {len(rows)} line items as NDJSON")
+
+    def test_csv_header(self):
+        response = requests.get(f"{BASE_URL}/api/orders/export", params={"format": "csv"}, auth=AUTH)
+        assert response.status_code == 200
+        assert "attachment" in response.headers["content-disposition"]
+        header = response.content.decode("utf-8-sig").splitlines()[0]
+        assert header.startswith("order_id,created_at,customer_name")
+
+    def test_csv_neutralizes_formulas(self):
+        """Cells that a spreadsheet would run as a formula are exported as text"""
+        order_id = create_test_order("=HYPERLINK(\"http://example.com\")", "+7 (700) 555 33 44")
+        wait_for_orders([order_id])
+
+        response = requests.get(f"{BASE_URL}/api/orders/export", params={"format": "csv"}, auth=AUTH)
+        rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+        ours = [row for row in rows if row["order_id"] == order_id]
+        # NDJSON is not opened by spreadsheets and keeps the values as entered
+        response = requests.get(f"{BASE_URL}/api/orders/export", params={"format": "ndjson"}, auth=AUTH)
+        raw = [json.loads(line) for line in response.iter_lines() if line]
+        raw = [row for row in raw if row["order_id"] == order_id]
+        requests.delete(f"{BASE_URL}/api/orders/{order_id}", auth=AUTH)
+
+        assert ours[0]["customer_name"] == "'=HYPERLINK(\"http://example.com\")"
+        assert ours[0]["customer_phone"] == "'+7 (700) 555 33 44"
+        assert ours[0]["item_name"] == "Мёд Гречишный"
+        assert raw[0]["customer_name"] == "=HYPERLINK(\"http://example.com\")"
+        print("✓ CSV export prefixes formula-like cells")
+
+    def test_unknown_format_rejected(self):
+        response = requests.get(f"{BASE_URL}/api/orders/export", params={"format": "xlsx"}, auth=AUTH)
+        assert response.status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
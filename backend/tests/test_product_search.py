@@ -0,0 +1,80 @@
+"""
+Backend tests for Honey Farm e-commerce app - Product search
+Tests: GET /api/products/search full text, prefixes, facets, price range
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+PRODUCT_DATA = {
+    "name": "TEST_Пыльца цветочная",
+    "description": "Свежая пыльца с горных лугов",
+    "category_id": "cat-honey",
+    "base_price": 777,
+    "weight_prices": []
+}
+
+
+def search(**params):
+    response = requests.get(f"{BASE_URL}/api/products/search", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(scope="class")
+def product():
+    response = requests.post(f"{BASE_URL}/api/products", json=PRODUCT_DATA, auth=AUTH)
+    assert response.status_code == 200
+    created = response.json()
+    yield created
+    requests.delete(f"{BASE_URL}/api/products/{created['id']}", auth=AUTH)
+
+
+class TestProductSearch:
+    """Test the in-memory product search index"""
+
+    def test_word_forms_and_case(self, product):
+        for q in ("пыльца", "ПЫЛЬЦЫ", "пыльцу"):
+            ids = [p["id"] for p in search(q=q)["products"]]
+            assert product["id"] in ids, q
+        print("✓ Word forms match the same product")
+
+    def test_prefix_of_last_word(self, product):
+        result = search(q="цветочная пыл")
+        assert product["id"] in [p["id"] for p in result["products"]]
+        # A trailing space means the word is complete
+        assert product["id"] not in [p["id"] for p in search(q="пыл ")["products"]]
+
+    def test_description_and_facets(self, product):
+        result = search(q="горных лугов")
+        assert product["id"] in [p["id"] for p in result["products"]]
+        assert result["facets"]["categories"].get("cat-honey", 0) >= 1
+        assert result["total"] >= 1
+
+    def test_price_range_and_category(self, product):
+        ids = [p["id"] for p in search(q="пыльца", min_price=700, max_price=800)["products"]]
+        assert product["id"] in ids
+        assert product["id"] not in [p["id"] for p in search(q="пыльца", min_price=800)["products"]]
+        assert search(q="пыльца", category="cat-missing")["total"] == 0
+
+    def test_index_follows_updates(self, product):
+        update = {**PRODUCT_DATA, "name": "TEST_Перга"}
+        response = requests.put(f"{BASE_URL}/api/products/{product['id']}", json=update, auth=AUTH)
+        assert response.status_code == 200
+        assert product["id"] in [p["id"] for p in search(q="перга")["products"]]
+        assert product["id"] not in [p["id"] for p in search(q="цветочная")["products"]]
+
+        requests.delete(f"{BASE_URL}/api/products/{product['id']}", auth=AUTH)
+        assert product["id"] not in [p["id"] for p in search(q="перга")["products"]]
+        print("✓ Search index follows product writes")
+
+    def test_empty_query_lists_catalog(self):
+        products = requests.get(f"{BASE_URL}/api/products").json()
+        assert search(limit=200)["total"] == len(products)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
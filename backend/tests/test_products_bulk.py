@@ -0,0 +1,73 @@
+"""
+Backend tests for Honey Farm e-commerce app - Bulk product import
+Tests: POST /api/products/bulk with CSV and NDJSON, per-row results
+"""
+import pytest
+import requests
+import os
+import json
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+CSV_DATA = (
+    "name,category_id,base_price,weight_prices\n"
+    "TEST_Мёд Импорт,cat-honey,1000,250гр=1000;1кг=3000\n"
+    "TEST_Без категории,cat-missing,500,\n"
+    "TEST_Без цены,cat-honey,,\n"
+)
+
+
+def upload(content, filename, **params):
+    return requests.post(
+        f"{BASE_URL}/api/products/bulk",
+        files={"file": (filename, content.encode())},
+        params=params,
+        auth=AUTH
+    )
+
+
+class TestProductsBulk:
+    """Test bulk product import"""
+
+    def test_requires_auth(self):
+        response = requests.post(f"{BASE_URL}/api/products/bulk", files={"file": ("p.csv", CSV_DATA.encode())})
+        assert response.status_code == 401
+
+    def test_dry_run_reports_rows_without_writing(self):
+        response = upload(CSV_DATA, "products.csv", dry_run="true")
+        assert response.status_code == 200
+        result = response.json()
+        assert result["dry_run"] is True
+        assert [row["status"] for row in result["rows"]] == ["created", "error", "error"]
+        assert "category" in result["rows"][1]["detail"]
+
+        products = requests.get(f"{BASE_URL}/api/products").json()
+        assert not any(p["name"] == "TEST_Мёд Импорт" for p in products)
+        print("✓ Dry run validates every row")
+
+    def test_csv_creates_then_ndjson_updates_by_name(self):
+        response = upload(CSV_DATA, "products.csv")
+        assert response.status_code == 200
+        created = response.json()["rows"][0]
+        assert created["status"] == "created"
+
+        update = json.dumps({"name": "TEST_Мёд Импорт", "weight_prices": [{"weight": "1кг", "price": 3300}]})
+        response = upload(update + "\n", "prices.ndjson")
+        assert response.status_code == 200
+        row = response.json()["rows"][0]
+        assert row == {"row": 1, "id": created["id"], "status": "updated"}
+
+        product = requests.get(f"{BASE_URL}/api/products/{created['id']}").json()
+        assert product["base_price"] == 1000
+        assert product["weight_prices"] == [{"weight": "1кг", "price": 3300}]
+        print("✓ Seasonal price update applied by name")
+
+    def test_cleanup_test_products(self):
+        for product in requests.get(f"{BASE_URL}/api/products").json():
+            if product["name"].startswith("TEST_"):
+                requests.delete(f"{BASE_URL}/api/products/{product['id']}", auth=AUTH)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,69 @@
+"""
+Backend tests for Honey Farm e-commerce app - Slow-request profiler
+Tests: admin-only profiling, X-Profile per request, window profiles in collapsed format
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+class TestProfiler:
+    """Test the admin profiling endpoints"""
+
+    def test_profiles_require_auth(self):
+        assert requests.get(f"{BASE_URL}/api/admin/profiles").status_code == 401
+        response = requests.post(f"{BASE_URL}/api/admin/profile", params={"seconds": 1})
+        assert response.status_code == 401
+        print("✓ Profiling requires admin auth")
+
+    def test_x_profile_ignored_without_auth(self):
+        response = requests.get(f"{BASE_URL}/api/products", headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert response.headers.get("X-Profile-Id") in (None, "unavailable")
+        print("✓ X-Profile without credentials is not profiled")
+
+    def test_profile_single_request(self):
+        response = requests.get(f"{BASE_URL}/api/bootstrap", headers={"X-Profile": "1"}, auth=AUTH)
+        assert response.status_code == 200
+        profile_id = response.headers.get("X-Profile-Id")
+        assert profile_id
+        if profile_id == "unavailable":
+            pytest.skip("Another profiling session is running")
+
+        listed = requests.get(f"{BASE_URL}/api/admin/profiles", auth=AUTH).json()
+        entry = next(p for p in listed if p["id"] == profile_id)
+        assert entry["route"] == "GET /api/bootstrap"
+        assert "collapsed" not in entry
+
+        profile = requests.get(f"{BASE_URL}/api/admin/profiles/{profile_id}", auth=AUTH)
+        assert profile.status_code == 200
+        assert profile.headers["Content-Type"].startswith("text/plain")
+        for line in profile.text.splitlines():
+            stack, _, count = line.rpartition(" ")
+            assert stack and int(count) > 0
+        print(f"✓ Profile {profile_id}: {entry['samples']} samples")
+
+    def test_unknown_profile_404(self):
+        response = requests.get(f"{BASE_URL}/api/admin/profiles/nonexistent", auth=AUTH)
+        assert response.status_code == 404
+        print("✓ Unknown profile returns 404")
+
+    def test_window_profile(self):
+        response = requests.post(f"{BASE_URL}/api/admin/profile", params={"seconds": 1}, auth=AUTH)
+        if response.status_code == 409:
+            pytest.skip("Another profiling session is running")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain")
+        print(f"✓ Window profile: {len(response.text.splitlines())} stacks")
+
+    def test_window_profile_limits(self):
+        response = requests.post(f"{BASE_URL}/api/admin/profile", params={"seconds": 3600}, auth=AUTH)
+        assert response.status_code == 422
+        print("✓ Window length is capped")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
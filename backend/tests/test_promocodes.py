@@ -0,0 +1,142 @@
+"""
+Backend tests for Honey Farm e-commerce app - Promocodes
+Tests: canonical codes, case-insensitive validation, reservations, redemption limits
+"""
+import pytest
+import requests
+import os
+import time
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+@pytest.fixture
+def limited_promocode():
+    """One-use promocode created in lower case and removed afterwards"""
+    code = f"test_{uuid.uuid4().hex[:8]}"
+    response = requests.post(f"{BASE_URL}/api/promocodes", json={
+        "code": code,
+        "discount_type": "percent",
+        "discount_value": 10,
+        "max_uses": 1
+    }, auth=AUTH)
+    assert response.status_code == 200
+    promo = response.json()
+    yield promo
+    requests.delete(f"{BASE_URL}/api/promocodes/{promo['id']}", auth=AUTH)
+
+
+def order_with(code, reservation_id=None):
+    return {
+        "customer_name": "TEST_Промо",
+        "customer_phone": "+7 (700) 333 44 55",
+        "items": [{"name": "Мёд Гречишный", "weight": "1кг", "price": 3500, "quantity": 1}],
+        "subtotal": 3500,
+        "discount": 350,
+        "total": 3150,
+        "promocode": code,
+        "promocode_reservation": reservation_id
+    }
+
+
+class TestPromocodes:
+    """Promocode validation and redemption"""
+
+    def test_code_is_stored_upper_case(self, limited_promocode):
+        assert limited_promocode["code"] == limited_promocode["code"].upper()
+
+    def test_duplicate_code_rejected(self, limited_promocode):
+        response = requests.post(f"{BASE_URL}/api/promocodes", json={
+            "code": limited_promocode["code"].lower(),
+            "discount_type": "fixed",
+            "discount_value": 100,
+            "max_uses": 5
+        }, auth=AUTH)
+        assert response.status_code == 409
+
+    def test_validate_any_case_returns_reservation(self, limited_promocode):
+        response = requests.post(f"{BASE_URL}/api/promocodes/validate", json={
+            "code": f"  {limited_promocode['code'].lower()} ",
+            "subtotal": 3500
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["code"] == limited_promocode["code"]
+        assert data["discount"] == 350
+        assert data["reservation_id"]
+        print("✓ Validation is case-insensitive and reserves the code")
+
+    def test_validate_rejects_malformed_items(self):
+        for items in ([{"quantity": 1}], "not a list"):
+            response = requests.post(f"{BASE_URL}/api/promocodes/validate", json={"code": "ANY", "items": items})
+            assert response.status_code == 422
+        print("✓ Malformed cart items are a 422, not a 500")
+
+    def test_reservation_holds_last_use(self, limited_promocode):
+        """A one-use code reserved by one cart cannot be reserved by another"""
+        first = requests.post(f"{BASE_URL}/api/promocodes/validate", json={
+            "code": limited_promocode["code"], "subtotal": 3500
+        })
+        assert first.status_code == 200
+        second = requests.post(f"{BASE_URL}/api/promocodes/validate", json={
+            "code": limited_promocode["code"], "subtotal": 3500
+        })
+        assert second.status_code == 400
+
+        # Re-validating the same cart renews its reservation instead of taking another use
+        again = requests.post(f"{BASE_URL}/api/promocodes/validate", json={
+            "code": limited_promocode["code"], "subtotal": 3500, "reservation_id": first.json()["reservation_id"]
+        })
+        assert again.status_code == 200
+        assert again.json()["reservation_id"] == first.json()["reservation_id"]
+
+        # The holder of the reservation can still check out
+        response = requests.post(
+            f"{BASE_URL}/api/orders",
+            json=order_with(limited_promocode["code"], first.json()["reservation_id"])
+        )
+        assert response.status_code == 200
+        print("✓ Reservation holds the last use for its cart")
+
+    def test_exhausted_code_rejects_order(self, limited_promocode):
+        mode = requests.get(f"{BASE_URL}/api/admin/order-queue", auth=AUTH).json()["mode"]
+        first = requests.post(f"{BASE_URL}/api/orders", json=order_with(limited_promocode["code"]))
+        assert first.status_code == 200
+        second = requests.post(f"{BASE_URL}/api/orders", json=order_with(limited_promocode["code"]))
+        if mode == "direct":
+            # Written within the request: the checkout itself is refused
+            assert second.status_code == 400
+            print("✓ Exhausted promocode refuses the checkout")
+            return
+        assert second.status_code == 200
+
+        # Redemption happens in the order worker; the second order is flagged and loses its discount
+        orders = {}
+        for _ in range(50):
+            response = requests.get(f"{BASE_URL}/api/orders", params={
+                "promocode": limited_promocode["code"].upper(),
+                "fields": "promocode_status,discount,total"
+            }, auth=AUTH)
+            orders = {order["id"]: order for order in response.json()}
+            if len(orders) == 2:
+                break
+            time.sleep(0.2)
+        statuses = {order_id: order.get("promocode_status") for order_id, order in orders.items()}
+        assert statuses == {first.json()["id"]: "redeemed", second.json()["id"]: "rejected"}
+        rejected = orders[second.json()["id"]]
+        assert rejected["discount"] == 0
+        assert rejected["total"] == 3500
+        print("✓ Exhausted promocode cannot be redeemed twice")
+
+    def test_cleanup_test_orders(self):
+        response = requests.get(f"{BASE_URL}/api/orders", params={"limit": 500}, auth=AUTH)
+        if response.status_code == 200:
+            for order in response.json():
+                if order["customer_name"].startswith("TEST_"):
+                    requests.delete(f"{BASE_URL}/api/orders/{order['id']}", auth=AUTH)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
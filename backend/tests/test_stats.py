@@ -0,0 +1,67 @@
+"""
+Backend tests for Honey Farm e-commerce app - Admin stats
+Tests: GET /api/stats rollups follow order creation and deletion
+"""
+import pytest
+import requests
+import os
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+ORDER_DATA = {
+    "customer_name": "TEST_Статистика",
+    "customer_phone": "+7 (700) 777 88 99",
+    "items": [{"name": "Свечи восковые", "weight": None, "price": 1500, "quantity": 2}],
+    "promocode": None
+}
+
+
+def total_orders():
+    response = requests.get(f"{BASE_URL}/api/stats", auth=AUTH)
+    assert response.status_code == 200
+    return response.json()["totals"]["orders"]
+
+
+class TestStats:
+    """Test admin analytics"""
+
+    def test_stats_require_auth(self):
+        response = requests.get(f"{BASE_URL}/api/stats")
+        assert response.status_code == 401
+
+    def test_stats_shape(self):
+        response = requests.get(f"{BASE_URL}/api/stats", params={"granularity": "month", "limit": 3}, auth=AUTH)
+        assert response.status_code == 200
+        stats = response.json()
+        for key in ("totals", "series", "top_products", "promocodes"):
+            assert key in stats
+        assert len(stats["series"]) <= 3
+        print(f"✓ {stats['totals']['orders']} orders, average basket {stats['totals']['average_basket']} ₸")
+
+    def test_bad_period_rejected(self):
+        response = requests.get(f"{BASE_URL}/api/stats", params={"period": "last-year"}, auth=AUTH)
+        assert response.status_code == 400
+
+    def test_rollups_follow_orders(self):
+        before = total_orders()
+        order = requests.post(f"{BASE_URL}/api/orders", json=ORDER_DATA).json()
+
+        # The order is written (and counted) by the queue worker
+        for _ in range(50):
+            if total_orders() > before:
+                break
+            time.sleep(0.2)
+        else:
+            pytest.fail("Stats did not count the new order")
+
+        after_create = total_orders()
+        response = requests.delete(f"{BASE_URL}/api/orders/{order['id']}", auth=AUTH)
+        assert response.status_code == 200
+        assert total_orders() == after_create - 1
+        print("✓ Stats rollups updated on create and delete")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,100 @@
+"""
+Backend tests for Honey Farm e-commerce app - Storage backends
+Tests: /admin/db-pool, category order and about round trip through whichever STORAGE the server runs
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+AUTH = ("armanuha", "secretboost1")
+
+
+class TestStoragePool:
+    """Test the storage diagnostics endpoints"""
+
+    def test_db_pool_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/admin/db-pool")
+        assert response.status_code == 401
+        print("✓ /admin/db-pool requires admin auth")
+
+    def test_db_pool_reports_backend(self):
+        response = requests.get(f"{BASE_URL}/api/admin/db-pool", auth=AUTH)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["storage"] in ("mongo", "sqlite", "mariadb")
+        print(f"✓ Storage backend: {data['storage']}")
+
+    def test_index_report(self):
+        response = requests.get(f"{BASE_URL}/api/admin/indexes", auth=AUTH)
+        assert response.status_code == 200
+        data = response.json()
+        assert "products" in data["indexes"]
+        assert "orders" in data["indexes"]
+        print("✓ Index report covers products and orders")
+
+
+class TestStorageRoundTrip:
+    """Writes read back the same on every backend"""
+
+    def test_category_order(self):
+        created = []
+        try:
+            for i in range(2):
+                response = requests.post(
+                    f"{BASE_URL}/api/categories",
+                    json={"name": f"TEST_storage_{i}", "slug": f"test-storage-{uuid.uuid4().hex[:8]}"},
+                    auth=AUTH,
+                )
+                assert response.status_code == 200
+                created.append(response.json())
+            # New categories go to the end
+            assert created[1]["order"] > created[0]["order"]
+
+            ids = [c["id"] for c in requests.get(f"{BASE_URL}/api/categories").json()]
+            reordered = [created[1]["id"], created[0]["id"]] + [i for i in ids if i not in (created[0]["id"], created[1]["id"])]
+            response = requests.post(f"{BASE_URL}/api/categories/reorder", json=reordered, auth=AUTH)
+            assert response.status_code == 200
+
+            categories = requests.get(f"{BASE_URL}/api/categories").json()
+            assert [c["id"] for c in categories] == reordered
+            assert [c["order"] for c in categories] == list(range(len(reordered)))
+            print("✓ Category order survives create and reorder")
+        finally:
+            for category in created:
+                requests.delete(f"{BASE_URL}/api/categories/{category['id']}", auth=AUTH)
+            # Restore a dense order for the remaining categories
+            remaining = [c["id"] for c in requests.get(f"{BASE_URL}/api/categories").json()]
+            requests.post(f"{BASE_URL}/api/categories/reorder", json=remaining, auth=AUTH)
+
+    def test_update_missing_category_404(self):
+        response = requests.put(
+            f"{BASE_URL}/api/categories/nonexistent",
+            json={"name": "x", "slug": "x"},
+            auth=AUTH,
+        )
+        assert response.status_code == 404
+        print("✓ Updating an unknown category returns 404")
+
+    def test_about_round_trip(self):
+        original = requests.get(f"{BASE_URL}/api/about").json()
+        update = {
+            "title": "TEST_О нас",
+            "description": "Проверка хранилища",
+            "features": [{"text": "Мёд", "icon": "FaStar"}],
+        }
+        try:
+            response = requests.put(f"{BASE_URL}/api/about", json=update, auth=AUTH)
+            assert response.status_code == 200
+            about = requests.get(f"{BASE_URL}/api/about").json()
+            assert about["title"] == update["title"]
+            assert about["features"] == update["features"]
+            print("✓ About page round-trips Cyrillic text and features")
+        finally:
+            restore = {k: original[k] for k in ("title", "description", "features")}
+            requests.put(f"{BASE_URL}/api/about", json=restore, auth=AUTH)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,252 @@
+"""
+Backend tests for Honey Farm e-commerce app - SQL storage, in process
+Tests: SQLiteStorage against a temporary database file (promocode capacity,
+keyset order pages, bulk product writes, cache versions, direct order intake)
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import storage  # noqa: E402
+from storage_sql import KeyTaken, SQLiteStorage  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStorage(tmp_path / "shop.db", threads=4)
+    run(store.setup())
+    yield store
+    run(store.close())
+
+
+def promocode(code: str, max_uses: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "code": code, "discount_type": "percent", "discount_value": 10,
+        "max_uses": max_uses, "current_uses": 0, "is_active": True,
+    }
+
+
+def order(created_at: datetime, phone: str = "+7 700 000 00 00", code=None) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "customer_name": "TEST", "customer_phone": phone,
+        "items": [{"product_id": "p1", "name": "Мёд", "weight": "550гр", "price": 2200.0, "quantity": 1}],
+        "subtotal": 2200.0, "discount": 0, "total": 2200.0, "promocode": code,
+        "created_at": created_at.isoformat(),
+    }
+
+
+def product(product_id: str) -> dict:
+    return {
+        "id": product_id, "name": f"Товар {product_id}", "description": "", "category_id": "cat-honey",
+        "image": "", "base_price": 1000, "weight_prices": [{"weight": "250гр", "price": 1000}],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class TestPromocodeCapacity:
+    """Reservations and redemptions never exceed max_uses"""
+
+    def test_reservations_hold_capacity(self, store):
+        run(store.insert_promocode(promocode("HOLD", 2)))
+        first = run(store.reserve_promocode("HOLD", 600))[1]
+        second = run(store.reserve_promocode("HOLD", 600))[1]
+        assert first and second
+        assert run(store.reserve_promocode("HOLD", 600)) == (None, None)
+        # Without a reservation there is no free use left
+        assert not run(store.redeem_promocode("HOLD"))
+        assert run(store.redeem_promocode("HOLD", first["id"]))
+        assert run(store.redeem_promocode("HOLD", second["id"]))
+        # A reservation is consumed once
+        assert not run(store.redeem_promocode("HOLD", first["id"]))
+        uses = {p["code"]: p["current_uses"] for p in run(store.list_promocodes())}
+        assert uses["HOLD"] == 2
+        print("✓ Reservations hold capacity and are consumed once")
+
+    def test_renewal_keeps_one_use(self, store):
+        run(store.insert_promocode(promocode("RENEW", 1)))
+        _, reservation = run(store.reserve_promocode("RENEW", 60))
+        for _ in range(3):
+            _, renewed = run(store.reserve_promocode("RENEW", 600, reservation["id"]))
+            assert renewed["id"] == reservation["id"]
+        assert renewed["expires_at"] > reservation["expires_at"]
+        # Another cart still finds the code used up
+        assert run(store.reserve_promocode("RENEW", 600)) == (None, None)
+        assert run(store.reserve_promocode("RENEW", 600, "someone-elses-id")) == (None, None)
+        assert run(store.redeem_promocode("RENEW", reservation["id"]))
+        print("✓ Re-validating a cart renews its reservation")
+
+    def test_expired_reservation_frees_capacity(self, store):
+        run(store.insert_promocode(promocode("EXPIRE", 1)))
+        _, reservation = run(store.reserve_promocode("EXPIRE", -1))
+        assert run(store.reserve_promocode("EXPIRE", 600))[0] is not None
+        # The expired reservation was swept; the live one holds the last use
+        assert not run(store.redeem_promocode("EXPIRE", reservation["id"]))
+        print("✓ Expired reservations stop holding capacity")
+
+    def test_stale_reservation_after_slot_reused(self, store):
+        run(store.insert_promocode(promocode("STALE", 1)))
+        # A queued order's reservation expires before its redemption runs
+        _, stale = run(store.reserve_promocode("STALE", -1))
+        # Another checkout takes the freed use without reserving (nothing sweeps the stale row)
+        assert run(store.redeem_promocode("STALE"))
+        assert not run(store.redeem_promocode("STALE", stale["id"]))
+        uses = {p["code"]: p["current_uses"] for p in run(store.list_promocodes())}
+        assert uses["STALE"] == 1
+        print("✓ A stale reservation does not push uses past max_uses")
+
+    def test_redeem_once_per_order(self, store):
+        run(store.insert_promocode(promocode("ONCE", 2)))
+        _, reservation = run(store.reserve_promocode("ONCE", 600))
+        # Two workers holding the same queued order after a reclaim
+        assert run(store.redeem_promocode("ONCE", reservation["id"], "order-1"))
+        assert run(store.redeem_promocode("ONCE", reservation["id"], "order-1"))
+        uses = {p["code"]: p["current_uses"] for p in run(store.list_promocodes())}
+        assert uses["ONCE"] == 1
+        print("✓ A reclaimed order does not count its use twice")
+
+    def test_concurrent_reservations(self, store):
+        run(store.insert_promocode(promocode("RUSH", 5)))
+
+        async def rush():
+            return await asyncio.gather(*(store.reserve_promocode("RUSH", 600) for _ in range(30)))
+
+        granted = [r for _, r in run(rush()) if r]
+        assert len(granted) == 5
+
+        async def redeem_all():
+            return await asyncio.gather(*(store.redeem_promocode("RUSH", r["id"]) for r in granted))
+
+        assert all(run(redeem_all()))
+        assert not run(store.redeem_promocode("RUSH"))
+        print("✓ 5 of 30 concurrent reservations granted and redeemed")
+
+
+class TestOrderPages:
+    """Keyset pages cover every order once, newest first"""
+
+    def test_keyset_pages(self, store):
+        start = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+        # Pairs share a timestamp, so the id breaks ties across page boundaries
+        orders = [order(start + timedelta(minutes=i // 2)) for i in range(9)]
+        run(store.insert_orders(orders))
+
+        pages, after = [], None
+        while True:
+            page = run(store.list_orders({}, after, limit=4))
+            pages.append(page)
+            if len(page) < 4:
+                break
+            after = (page[-1]["created_at"], page[-1]["id"])
+        seen = [o["id"] for page in pages for o in page]
+        expected = [o["id"] for o in sorted(orders, key=lambda o: (o["created_at"], o["id"]), reverse=True)]
+        assert seen == expected
+        assert all(o["items"] for page in pages for o in page)
+        print(f"✓ {len(seen)} orders in {len(pages)} keyset pages")
+
+    def test_filters_and_projection(self, store):
+        start = datetime(2026, 10, 2, tzinfo=timezone.utc)
+        run(store.insert_orders([order(start, phone="111"), order(start + timedelta(hours=1), phone="222")]))
+        by_phone = run(store.list_orders({"phone": "222"}))
+        assert [o["customer_phone"] for o in by_phone] == ["222"]
+        in_range = run(store.list_orders({"date_from": start.isoformat(),
+                                          "date_to": (start + timedelta(minutes=30)).isoformat()}))
+        assert [o["customer_phone"] for o in in_range] == ["111"]
+        slim = run(store.list_orders({}, fields=["total"]))
+        assert set(slim[0]) == {"id", "created_at", "total"}
+        print("✓ Order filters and field projection")
+
+    def test_insert_skips_written_ids(self, store):
+        first = order(datetime(2026, 10, 3, tzinfo=timezone.utc))
+        assert run(store.insert_orders([first])) == [first]
+        second = order(datetime(2026, 10, 3, 1, tzinfo=timezone.utc))
+        assert run(store.insert_orders([first, second])) == [second]
+        assert len(run(store.list_orders({}))) == 2
+        print("✓ A retried batch does not duplicate orders")
+
+
+class TestBulkProducts:
+    """write_products stops at the first failure, keeping what came before"""
+
+    def test_failure_index(self, store):
+        run(store.insert_categories([{"id": "cat-honey", "name": "Мёд", "slug": "honey", "order": 0}]))
+        run(store.insert_products([product("p1")]))
+        operations = [
+            ("insert", product("p2")),
+            ("update", "p1", {"base_price": 1500}),
+            ("insert", product("p1")),  # duplicate id
+            ("insert", product("p3")),
+        ]
+        with pytest.raises(storage.BulkWriteFailed) as failure:
+            run(store.write_products(operations))
+        assert failure.value.index == 2
+        ids = [p["id"] for p in run(store.list_products())]
+        assert ids == ["p1", "p2"]
+        assert run(store.get_product("p1"))["base_price"] == 1500
+        print("✓ Bulk write reports index 2 and keeps the writes before it")
+
+
+class TestCacheVersions:
+    """Versions shared by every process using the database"""
+
+    def test_bump_and_read(self, store):
+        assert run(store.cache_versions()) == {}
+        before = datetime.now(timezone.utc)
+        assert run(store.bump_versions(["products"]))["products"][0] == 1
+        bumped = run(store.bump_versions(["products", "about"]))
+        assert {name: version for name, (version, _) in bumped.items()} == {"products": 2, "about": 1}
+        # updated_at backs Last-Modified, so it must read back as the same aware instant
+        assert run(store.cache_versions()) == bumped
+        assert all(updated_at >= before for _, updated_at in bumped.values())
+        print("✓ bump_versions counts every change")
+
+
+class TestPlaceOrder:
+    """Direct intake: redemption and insert succeed or fail together"""
+
+    def test_idempotency_and_exhaustion(self, store):
+        run(store.insert_promocode(promocode("ONCE", 1)))
+        now = datetime.now(timezone.utc)
+        placed, created = run(store.place_order(order(now, code="ONCE"), "key-1"))
+        assert created and placed["promocode_status"] == "redeemed"
+
+        replay, created = run(store.place_order(order(now, code="ONCE"), "key-1"))
+        assert not created and replay["id"] == placed["id"]
+        assert "idempotency_key" not in replay
+
+        with pytest.raises(storage.PromocodeExhausted):
+            run(store.place_order(order(now, code="ONCE"), "key-2"))
+        assert [o["id"] for o in run(store.list_orders({}))] == [placed["id"]]
+
+        unknown, _ = run(store.place_order(order(now, code="NOSUCH")))
+        assert unknown["promocode_status"] == "unknown"
+        print("✓ place_order replays keys and writes nothing for an exhausted code")
+
+    def test_lost_key_without_order(self, store, monkeypatch):
+        placed, _ = run(store.place_order(order(datetime.now(timezone.utc)), "key-lost"))
+
+        def key_taken(s, *args):
+            raise KeyTaken("key-lost")
+
+        # Another checkout took the key between our lookup and our insert
+        monkeypatch.setattr(store, "_place_order", key_taken)
+        replay, created = run(store.place_order(order(datetime.now(timezone.utc)), "key-lost"))
+        assert not created and replay["id"] == placed["id"]
+        # ...and its order was deleted before we could read it back
+        run(store.delete_order(placed["id"]))
+        with pytest.raises(storage.IdempotencyConflict):
+            run(store.place_order(order(datetime.now(timezone.utc)), "key-lost"))
+        print("✓ A key whose order is gone raises IdempotencyConflict")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
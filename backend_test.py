@@ -189,7 +189,8 @@ class HoneyFarmAPITester:
     def test_seed_data(self):
         """Test seed data endpoint"""
         print("\n=== TESTING SEED DATA ===")
-        self.run_test("Seed Data", "POST", "seed", 200)
+        self.run_test("Seed Data", "POST", "seed", 200, auth=self.admin_auth)
+        self.run_test("Seed Data Requires Auth", "POST", "seed", 401)
 
     def test_filtering(self):
         """Test product filtering by category"""
@@ -11,6 +11,13 @@ import PrivacyPage from "@/pages/PrivacyPage";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 export const API = `${BACKEND_URL}/api`;
 
+// Uploaded images are served by the backend as /api/images/<hash>;
+// `width` asks it for a resized WebP/AVIF variant
+export const imageSrc = (src, width) => {
+  if (!src || !src.startsWith("/api/")) return src;
+  return width ? `${BACKEND_URL}${src}?w=${width}` : `${BACKEND_URL}${src}`;
+};
+
 // Cart Context
 export const CartContext = createContext();
 
@@ -24,6 +31,7 @@ function App() {
   });
   const [categories, setCategories] = useState([]);
   const [products, setProducts] = useState([]);
+  const [about, setAbout] = useState(null);
   const [loading, setLoading] = useState(true);
 
   // Save cart to localStorage whenever it changes
@@ -33,15 +41,10 @@ function App() {
 
   const fetchData = async () => {
     try {
-      // Seed data first
-      await axios.post(`${API}/seed`);
-      
-      const [catRes, prodRes] = await Promise.all([
-        axios.get(`${API}/categories`),
-        axios.get(`${API}/products`)
-      ]);
-      setCategories(catRes.data);
-      setProducts(prodRes.data);
+      const { data } = await axios.get(`${API}/bootstrap`, { params: { view: "card" } });
+      setCategories(data.categories);
+      setProducts(data.products);
+      setAbout(data.about);
     } catch (e) {
       console.error("Error fetching data:", e);
       toast.error("Ошибка загрузки данных");
@@ -59,7 +62,7 @@ function App() {
       id: `${product.id}-${selectedWeight?.weight || 'default'}`,
       productId: product.id,
       name: product.name,
-      image: product.image,
+      image: imageSrc(product.image, 160),
       weight: selectedWeight?.weight || null,
       price: selectedWeight?.price || product.base_price,
       quantity: 1
@@ -109,6 +112,7 @@ function App() {
       cartTotal,
       categories,
       products,
+      about,
       loading,
       fetchData
     }}>
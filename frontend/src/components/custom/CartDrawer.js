@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { useCart } from "@/App";
 import { Sheet, SheetContent, SheetHeader, SheetTitle } from "@/components/ui/sheet";
 import { Dialog, DialogContent } from "@/components/ui/dialog";
@@ -77,9 +77,37 @@ const CartDrawer = ({ isOpen, onClose }) => {
   const [redirectMessenger, setRedirectMessenger] = useState(null);
   const [redirectCountdown, setRedirectCountdown] = useState(4);
   const [redirectUrl, setRedirectUrl] = useState("");
+  // Один ключ на попытку оформления: повторная отправка не создаст дубль заказа
+  const orderKeyRef = useRef(null);
+  // Повторное применение промокода продлевает бронь этой корзины, а не занимает ещё одно использование
+  const promoReservationRef = useRef(null);
 
-  const discount = appliedPromo?.discount || 0;
-  const finalTotal = Math.max(0, cartTotal - discount);
+  const [quote, setQuote] = useState(null);
+
+  const cartLines = cart.map(item => ({
+    product_id: item.productId || null,
+    name: item.name,
+    weight: item.weight || null,
+    quantity: item.quantity
+  }));
+
+  // Итоговые суммы считает сервер по актуальным ценам; локальный расчёт — пока ответ не пришёл
+  useEffect(() => {
+    if (!isOpen || cart.length === 0) {
+      setQuote(null);
+      return;
+    }
+    let cancelled = false;
+    axios.post(`${API}/cart/quote`, { items: cartLines, promocode: appliedPromo?.code || null })
+      .then(response => { if (!cancelled) setQuote(response.data); })
+      .catch(() => { if (!cancelled) setQuote(null); });
+    return () => { cancelled = true; };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [isOpen, cart, appliedPromo?.code]);
+
+  const subtotal = quote?.subtotal ?? cartTotal;
+  const discount = quote ? quote.discount : (appliedPromo?.discount || 0);
+  const finalTotal = quote ? quote.total : Math.max(0, cartTotal - discount);
 
   const formatPhoneNumber = (value) => {
     // Remove all non-digits except the leading +
@@ -126,8 +154,11 @@ const CartDrawer = ({ isOpen, onClose }) => {
     try {
       const response = await axios.post(`${API}/promocodes/validate`, {
         code: promocode.trim(),
-        subtotal: cartTotal
+        items: cartLines,
+        subtotal: cartTotal,
+        reservation_id: promoReservationRef.current
       });
+      promoReservationRef.current = response.data.reservation_id;
       setAppliedPromo(response.data);
       toast.success(`Промокод применён! Скидка: ${response.data.discount} ₸`);
     } catch (error) {
@@ -155,7 +186,7 @@ const CartDrawer = ({ isOpen, onClose }) => {
       message += ` - ${item.quantity} шт. x ${item.price} ₸ = ${item.quantity * item.price} ₸\n`;
     });
     
-    message += `\nСумма: ${cartTotal} ₸`;
+    message += `\nСумма: ${subtotal} ₸`;
     if (appliedPromo) {
       message += `\nПромокод: ${appliedPromo.code} (-${discount} ₸)`;
     }
@@ -187,18 +218,26 @@ const CartDrawer = ({ isOpen, onClose }) => {
         customer_name: customerName,
         customer_phone: customerPhone,
         items: cart.map(item => ({
+          product_id: item.productId || null,
           name: item.name,
           weight: item.weight || null,
           price: item.price,
           quantity: item.quantity
         })),
-        subtotal: cartTotal,
+        subtotal: subtotal,
         discount: discount,
         total: finalTotal,
-        promocode: appliedPromo?.code || null
+        promocode: appliedPromo?.code || null,
+        promocode_reservation: appliedPromo?.reservation_id || null
       };
       
-      await axios.post(`${API}/orders`, orderData);
+      if (!orderKeyRef.current) {
+        orderKeyRef.current = crypto.randomUUID();
+      }
+      await axios.post(`${API}/orders`, orderData, {
+        headers: { "Idempotency-Key": orderKeyRef.current }
+      });
+      orderKeyRef.current = null;
       console.log("Order saved successfully");
       return true;
     } catch (error) {
@@ -378,7 +417,7 @@ const CartDrawer = ({ isOpen, onClose }) => {
             <div className="space-y-1">
               <div className="flex justify-between items-center text-sm">
                 <span className="text-muted-foreground font-bold">Сумма:</span>
-                <span className="text-foreground font-bold">{cartTotal} ₸</span>
+                <span className="text-foreground font-bold">{subtotal} ₸</span>
               </div>
               {appliedPromo && (
                 <div className="flex justify-between items-center text-sm">
@@ -1,5 +1,6 @@
 import { Button } from "@/components/ui/button";
 import { GiHoneycomb } from "react-icons/gi";
+import { imageSrc } from "@/App";
 
 const ProductCard = ({ product, category, onOpenModal }) => {
   const displayPrice = product.weight_prices?.length > 0
@@ -33,7 +34,7 @@ const ProductCard = ({ product, category, onOpenModal }) => {
       {/* Image Container - pointer-events-none чтобы клики проходили к родителю */}
       <div className="relative aspect-square overflow-hidden bg-amber-50 pointer-events-none">
         <img
-          src={product.image}
+          src={imageSrc(product.image, 640)}
           alt={product.name}
           className="product-image w-full h-full object-cover"
           loading="lazy"
@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
-import { useCart } from "@/App";
+import axios from "axios";
+import { useCart, imageSrc, API } from "@/App";
 import { Dialog, DialogContent, DialogTitle, DialogDescription } from "@/components/ui/dialog";
 import { VisuallyHidden } from "@radix-ui/react-visually-hidden";
 import { Button } from "@/components/ui/button";
@@ -8,6 +9,7 @@ import { FaTimes, FaShoppingCart } from "react-icons/fa";
 const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
   const { addToCart } = useCart();
   const [selectedWeight, setSelectedWeight] = useState(null);
+  const [details, setDetails] = useState(null);
 
   useEffect(() => {
     if (product?.weight_prices?.length > 0) {
@@ -17,8 +19,20 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
     }
   }, [product]);
 
+  // Витрина грузит товары без описаний (view=card) — догружаем при открытии
+  useEffect(() => {
+    if (!isOpen || !product || "description" in product) return;
+    let cancelled = false;
+    axios.get(`${API}/products/${product.id}`)
+      .then(response => { if (!cancelled) setDetails(response.data); })
+      .catch(() => {});
+    return () => { cancelled = true; };
+  }, [isOpen, product]);
+
   if (!product) return null;
 
+  const description = product.description ?? (details?.id === product.id ? details.description : "");
+
   const hasWeights = product.weight_prices && product.weight_prices.length > 0;
   const currentPrice = selectedWeight?.price || product.base_price;
 
@@ -33,7 +47,7 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
       <DialogContent className="max-w-4xl p-0 overflow-hidden bg-white border-0 shadow-2xl max-h-[95vh] md:max-h-[90vh] flex flex-col">
         <VisuallyHidden>
           <DialogTitle>{product?.name || "Товар"}</DialogTitle>
-          <DialogDescription>{product?.description || "Описание товара"}</DialogDescription>
+          <DialogDescription>{description || "Описание товара"}</DialogDescription>
         </VisuallyHidden>
         
         {/* Close Button */}
@@ -52,7 +66,7 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
             {/* Compact Header with Image */}
             <div className="flex gap-3 mb-4">
               <img
-                src={product.image}
+                src={imageSrc(product.image, 160)}
                 alt={product.name}
                 className="w-20 h-20 object-cover rounded-xl flex-shrink-0"
               />
@@ -69,9 +83,9 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
             </div>
 
             {/* Description - Collapsed */}
-            {product.description && (
+            {description && (
               <p className="text-muted-foreground text-sm leading-relaxed mb-4 line-clamp-2 font-bold">
-                {product.description}
+                {description}
               </p>
             )}
 
@@ -124,7 +138,7 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
             {/* Image Section */}
             <div className="relative aspect-square md:aspect-auto md:min-h-[400px] bg-amber-50 flex-shrink-0">
               <img
-                src={product.image}
+                src={imageSrc(product.image, 1280)}
                 alt={product.name}
                 className="w-full h-full object-cover"
               />
@@ -142,9 +156,9 @@ const ProductModal = ({ product, category, isOpen, onClose, onAddToCart }) => {
                 {product.name}
               </h2>
 
-              {product.description && (
+              {description && (
                 <p className="text-muted-foreground text-sm leading-relaxed mb-6 font-bold">
-                  {product.description}
+                  {description}
                 </p>
               )}
 
@@ -1,7 +1,7 @@
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
-import { API } from "@/App";
+import { API, imageSrc } from "@/App";
 import { toast } from "sonner";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
@@ -20,7 +20,7 @@ import {
   DialogHeader,
   DialogTitle,
 } from "@/components/ui/dialog";
-import { FaBox, FaTh, FaChevronRight, FaPlus, FaPencilAlt, FaTrash, FaSignOutAlt, FaTimes, FaUpload, FaCog, FaChevronUp, FaChevronDown, FaUsers, FaTag, FaPercent, FaCheckCircle, FaCheck, FaStar, FaHeart, FaLeaf, FaTruck, FaShieldAlt, FaCertificate, FaAward, FaMedal, FaGem, FaHandshake, FaUserCheck, FaThumbsUp, FaSmile, FaLightbulb, FaBolt, FaFire, FaSun, FaMoon, FaCloud, FaSnowflake, FaHome, FaStore, FaWarehouse, FaIndustry, FaHospital, FaClock, FaCalendarAlt, FaPhone, FaEnvelope, FaMapMarkerAlt, FaDollarSign, FaCreditCard, FaGift, FaChartLine, FaShoppingCart, FaRecycle, FaGripVertical } from "react-icons/fa";
+import { FaBox, FaTh, FaChevronRight, FaPlus, FaPencilAlt, FaTrash, FaSignOutAlt, FaTimes, FaUpload, FaCog, FaChevronUp, FaChevronDown, FaUsers, FaTag, FaPercent, FaCheckCircle, FaCheck, FaStar, FaHeart, FaLeaf, FaTruck, FaShieldAlt, FaCertificate, FaAward, FaMedal, FaGem, FaHandshake, FaUserCheck, FaThumbsUp, FaSmile, FaLightbulb, FaBolt, FaFire, FaSun, FaMoon, FaCloud, FaSnowflake, FaHome, FaStore, FaWarehouse, FaIndustry, FaHospital, FaClock, FaCalendarAlt, FaPhone, FaEnvelope, FaMapMarkerAlt, FaDollarSign, FaCreditCard, FaGift, FaChartLine, FaShoppingCart, FaRecycle, FaGripVertical, FaDownload } from "react-icons/fa";
 import DeleteConfirmDialog from "@/components/custom/DeleteConfirmDialog";
 import { IconSelector } from "@/components/custom/IconSelector";
 import { DragDropContext, Droppable, Draggable } from "@hello-pangea/dnd";
@@ -50,6 +50,8 @@ const AdminPage = () => {
   const [categories, setCategories] = useState([]);
   const [products, setProducts] = useState([]);
   const [orders, setOrders] = useState([]);
+  const [ordersCursor, setOrdersCursor] = useState(null);
+  const [stats, setStats] = useState(null);
   const [promocodes, setPromocodes] = useState([]);
   const [aboutData, setAboutData] = useState(null);
   const [currentView, setCurrentView] = useState("dashboard");
@@ -142,6 +144,7 @@ const AdminPage = () => {
       setCategories(catRes.data);
       setProducts(prodRes.data);
       setOrders(ordersRes.data);
+      setOrdersCursor(ordersRes.headers["x-next-cursor"] || null);
       setPromocodes(promoRes.data);
       setAboutData(aboutRes.data);
       setAboutForm({
@@ -152,16 +155,54 @@ const AdminPage = () => {
     } catch (error) {
       console.error("Error fetching data:", error);
     }
+    fetchStats();
   };
 
-  const handleImageUpload = (e) => {
+  // Сводка считается на сервере по готовым счётчикам, заказы не выгружаются
+  const fetchStats = async () => {
+    try {
+      const response = await axios.get(`${API}/stats`, {
+        ...authHeader,
+        params: { granularity: "month", limit: 1, top: 5 }
+      });
+      setStats(response.data);
+    } catch (error) {
+      console.error("Error fetching stats:", error);
+    }
+  };
+
+  const handleImageUpload = async (e) => {
     const file = e.target.files[0];
     if (file) {
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setProductForm(prev => ({ ...prev, image: reader.result }));
-      };
-      reader.readAsDataURL(file);
+      const formData = new FormData();
+      formData.append("file", file);
+      try {
+        const response = await axios.post(`${API}/images`, formData, authHeader);
+        setProductForm(prev => ({ ...prev, image: response.data.url }));
+      } catch (error) {
+        toast.error("Ошибка загрузки изображения");
+      }
+    }
+  };
+
+  // Массовое обновление каталога из CSV/NDJSON (например, сезонные цены)
+  const importProducts = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = "";
+    if (!file) return;
+    const formData = new FormData();
+    formData.append("file", file);
+    try {
+      const response = await axios.post(`${API}/products/bulk`, formData, authHeader);
+      const { created, updated, errors, rows } = response.data;
+      if (errors > 0) {
+        const first = rows.find(row => row.status === "error");
+        toast.error(`Ошибок: ${errors} (строка ${first.row}: ${first.detail})`);
+      }
+      toast.success(`Импорт: создано ${created}, обновлено ${updated}`);
+      fetchData();
+    } catch (error) {
+      toast.error("Ошибка импорта товаров");
     }
   };
 
@@ -366,6 +407,39 @@ const AdminPage = () => {
     }
   };
 
+  const loadMoreOrders = async () => {
+    if (!ordersCursor) return;
+    try {
+      const response = await axios.get(`${API}/orders`, {
+        ...authHeader,
+        params: { cursor: ordersCursor }
+      });
+      setOrders(prev => [...prev, ...response.data]);
+      setOrdersCursor(response.headers["x-next-cursor"] || null);
+    } catch (error) {
+      toast.error("Ошибка загрузки заказов");
+    }
+  };
+
+  // Полная выгрузка заказов (по строке на позицию) для бухгалтерии
+  const exportOrders = async () => {
+    try {
+      const response = await axios.get(`${API}/orders/export`, {
+        ...authHeader,
+        params: { format: "csv" },
+        responseType: "blob"
+      });
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement("a");
+      link.href = url;
+      link.download = `orders-${new Date().toISOString().slice(0, 10)}.csv`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      toast.error("Ошибка выгрузки заказов");
+    }
+  };
+
   // Selective data deletion functions
   const clearOrders = async () => {
     try {
@@ -610,7 +684,9 @@ const AdminPage = () => {
               </div>
               <div className="flex-1">
                 <h3 className="font-semibold text-gray-800">Данные</h3>
-                <p className="text-sm text-gray-500">{orders.length} заказов от клиентов</p>
+                <p className="text-sm text-gray-500">
+                  {stats ? stats.totals.orders : `${orders.length}${ordersCursor ? "+" : ""}`} заказов от клиентов
+                </p>
               </div>
               <FaChevronRight className="w-5 h-5 text-gray-300" />
             </button>
@@ -646,6 +722,46 @@ const AdminPage = () => {
             </button>
           </div>
 
+          {/* Stats Card */}
+          {stats && stats.totals.orders > 0 && (
+            <div className="bg-white rounded-2xl p-6 shadow-sm mb-8" data-testid="stats-card">
+              <h3 className="font-bold text-gray-800 mb-4 text-lg" style={{ fontFamily: 'Nunito, sans-serif' }}>
+                📊 Статистика
+              </h3>
+              <div className="grid grid-cols-2 md:grid-cols-4 gap-4 text-sm">
+                <div>
+                  <p className="text-gray-500">Выручка</p>
+                  <p className="font-semibold text-gray-800">{stats.totals.revenue} ₸</p>
+                </div>
+                <div>
+                  <p className="text-gray-500">Заказов</p>
+                  <p className="font-semibold text-gray-800">{stats.totals.orders}</p>
+                </div>
+                <div>
+                  <p className="text-gray-500">Средний чек</p>
+                  <p className="font-semibold text-gray-800">{stats.totals.average_basket} ₸</p>
+                </div>
+                <div>
+                  <p className="text-gray-500">За {stats.series[0]?.period || "месяц"}</p>
+                  <p className="font-semibold text-gray-800">{stats.series[0]?.revenue || 0} ₸</p>
+                </div>
+              </div>
+              {stats.top_products.length > 0 && (
+                <div className="mt-4">
+                  <p className="text-gray-500 text-sm mb-2">Популярные товары</p>
+                  <ul className="space-y-1 text-sm text-gray-700">
+                    {stats.top_products.map((item) => (
+                      <li key={`${item.name}-${item.weight}`} className="flex justify-between">
+                        <span>{item.name}{item.weight && ` (${item.weight})`}</span>
+                        <span className="text-gray-500">{item.count} шт.</span>
+                      </li>
+                    ))}
+                  </ul>
+                </div>
+              )}
+            </div>
+          )}
+
           {/* Instructions Card */}
           <div className="bg-white rounded-2xl p-6 shadow-sm">
             <h3 className="font-bold text-gray-800 mb-4 text-lg" style={{ fontFamily: 'Nunito, sans-serif' }}>
@@ -744,10 +860,17 @@ const AdminPage = () => {
                 Перейти к Категориям →
               </button>
             </div>
-            <Button onClick={() => openProductModal()} className="bg-primary hover:bg-primary/90" data-testid="add-product-btn">
-              <FaPlus className="w-4 h-4 mr-2" />
-              Добавить
-            </Button>
+            <div className="flex items-center gap-2">
+              <label className="inline-flex items-center px-4 py-2 rounded-md border border-gray-200 text-sm font-medium text-gray-700 cursor-pointer hover:bg-gray-50" data-testid="import-products-btn">
+                <FaUpload className="w-4 h-4 mr-2" />
+                Импорт
+                <input type="file" accept=".csv,.ndjson,.jsonl" className="hidden" onChange={importProducts} />
+              </label>
+              <Button onClick={() => openProductModal()} className="bg-primary hover:bg-primary/90" data-testid="add-product-btn">
+                <FaPlus className="w-4 h-4 mr-2" />
+                Добавить
+              </Button>
+            </div>
           </div>
 
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
@@ -755,7 +878,7 @@ const AdminPage = () => {
               <div key={product.id} className="bg-white rounded-2xl p-4 shadow-sm">
                 <div className="flex gap-4 mb-3">
                   <img 
-                    src={product.image} 
+                    src={imageSrc(product.image, 160)} 
                     alt={product.name} 
                     className="w-16 h-16 object-cover rounded-xl"
                   />
@@ -847,7 +970,7 @@ const AdminPage = () => {
                   </label>
                 </div>
                 {productForm.image && (
-                  <img src={productForm.image} alt="Preview" className="mt-2 w-24 h-24 object-cover rounded-xl" />
+                  <img src={imageSrc(productForm.image, 320)} alt="Preview" className="mt-2 w-24 h-24 object-cover rounded-xl" />
                 )}
               </div>
               <div>
@@ -1124,15 +1247,25 @@ const AdminPage = () => {
           {/* Orders Section */}
           <div>
             <div className="flex items-center justify-between mb-4">
-              <h2 className="font-semibold text-gray-800">Заказы клиентов ({orders.length})</h2>
+              <h2 className="font-semibold text-gray-800">Заказы клиентов ({orders.length}{ordersCursor && "+"})</h2>
               {orders.length > 0 && (
-                <button 
-                  onClick={openClearOrdersModal}
-                  className="text-red-500 hover:text-red-600 text-sm font-medium flex items-center gap-1"
-                >
-                  <FaTrash className="w-3 h-3" />
-                  Очистить заказы
-                </button>
+                <div className="flex items-center gap-4">
+                  <button
+                    onClick={exportOrders}
+                    className="text-gray-600 hover:text-gray-800 text-sm font-medium flex items-center gap-1"
+                    data-testid="export-orders"
+                  >
+                    <FaDownload className="w-3 h-3" />
+                    Выгрузить CSV
+                  </button>
+                  <button 
+                    onClick={openClearOrdersModal}
+                    className="text-red-500 hover:text-red-600 text-sm font-medium flex items-center gap-1"
+                  >
+                    <FaTrash className="w-3 h-3" />
+                    Очистить заказы
+                  </button>
+                </div>
               )}
             </div>
             
@@ -1188,9 +1321,15 @@ const AdminPage = () => {
                           )}
                         </div>
                         {order.promocode ? (
-                          <span className="inline-flex items-center gap-1 px-2 py-1 bg-green-100 text-green-700 rounded-md text-xs font-medium">
+                          <span
+                            className={`inline-flex items-center gap-1 px-2 py-1 rounded-md text-xs font-medium ${
+                              order.promocode_status === "rejected" ? "bg-red-100 text-red-700" : "bg-green-100 text-green-700"
+                            }`}
+                            title={order.promocode_status === "rejected" ? "Промокод был исчерпан при оформлении" : undefined}
+                          >
                             <FaTag className="w-3 h-3" />
                             {order.promocode}
+                            {order.promocode_status === "rejected" && " (исчерпан)"}
                           </span>
                         ) : (
                           <span className="text-gray-300 text-xs">Без промокода</span>
@@ -1201,6 +1340,13 @@ const AdminPage = () => {
                 </div>
               )}
             </div>
+            {ordersCursor && (
+              <div className="mt-4 text-center">
+                <Button variant="outline" onClick={loadMoreOrders} data-testid="load-more-orders">
+                  Показать ещё
+                </Button>
+              </div>
+            )}
           </div>
         </main>
 
@@ -1230,7 +1376,7 @@ const AdminPage = () => {
               <div className="bg-red-50 rounded-lg p-3 mb-4">
                 <div className="flex items-center gap-2 text-red-600 text-sm font-medium mb-1">
                   <FaUsers className="w-4 h-4" />
-                  Будет удалено: {orders.length} заказов
+                  Будет удалено: {orders.length}{ordersCursor && "+"} заказов
                 </div>
               </div>
               <p className="text-xs text-red-600">
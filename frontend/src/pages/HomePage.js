@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
-import { useCart } from "@/App";
+import axios from "axios";
+import { useCart, API } from "@/App";
 import { 
   FaShoppingCart, FaHeart, FaLeaf, FaAward, FaTruck,
   FaCheck, FaCheckCircle, FaStar, FaShieldAlt, FaCertificate, 
@@ -8,16 +9,13 @@ import {
   FaCloud, FaSnowflake, FaHome, FaStore, FaWarehouse, 
   FaIndustry, FaHospital, FaClock, FaCalendarAlt, FaPhone, 
   FaEnvelope, FaMapMarkerAlt, FaDollarSign, FaCreditCard, FaGift, 
-  FaPercent, FaChartLine, FaBox, FaRecycle
+  FaPercent, FaChartLine, FaBox, FaRecycle, FaSearch
 } from "react-icons/fa";
 import { GiHoneycomb } from "react-icons/gi";
 import ProductCard from "@/components/custom/ProductCard";
 import ProductModal from "@/components/custom/ProductModal";
 import CartDrawer from "@/components/custom/CartDrawer";
 import CategoryFilter from "@/components/custom/CategoryFilter";
-import axios from "axios";
-
-const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
 // Icon mapping
 const iconComponents = {
@@ -36,29 +34,36 @@ const getIconComponent = (iconName) => {
 };
 
 const HomePage = () => {
-  const { categories, products, loading, cart } = useCart();
+  const { categories, products, about: aboutData, loading, cart } = useCart();
   const [selectedCategory, setSelectedCategory] = useState(null);
   const [selectedProduct, setSelectedProduct] = useState(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [isCartOpen, setIsCartOpen] = useState(false);
   const [showCartHint, setShowCartHint] = useState(false);
-  const [aboutData, setAboutData] = useState(null);
 
+  const [searchQuery, setSearchQuery] = useState("");
+  const [searchResults, setSearchResults] = useState(null);
+
+  // Поиск на сервере с задержкой, чтобы не слать запрос на каждую букву
   useEffect(() => {
-    const fetchAbout = async () => {
-      try {
-        const response = await axios.get(`${API}/about`);
-        setAboutData(response.data);
-      } catch (error) {
-        console.error("Error fetching about:", error);
-      }
+    if (!searchQuery.trim()) {
+      setSearchResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      axios.get(`${API}/products/search`, { params: { q: searchQuery, category: selectedCategory || undefined } })
+        .then(response => { if (!cancelled) setSearchResults(response.data.products); })
+        .catch(() => { if (!cancelled) setSearchResults(null); });
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
     };
-    fetchAbout();
-  }, []);
+  }, [searchQuery, selectedCategory]);
 
-  const filteredProducts = selectedCategory
-    ? products.filter(p => p.category_id === selectedCategory)
-    : products;
+  const filteredProducts = searchResults
+    ?? (selectedCategory ? products.filter(p => p.category_id === selectedCategory) : products);
 
   const openProductModal = (product) => {
     setSelectedProduct(product);
@@ -156,6 +161,17 @@ const HomePage = () => {
 
       {/* Categories */}
       <section className="px-3 md:px-8 pb-6 md:pb-8">
+        <div className="max-w-md mx-auto mb-4 md:mb-6 relative">
+          <FaSearch className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-muted-foreground" />
+          <input
+            type="search"
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+            placeholder="Поиск товаров..."
+            className="w-full pl-9 pr-3 py-2 text-sm md:text-base rounded-full border border-border/50 bg-white focus:outline-none focus:ring-2 focus:ring-primary/50"
+            data-testid="product-search"
+          />
+        </div>
         <CategoryFilter
           categories={categories}
           selectedCategory={selectedCategory}